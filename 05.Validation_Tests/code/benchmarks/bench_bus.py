@@ -0,0 +1,96 @@
+"""Host polling throughput against simulated scales at each supported baud rate.
+
+Starts ``--buses`` simulated RS485 buses with ``--scales`` virtual scales
+each (``snowscale.simulator``), polls them all concurrently with
+``snowscale.poller`` for ``--seconds`` per baud rate, and reports readings
+per second (all values present), the share of commands that failed, and
+the host CPU time per reading::
+
+    python benchmarks/bench_bus.py --buses 20 --scales 10 --commands GET_T
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from snowscale.poller import FIELDS, POLL_COMMANDS, BusPoller, poll_buses  # noqa: E402
+from snowscale.protocol import BAUD_RATES  # noqa: E402
+from snowscale.simulator import start_buses  # noqa: E402
+
+
+async def run(baud, n_buses, n_scales, commands, seconds, seed):
+    buses = await start_buses(n_buses, n_scales, baud, seed)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")   # frames too long for 1200 baud are part of what is measured
+        pollers = [await BusPoller.open(bus.port, range(1, n_scales + 1), baud, commands=commands)
+                   for bus in buses]
+    rows = 0
+    complete = 0
+    cpu = time.process_time()
+    start = time.perf_counter()
+
+    async def consume():
+        nonlocal rows, complete
+        async for row in poll_buses(pollers):
+            rows += 1
+            complete += all(row[f] == row[f] for f in pollers[0].fields)
+
+    try:
+        await asyncio.wait_for(consume(), seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        for poller in pollers:
+            poller.close()
+        for bus in buses:
+            bus.close()
+
+    requests = sum(p.stats.requests for p in pollers)
+    failures = sum(p.stats.failures for p in pollers)
+    retries = sum(p.stats.retries for p in pollers)
+    succeeded = sum(p.stats.replies - p.stats.bad_replies for p in pollers)
+    return {
+        "baud": baud,
+        "scales": n_buses * n_scales,
+        "rows_per_s": rows / wall,
+        "complete_rows_per_s": complete / wall,
+        "requests": requests,
+        "retries": retries,
+        "failed_pct": 100 * failures / max(failures + succeeded, 1),
+        "cpu_ms_per_row": 1000 * cpu / max(rows, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bauds", nargs="+", type=int, default=list(BAUD_RATES), choices=list(BAUD_RATES))
+    parser.add_argument("--buses", type=int, default=20)
+    parser.add_argument("--scales", type=int, default=10, help="scales per bus")
+    parser.add_argument("--commands", nargs="+", default=list(POLL_COMMANDS), choices=list(FIELDS))
+    parser.add_argument("--seconds", type=float, default=10.0, help="polling time per baud rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for baud in args.bauds:
+        result = asyncio.run(run(baud, args.buses, args.scales, args.commands, args.seconds, args.seed))
+        results.append(result)
+        print(f"{baud:6d} baud {result['scales']:5d} scales {result['complete_rows_per_s']:8.2f} rows/s "
+              f"{result['failed_pct']:6.1f}% failed {result['cpu_ms_per_row']:7.3f} ms CPU/row", flush=True)
+    if args.out is not None:
+        args.out.write_text(json.dumps(results, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,334 @@
+"""Benchmarks for the snowscale pipeline stages.
+
+Times every stage on the bundled datasets and on synthetic copies 10x and
+100x larger (the real records tiled end to end in time), recording the best
+wall time over ``--repeat`` runs and the peak traced memory of one run::
+
+    python benchmarks/bench_pipeline.py --save-baseline      # record a baseline
+    python benchmarks/bench_pipeline.py                      # compare against it
+
+A stage is reported as a regression when it is more than ``--tolerance``
+slower (or uses that much more memory) than the baseline; the script then
+exits with status 1. Baselines are machine specific and are not committed.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import gc
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from snowscale import (DATA_DIR, SITES, AgreementMonitor, ChannelCleaning, DriftAlert,  # noqa: E402
+                       DryDetection, DryPeriod, Source, ThermalModel, ThermalTerm, align_sources,
+                       bootstrap_metrics, clean, compute_metrics, convert_crd, fit_baselines, fit_thermal,
+                       fit_thermal_model, iot_index, iot_to_archive, lag_correlation, read_archive,
+                       read_ceazamet, read_iot, read_toa5, recompute, rolling_mean, smooth, source_calibration,
+                       window_metrics)
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+STAGES = {}
+
+
+def stage(name):
+    def register(fn):
+        STAGES[name] = fn
+        return fn
+    return register
+
+
+# --- Synthetic data ---------------------------------------------------------
+
+def tile(df, scale):
+    """``df`` repeated ``scale`` times, each copy shifted past the end of the previous one."""
+    if scale == 1:
+        return df.copy()
+    span = df["time"].max() - df["time"].min() + (df["time"].iloc[1] - df["time"].iloc[0])
+    copies = [df.assign(time=df["time"] + i * span) for i in range(scale)]
+    return pd.concat(copies, ignore_index=True)
+
+
+def write_ceazamet(df, columns, path):
+    out = df.rename(columns={v: k for k, v in columns.items()})
+    out["Fecha"] = out["Fecha"].dt.strftime("%d-%m-%Y %H:%M")
+    out.to_csv(path, sep=";", index=False)
+
+
+def write_iot(df, path):
+    out = pd.DataFrame({"k0": "id", "id": df["id"].astype(str),
+                        "k1": "dt", "dt": df["time"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")})
+    for i, key in enumerate(["vin", "at", "sh", "sw", "swt"], start=2):
+        out[f"k{i}"] = key
+        out[key] = df[key]
+    out["k7"] = "C"
+    out["C"] = df["C"].astype(str) + ";"
+    out.to_csv(path, header=False, index=False)
+
+
+def write_toa5(df, path):
+    with open(DATA_DIR / "BR_CRD.dat") as src:
+        header = [next(src) for _ in range(4)]
+    out = df.rename(columns={"time": "TIMESTAMP"})
+    out["TIMESTAMP"] = out["TIMESTAMP"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    with open(path, "w") as file:
+        file.writelines(header)
+        out.to_csv(file, header=False, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+class Dataset:
+    """Files and parsed frames for one scale factor."""
+
+    def __init__(self, scale, workdir):
+        self.scale = scale
+        tapado = SITES["tapado"]
+        self.tapado_columns = tapado.columns
+        base_tapado = read_ceazamet(DATA_DIR / tapado.path, tapado.columns, tapado.time_format)
+        base_iot = read_iot(DATA_DIR / "BR_IOT.csv")
+        base_crd = read_toa5(DATA_DIR / "BR_CRD.dat")
+
+        if scale == 1:
+            self.tapado_path = DATA_DIR / tapado.path
+            self.iot_path = DATA_DIR / "BR_IOT.csv"
+            self.crd_path = DATA_DIR / "BR_CRD.dat"
+        else:
+            self.tapado_path = Path(workdir) / f"tapado_x{scale}.csv"
+            self.iot_path = Path(workdir) / f"iot_x{scale}.csv"
+            self.crd_path = Path(workdir) / f"crd_x{scale}.dat"
+            write_ceazamet(tile(base_tapado, scale), tapado.columns, self.tapado_path)
+            write_iot(tile(base_iot, scale), self.iot_path)
+            write_toa5(tile(base_crd, scale), self.crd_path)
+
+        self.archive_path = Path(workdir) / f"iot_x{scale}.ssa"
+        self.archive_path.unlink(missing_ok=True)
+        iot_to_archive(self.iot_path, self.archive_path)
+        self.iot_blocks = iot_index(self.iot_path)
+
+        self.tapado = read_ceazamet(self.tapado_path, tapado.columns, tapado.time_format)
+        self.iot = read_iot(self.iot_path).sort_values("time", ignore_index=True)
+        self.crd = read_toa5(self.crd_path)
+        self.time_strings = pd.read_csv(self.tapado_path, sep=";", usecols=["Fecha"])["Fecha"]
+        weight = self.iot["sw"].to_numpy() / (0.28 * 0.28)
+        self.tested = smooth(weight, 72)
+        self.reference = self.tested + np.random.default_rng(0).normal(0, 5, len(weight))
+        # GET_RAW counts of the same weight, with a recalibration halfway through
+        counts = np.rint(self.iot["sw"].to_numpy() * 500 + 1e5)
+        self.raw = self.iot[["time", "id", "swt"]].assign(**{f"raw_{i}": counts for i in range(1, 5)})
+        halfway = self.iot["time"].iloc[len(self.iot) // 2]
+        self.calibrations = pd.DataFrame({"id": self.iot["id"].iloc[0], "valid_from": [self.iot["time"].min(), halfway],
+                                          **{f"prop_{i}": [5e-4, 5.1e-4] for i in range(1, 5)},
+                                          **{f"offset_{i}": -50.0 for i in range(1, 5)},
+                                          "temp_coef_1": [0.0, 0.01]})
+
+
+# --- Stages -------------------------------------------------------------------
+
+@stage("parse_ceazamet")
+def _(d):
+    read_ceazamet(d.tapado_path, d.tapado_columns, "%d-%m-%Y %H:%M")
+
+
+@stage("parse_iot")
+def _(d):
+    read_iot(d.iot_path)
+
+
+@stage("read_archive")
+def _(d):
+    read_archive(d.archive_path)
+
+
+# Broken River's validation period, out of the first copy of the record
+
+@stage("read_season_iot")
+def _(d):
+    read_iot(d.iot_path, start="2023-06-06", end="2023-12-31", index=d.iot_blocks)
+
+
+@stage("read_season_archive")
+def _(d):
+    read_archive(d.archive_path, "2023-06-06", "2023-12-31")
+
+
+@stage("parse_toa5")
+def _(d):
+    read_toa5(d.crd_path, columns=["Ground_Det", "Reference_Det"])
+
+
+@stage("crd_convert")
+def _(d):
+    convert_crd(d.crd.assign(site="br"), source_calibration(SITES["broken_river"].reference, "br"))
+
+
+@stage("datetime_mixed")
+def _(d):
+    pd.to_datetime(d.time_strings, format="mixed", dayfirst=True)
+
+
+@stage("thermal_fit")
+def _(d):
+    fit_thermal(d.tapado, DryPeriod(max_height=10.0, first_samples=None))
+
+
+@stage("dry_detection")
+def _(d):
+    fit_baselines(d.tapado, DryDetection(max_height=10.0))
+
+
+@stage("thermal_model")
+def _(d):
+    model = ThermalModel(terms=(ThermalTerm(), ThermalTerm("at"), ThermalTerm(diff=True), ThermalTerm(lag=1)),
+                         channels={"sw": "swt"})
+    fit_thermal_model(d.iot, model, DryPeriod(max_height=None, first_samples=None, first_days=30), group_column="id")
+
+
+@stage("lag_search")
+def _(d):
+    # Two weeks either side at 10-minute resolution
+    lag_correlation(d.tested, d.reference, range(-2016, 2017))
+
+
+@stage("rolling_smooth")
+def _(d):
+    smooth(d.iot["sw"].to_numpy(), 72)
+
+
+@stage("rolling_time")
+def _(d):
+    rolling_mean(d.iot["time"].to_numpy(), d.iot[["sw", "swt", "at", "sh"]].to_numpy(), "12h", groups=d.iot["id"])
+
+
+@stage("clean")
+def _(d):
+    clean(d.iot, {"sw": ChannelCleaning(valid_range=(0.0, 40.0), spike_window="6h"),
+                  "sh": ChannelCleaning(savgol_window=13, max_gap="1h")}, group_column="id")
+
+
+@stage("merge_asof")
+def _(d):
+    pd.merge_asof(d.iot[["time", "sw"]], d.crd[["time", "Ground_Det"]], on="time",
+                  direction="nearest", tolerance=pd.Timedelta("30min"))
+
+
+@stage("align_sources")
+def _(d):
+    align_sources(d.iot[["time", "sw"]], {"crd": d.crd}, [Source("crd", ("Ground_Det",), "30min")])
+
+
+@stage("metrics")
+def _(d):
+    compute_metrics(d.tested, d.reference)
+
+
+@stage("metrics_windows")
+def _(d):
+    # 7-day windows at 10-minute resolution, one per day
+    window_metrics(d.tested, d.reference, 1008, step=144)
+
+
+@stage("bootstrap")
+def _(d):
+    bootstrap_metrics(d.tested, d.reference, block=144, n_boot=10000, seed=0)
+
+
+@stage("monitor")
+def _(d):
+    # Every sample streamed through the 7- and 30-day windows, one pair per scale
+    monitor = AgreementMonitor(alerts=[DriftAlert("abs_bias", 10.0), DriftAlert("rmse", 20.0, "30D")])
+    monitor.update_frame(pd.DataFrame({"pair": d.iot["id"], "time": d.iot["time"], "tested": d.tested,
+                                       "reference": d.reference}))
+
+
+@stage("recompute")
+def _(d):
+    recompute(d.raw, d.calibrations, area_m2=0.28 * 0.28, temp_column="swt")
+
+
+@stage("plotting")
+def _(d):
+    from snowscale.plotting import PlotData, plot_timeseries
+    aligned = pd.DataFrame({"time": d.iot["time"], "tested": d.tested, "reference": d.reference,
+                            "snow_height": 200 - d.iot["sh"]})
+    data = PlotData(SITES["broken_river"], aligned, compute_metrics(d.tested, d.reference))
+    plot_timeseries(data, io.BytesIO(), dpi=100)
+
+
+# --- Runner -------------------------------------------------------------------
+
+def measure(fn, dataset, repeat):
+    walls = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(dataset)
+        walls.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn(dataset)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"wall_s": min(walls), "peak_mb": peak / 2 ** 20}
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every stage that regressed beyond ``tolerance``."""
+    regressions = []
+    for key, now in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric, floor in (("wall_s", 0.005), ("peak_mb", 1.0)):
+            # Ignore noise on stages too small to time or measure reliably
+            if now[metric] > max(before[metric], floor) * (1 + tolerance):
+                regressions.append(f"{key} {metric}: {before[metric]:.4g} -> {now[metric]:.4g}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--out", type=Path, default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            dataset = Dataset(scale, workdir)
+            for name in args.stages:
+                key = f"{name}@x{scale}"
+                results[key] = measure(STAGES[name], dataset, 1 if scale >= 100 else args.repeat)
+                print(f"{key:28s} {results[key]['wall_s'] * 1000:10.1f} ms {results[key]['peak_mb']:9.1f} MB",
+                      flush=True)
+            del dataset
+
+    if args.out is not None:
+        args.out.write_text(json.dumps(results, indent=1))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=1))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("No baseline to compare against (run with --save-baseline)")
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
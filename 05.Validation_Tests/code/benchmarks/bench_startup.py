@@ -0,0 +1,92 @@
+"""Start-up time of the command-line entry points, in fresh interpreters.
+
+Each command is started ``--repeat`` times and the best wall time kept; one
+more run under ``-X importtime`` lists the heavy packages it imported::
+
+    python benchmarks/bench_startup.py --save-baseline      # record a baseline
+    python benchmarks/bench_startup.py                      # compare against it
+
+The script exits with status 1 when a command is more than ``--tolerance``
+slower than the baseline, or when a metrics-only command imports any of
+``HEAVY`` (plotting or other packages the metrics never need). Baselines
+are machine specific and are not committed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CODE_DIR = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "startup_baseline.json"
+HEAVY = ("matplotlib", "scipy", "sklearn", "multiprocessing", "asyncio")
+
+COMMANDS = {
+    "import_numpy_pandas": ["-c", "import numpy, pandas"],   # the floor for everything below
+    "import_snowscale": ["-c", "import snowscale"],
+    "cli_help": ["-m", "snowscale", "--help"],
+    "cli_metrics": ["-m", "snowscale", "tapado"],
+    "cli_metrics_json": ["-m", "snowscale", "tapado", "guandacol", "--json"],
+}
+
+
+def _start(args, extra=()):
+    # Without the cache, so every run parses the files as a cron job would the first time
+    env = {k: v for k, v in os.environ.items() if k != "SNOWSCALE_CACHE"}
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, *extra, *args], cwd=CODE_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if done.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{done.stderr}")
+    return wall, done.stderr
+
+
+def heavy_imports(args):
+    """Top-level packages of ``HEAVY`` that ``args`` imports."""
+    _, stderr = _start(args, ["-X", "importtime"])
+    # Lines look like "import time:   self |  cumulative | <indent>package.module"
+    modules = {line.rsplit("|", 1)[1].strip() for line in stderr.splitlines() if line.startswith("import time:")}
+    return sorted({m.split(".")[0] for m in modules} & set(HEAVY))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", nargs="+", default=list(COMMANDS), choices=list(COMMANDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results, problems = {}, []
+    for name in args.commands:
+        command = COMMANDS[name]
+        wall = min(_start(command)[0] for _ in range(args.repeat))
+        heavy = heavy_imports(command)
+        results[name] = {"wall_s": wall, "heavy": heavy}
+        print(f"{name:22s} {wall * 1000:8.1f} ms   {', '.join(heavy) or '-'}", flush=True)
+        if heavy:
+            problems.append(f"{name} imports {', '.join(heavy)}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=1))
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        for name, now in results.items():
+            before = baseline.get(name)
+            if before is not None and now["wall_s"] > before["wall_s"] * (1 + args.tolerance):
+                problems.append(f"{name} wall_s: {before['wall_s']:.4g} -> {now['wall_s']:.4g}")
+    else:
+        print("No baseline to compare against (run with --save-baseline)")
+    for line in problems:
+        print(f"REGRESSION {line}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
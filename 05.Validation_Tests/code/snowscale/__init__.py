@@ -0,0 +1,58 @@
+"""Shared analysis code for the Snow Scale validation tests.
+
+Plotting (``snowscale.plotting``), the command line (``snowscale.cli``), the
+batch runner (``snowscale.runner``), the RS485 poller (``snowscale.poller``)
+and the firmware simulator (``snowscale.simulator``) are not imported here,
+so metrics-only runs never load matplotlib, multiprocessing or asyncio.
+"""
+from .align import AlignmentPlan, Source, align_sources
+from .archive import Archive, ArchiveWriter, archive_to_iot, iot_to_archive, read_archive, write_archive
+from .bootstrap import BootstrapResult, bootstrap_metrics, default_block
+from .cache import cached_frame, clear_cache
+from .catalog import StationIndex
+from .baseline import apply_baselines, find_dry_intervals, fit_baselines
+from .clean import CleaningReport, clean, clean_blocks
+from .config import (SITES, ChannelCleaning, CRDSource, DriftAlert, DryDetection, DryPeriod, SiteConfig,
+                     ThermalModel, ThermalTerm)
+from .correction import ThermalFit, apply_thermal, correct, dry_period, fit_thermal, smooth
+from .crd import (affected_spans, convert_crd, crd_calibrations, crd_swe, load_crd, read_crd_calibrations,
+                  read_crd_counts, reprocess_crd, source_calibration)
+from .io import DATA_DIR, load_site, read_ceazamet
+from .telemetry import ParseReport, iot_index, iter_iot, read_iot
+from .thermal import apply_thermal_model, fit_thermal_model
+from .toa5 import TOA5Header, read_toa5, read_toa5_header
+from .lag import best_lag, lag_correlation, shift
+from .metrics import Metrics, compute_metrics, format_metrics, grouped_metrics, window_metrics
+from .monitor import AgreementMonitor, Alert
+from .online import OnlineThermalCorrector
+from .pipeline import SiteResult, align, evaluate, load, run_site
+from .profiling import Profiler, StageRecord, chrome_trace
+from .recompute import calibration_table, raw_from_cells, read_calibrations, recompute
+from .resample import resample_mean, rolling_mean
+
+__all__ = [
+    "AlignmentPlan", "Source", "align_sources",
+    "Archive", "ArchiveWriter", "archive_to_iot", "iot_to_archive", "read_archive", "write_archive",
+    "BootstrapResult", "bootstrap_metrics", "default_block",
+    "cached_frame", "clear_cache",
+    "StationIndex",
+    "apply_baselines", "find_dry_intervals", "fit_baselines",
+    "CleaningReport", "clean", "clean_blocks",
+    "SITES", "ChannelCleaning", "CRDSource", "DriftAlert", "DryDetection", "DryPeriod", "SiteConfig",
+    "ThermalModel", "ThermalTerm",
+    "ThermalFit", "apply_thermal", "correct", "dry_period", "fit_thermal", "smooth",
+    "affected_spans", "convert_crd", "crd_calibrations", "crd_swe", "load_crd", "read_crd_calibrations",
+    "read_crd_counts", "reprocess_crd", "source_calibration",
+    "DATA_DIR", "load_site", "read_ceazamet",
+    "ParseReport", "iot_index", "iter_iot", "read_iot",
+    "apply_thermal_model", "fit_thermal_model",
+    "TOA5Header", "read_toa5", "read_toa5_header",
+    "best_lag", "lag_correlation", "shift",
+    "Metrics", "compute_metrics", "format_metrics", "grouped_metrics", "window_metrics",
+    "AgreementMonitor", "Alert",
+    "OnlineThermalCorrector",
+    "SiteResult", "align", "evaluate", "load", "run_site",
+    "Profiler", "StageRecord", "chrome_trace",
+    "calibration_table", "raw_from_cells", "read_calibrations", "recompute",
+    "resample_mean", "rolling_mean",
+]
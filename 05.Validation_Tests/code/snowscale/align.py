@@ -0,0 +1,161 @@
+"""Join several sensors onto one time grid.
+
+A generalised ``pd.merge_asof``: every ``Source`` (CRD, snow pillow,
+ultrasonic depth, a second scale...) has its own tolerance, direction and
+time lag, and all of them are matched onto the grid of a base frame in one
+call. Matching is one ``searchsorted`` of the shorter of grid and source
+into the other, over int64 times, so inputs that are already sorted, as the
+loaders return them, are not sorted again and no merged intermediate frames
+are built.
+
+The matches are kept in an ``AlignmentPlan``. When the base frame and the
+sources only grow at the end, ``align_sources(..., plan=plan)`` recomputes
+the grid rows from the last previously known source time onwards and
+reuses the rest.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+DIRECTIONS = ("backward", "forward", "nearest")
+
+
+@dataclass(frozen=True)
+class Source:
+    """A sensor to bring onto the grid.
+
+    ``columns`` maps source columns to output names (a sequence keeps the
+    names). ``lag`` is added to the source's timestamps before matching, so
+    a sensor whose clock runs 10 minutes late takes ``lag="10min"``.
+    ``tolerance`` and ``direction`` are as in ``pd.merge_asof``.
+    """
+    name: str
+    columns: Union[Mapping[str, str], Tuple[str, ...]]
+    tolerance: Optional[str] = "30min"
+    lag: str = "0min"
+    direction: str = "nearest"
+
+    def renames(self):
+        return dict(self.columns) if isinstance(self.columns, Mapping) else {c: c for c in self.columns}
+
+
+@dataclass
+class AlignmentPlan:
+    """Row of each source matched to every grid row (-1: none), and what it was built from."""
+    index: Dict[str, np.ndarray] = field(default_factory=dict)
+    n_grid: int = 0
+    last_grid: Optional[int] = None
+    n_source: Dict[str, int] = field(default_factory=dict)
+    last_source: Dict[str, Optional[int]] = field(default_factory=dict)
+
+
+def _sorted(frame, unit=None):
+    """``frame`` sorted by time (unchanged when it already is) and its times as int64 ``unit``s."""
+    times = frame["time"]
+    if not times.is_monotonic_increasing:
+        frame = frame.sort_values("time", kind="stable", ignore_index=True)
+        times = frame["time"]
+    times = times.to_numpy()
+    unit = unit or np.datetime_data(times.dtype)[0]
+    return frame, np.asarray(times, dtype=f"datetime64[{unit}]").view(np.int64), unit
+
+
+def _duration(text, unit):
+    return pd.Timedelta(text).to_timedelta64().astype(f"timedelta64[{unit}]").view(np.int64)
+
+
+def match(grid, times, tolerance=None, direction="nearest"):
+    """Index into sorted ``times`` matched to each of the sorted ``grid`` times; -1 where none.
+
+    Both are int64 in the same unit, as is ``tolerance``. Ties and duplicates resolve as in ``pd.merge_asof``:
+    backward takes the last time ``<=`` the grid time, forward the first
+    ``>=``, and nearest prefers backward when both are as close.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}, got {direction!r}")
+    n = len(times)
+    if n == 0:
+        return np.full(len(grid), -1, dtype=np.int64)
+    if n < len(grid):
+        # Search the shorter array: count the times <= each grid time
+        counts = np.bincount(np.searchsorted(grid, times, side="left"), minlength=len(grid) + 1)
+        after = np.cumsum(counts[:len(grid)])
+    else:
+        after = np.searchsorted(times, grid, side="right")
+    # Sentinels far outside any real time stand in for "no time before/after"
+    far = np.int64(1) << 62
+    padded = np.concatenate([[-far], times, [far]])
+    back_gap = grid - padded[after]          # padded[after] is times[after - 1]
+    if direction == "backward":
+        idx, gap = after - 1, back_gap
+    else:
+        fwd_gap = padded[after + 1] - grid
+        if direction == "forward":
+            idx, gap = after, fwd_gap
+            # A time equal to the grid time is the forward match: the first of equal times
+            exact = back_gap == 0
+            if exact.any():
+                idx[exact] = np.searchsorted(times, grid[exact], side="left")
+                gap[exact] = 0
+        else:
+            use_back = back_gap <= fwd_gap
+            idx = after - use_back
+            gap = np.minimum(back_gap, fwd_gap)
+    found = gap < far // 2 if tolerance is None else gap <= tolerance
+    return np.where(found, idx, -1)
+
+
+def _first_changed(plan, name, grid, times):
+    """First grid row whose match to source ``name`` can differ from ``plan``; 0 if unknown."""
+    n_old = plan.n_source.get(name)
+    if n_old is None or plan.last_grid is None or plan.n_grid > len(grid) or n_old > len(times):
+        return 0
+    if grid[plan.n_grid - 1] != plan.last_grid:
+        return 0
+    if n_old == 0:
+        return 0 if len(times) else plan.n_grid
+    if times[n_old - 1] != plan.last_source[name]:
+        return 0
+    if n_old == len(times):
+        return plan.n_grid
+    # Appended rows are later than every old one, so they can only be a better
+    # match for grid rows at or after the old last time
+    return min(int(np.searchsorted(grid, times[n_old - 1], side="left")), plan.n_grid)
+
+
+def _take(values, idx):
+    return pd.api.extensions.take(values, idx, allow_fill=True)
+
+
+def align_sources(base, frames: Mapping[str, pd.DataFrame], sources: Sequence[Source],
+                  plan: Optional[AlignmentPlan] = None):
+    """``base`` (sorted by time) with the columns of every source matched onto its rows.
+
+    ``frames`` holds a frame with a ``time`` column for each source name. A
+    ``plan`` from an earlier call on shorter versions of the same data is
+    updated in place for the appended rows. Returns the frame and the plan.
+    """
+    base, grid, unit = _sorted(base)
+    plan = AlignmentPlan() if plan is None else plan
+    out = base.copy(deep=False)
+    for source in sources:
+        frame, times, _ = _sorted(frames[source.name], unit)
+        times = times + _duration(source.lag, unit)
+        tolerance = None if source.tolerance is None else _duration(source.tolerance, unit)
+        first = _first_changed(plan, source.name, grid, times)
+        idx = np.empty(len(grid), dtype=np.int64)
+        idx[:first] = plan.index[source.name][:first] if first else idx[:0]
+        idx[first:] = match(grid[first:], times, tolerance, source.direction)
+        plan.index[source.name] = idx
+        plan.n_source[source.name] = len(times)
+        plan.last_source[source.name] = int(times[-1]) if len(times) else None
+        for column, name in source.renames().items():
+            out[name] = _take(frame[column].to_numpy(), idx)
+    plan.n_grid = len(grid)
+    plan.last_grid = int(grid[-1]) if len(grid) else None
+    return out, plan
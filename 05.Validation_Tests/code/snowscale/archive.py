@@ -0,0 +1,385 @@
+"""Compact append-only binary archive for Snow Scale telemetry.
+
+The key/value text (``snowscale.telemetry``) spends most of its bytes on
+repeated keys and ISO timestamps. An archive stores the same records as
+fixed-point integers, in chunks of up to ``CHUNK_ROWS`` rows of one scale::
+
+    file   = b"SNOWARC1" | u32 header length | JSON header | chunk*
+    chunk  = chunk header | column*            (time first, then each field)
+    column = u8 width | u8 order | u8 flags | i64 first | i64 second
+             | NaN bitmap (if flags & 1) | packed integers
+
+Each field is stored to a fixed number of decimals (``DECIMALS``, matching
+what the firmware prints), so conversion from the text files is lossless.
+Per chunk and column the integers are kept as offsets from their minimum,
+first differences or second differences (``order`` 0, 1 or 2), whichever
+packs into the narrowest unsigned width; regular timestamps and slowly
+changing temperatures end up one or two bytes a sample. NaNs are carried in
+a bitmap and do not break the deltas.
+
+Chunk headers hold the scale id, row count and first and last time, so
+``Archive`` builds its time index by hopping over the memory-mapped file
+and ``Archive.read`` decodes only the chunks and columns a query needs.
+Writing only ever appends; a chunk cut short by a crash is ignored.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .telemetry import CHUNK_BYTES, IOT_KEYS, ParseReport, iter_iot
+
+
+MAGIC = b"SNOWARC1"
+VERSION = 1
+CHUNK_ROWS = 4096
+ID_BYTES = 16
+
+# Decimals of known fields; anything else gets DEFAULT_DECIMALS
+DECIMALS = {
+    "vin": 2, "at": 2, "sh": 0, "sw": 2, "swt": 2, "C": 0,
+    **{f"raw_{i}": 0 for i in range(1, 5)},
+    **{f"cell_{i}": 2 for i in range(1, 5)},
+    "weight": 2, "sensor_temp": 2,
+}
+DEFAULT_DECIMALS = 3
+INT_FIELDS = ("C",)             # read back as nullable integers
+
+_HEADER = struct.Struct("<8sI")
+_CHUNK = struct.Struct(f"<4sIIqq{ID_BYTES}s")    # magic, rows, payload bytes, first and last time, id
+_CHUNK_MAGIC = b"SSCK"
+_COLUMN = struct.Struct("<BBBqq")
+_WIDTHS = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+_HAS_NAN = 1
+
+
+# --- Column codec -------------------------------------------------------------
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def _width(encoded):
+    top = int(encoded.max()) if len(encoded) else 0
+    return next(w for w in (1, 2, 4, 8) if top < 1 << (8 * w))
+
+
+def _encode(q, nan=None):
+    """Bytes of one column of int64 ``q``; ``nan`` marks missing values (already filled)."""
+    n = len(q)
+    candidates = [(0, int(q.min()) if n else 0, 0, (q - (q.min() if n else 0)).view(np.uint64))]
+    if n > 1:
+        d1 = np.diff(q)
+        candidates.append((1, int(q[0]), 0, _zigzag(d1)))
+        if n > 2:
+            candidates.append((2, int(q[0]), int(d1[0]), _zigzag(np.diff(d1))))
+    # Narrowest width wins; on a tie the lower order, which is cheaper to decode
+    order, first, second, encoded = min(candidates, key=lambda c: (_width(c[3]), c[0]))
+    width = _width(encoded)
+    flags = _HAS_NAN if nan is not None else 0
+    parts = [_COLUMN.pack(width, order, flags, first, second)]
+    if nan is not None:
+        parts.append(np.packbits(nan).tobytes())
+    parts.append(encoded.astype(_WIDTHS[width]).tobytes())
+    return b"".join(parts)
+
+
+def _column_size(buffer, offset, n):
+    width, order, flags, _, _ = _COLUMN.unpack_from(buffer, offset)
+    mask = (n + 7) // 8 if flags & _HAS_NAN else 0
+    return _COLUMN.size + mask + width * max(n - order, 0)
+
+
+def _decode(buffer, offset, n):
+    """int64 values and NaN mask (or None) of the column at ``offset``."""
+    width, order, flags, first, second = _COLUMN.unpack_from(buffer, offset)
+    offset += _COLUMN.size
+    nan = None
+    if flags & _HAS_NAN:
+        nbytes = (n + 7) // 8
+        nan = np.unpackbits(np.frombuffer(buffer, np.uint8, nbytes, offset), count=n).astype(bool)
+        offset += nbytes
+    packed = np.frombuffer(buffer, _WIDTHS[width], max(n - order, 0), offset)
+    if order == 0:
+        q = packed.astype(np.int64) + first
+    else:
+        deltas = _unzigzag(packed)
+        if order == 2:
+            deltas = np.cumsum(np.concatenate([[second], deltas]))
+        q = np.cumsum(np.concatenate([[first], deltas]))
+    return q, nan
+
+
+def _quantize(values, decimals):
+    """int64 fixed-point values and the NaN mask (None without NaNs)."""
+    values = np.asarray(values, dtype=np.float64)
+    nan = ~np.isfinite(values)
+    q = np.rint(values * 10.0 ** decimals)
+    if not nan.any():
+        return q.astype(np.int64), None
+    # Carry the last value through gaps so they do not widen the deltas
+    idx = np.where(nan, 0, np.arange(len(q)))
+    np.maximum.accumulate(idx, out=idx)
+    filled = q[idx]
+    filled[~np.isfinite(filled)] = 0               # leading gap
+    return filled.astype(np.int64), nan
+
+
+# --- Writing -------------------------------------------------------------------
+
+def _field_specs(columns):
+    return [(name, DECIMALS.get(name, DEFAULT_DECIMALS)) for name in columns if name not in ("time", "id")]
+
+
+def _read_header(buffer):
+    magic, length = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a snowscale archive")
+    header = json.loads(bytes(buffer[_HEADER.size:_HEADER.size + length]))
+    if header["version"] != VERSION:
+        raise ValueError(f"Unsupported archive version {header['version']}")
+    return header, _HEADER.size + length
+
+
+class ArchiveWriter:
+    """Append frames of telemetry to an archive, ``chunk_rows`` rows of one scale per chunk.
+
+    A new archive takes its fields from ``fields`` (name -> decimals) or from
+    the columns of the first frame; an existing one keeps its own and
+    rejects frames with columns it does not have. Rows are buffered per scale
+    and sorted by time within each chunk; ``flush`` (or leaving the ``with``
+    block) writes what is buffered.
+    """
+
+    def __init__(self, path, fields: Optional[Mapping[str, int]] = None, chunk_rows=CHUNK_ROWS):
+        self.path = Path(path)
+        self.chunk_rows = int(chunk_rows)
+        self.fields = None
+        self._pending = {}
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as file:
+                head = file.read(_HEADER.size)
+                header, _ = _read_header(head + file.read(_HEADER.unpack(head)[1]))
+            self.fields = [tuple(f) for f in header["fields"]]
+        elif fields is not None:
+            self.fields = list(fields.items())
+
+    def _create(self, frame):
+        self.fields = self.fields or _field_specs(frame.columns)
+        header = json.dumps({"version": VERSION, "fields": self.fields}).encode()
+        with open(self.path, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, len(header)) + header)
+
+    def append(self, frame, scale_id=None):
+        """Buffer the rows of ``frame`` (``time``, ``id`` unless ``scale_id`` is given, and fields)."""
+        if not self.path.exists() or not self.path.stat().st_size:
+            self._create(frame)
+        names = [name for name, _ in self.fields]
+        unknown = [c for c in frame.columns if c not in ("time", "id") and c not in names]
+        if unknown:
+            raise ValueError(f"Archive {self.path.name} has no fields {unknown}")
+        if frame["time"].isna().any():
+            raise ValueError("Rows without a time cannot be archived")
+        ids = frame["id"] if scale_id is None else pd.Series(scale_id, index=frame.index)
+        for key, rows in frame.groupby(ids.astype(str).to_numpy(), sort=False):
+            if len(key.encode()) > ID_BYTES:
+                raise ValueError(f"Scale id {key!r} is longer than {ID_BYTES} bytes")
+            pending = self._pending.setdefault(key, [])
+            pending.append(rows)
+            if sum(len(r) for r in pending) >= self.chunk_rows:
+                self._write(key, full_only=True)
+
+    def _write(self, key, full_only=False):
+        rows = pd.concat(self._pending.pop(key), ignore_index=True).sort_values("time", kind="stable")
+        keep = len(rows) % self.chunk_rows if full_only else 0
+        if keep:
+            self._pending[key] = [rows.iloc[len(rows) - keep:]]
+            rows = rows.iloc[:len(rows) - keep]
+        times = rows["time"].to_numpy(dtype="datetime64[ms]").view(np.int64)
+        with open(self.path, "ab") as file:
+            for start in range(0, len(rows), self.chunk_rows):
+                part = slice(start, start + self.chunk_rows)
+                file.write(self._chunk(key, times[part], rows.iloc[part]))
+
+    def _chunk(self, key, times, rows):
+        columns = [_encode(times)]
+        for name, decimals in self.fields:
+            values = rows[name].to_numpy(dtype=np.float64, na_value=np.nan) if name in rows else \
+                np.full(len(rows), np.nan)
+            columns.append(_encode(*_quantize(values, decimals)))
+        payload = b"".join(columns)
+        head = _CHUNK.pack(_CHUNK_MAGIC, len(times), len(payload), times.min(), times.max(), key.encode())
+        return head + payload
+
+    def flush(self):
+        for key in list(self._pending):
+            self._write(key)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_archive(frame, path, fields: Optional[Mapping[str, int]] = None, chunk_rows=CHUNK_ROWS):
+    """Append ``frame`` to the archive at ``path``, creating it if needed."""
+    with ArchiveWriter(path, fields, chunk_rows) as writer:
+        writer.append(frame)
+
+
+# --- Reading -------------------------------------------------------------------
+
+class Archive:
+    """A memory-mapped archive and its chunk index.
+
+    ``index`` has one row per chunk: ``offset``, ``rows``, ``start``,
+    ``end`` and ``id``. Call ``refresh`` to see chunks appended since opening.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = None
+        self.refresh()
+
+    def refresh(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header, offset = _read_header(self._map)
+        self.fields = [tuple(f) for f in header["fields"]]
+        entries = []
+        size = len(self._map)
+        while offset + _CHUNK.size <= size:
+            magic, n, nbytes, start, end, key = _CHUNK.unpack_from(self._map, offset)
+            if magic != _CHUNK_MAGIC or offset + _CHUNK.size + nbytes > size:
+                break                       # partial chunk at the end of the file
+            entries.append((offset + _CHUNK.size, n, start, end, key.rstrip(b"\0").decode()))
+            offset += _CHUNK.size + nbytes
+        index = pd.DataFrame(entries, columns=["offset", "rows", "start", "end", "id"])
+        for column in ("start", "end"):
+            index[column] = index[column].to_numpy(dtype=np.int64).view("datetime64[ms]").astype("datetime64[us]")
+        self.index = index
+
+    def __len__(self):
+        return int(self.index["rows"].sum())
+
+    def chunks(self, start=None, end=None, ids: Optional[Iterable[str]] = None):
+        """Rows of ``index`` for the chunks holding data in ``[start, end]`` of the ``ids``."""
+        keep = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            keep &= (self.index["end"] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            keep &= (self.index["start"] <= pd.Timestamp(end)).to_numpy()
+        if ids is not None:
+            keep &= self.index["id"].isin([str(i) for i in ids]).to_numpy()
+        return self.index[keep]
+
+    def read(self, start=None, end=None, ids: Optional[Iterable[str]] = None,
+             columns: Optional[Sequence[str]] = None):
+        """Rows with ``start <= time <= end`` of the ``ids`` (all by default), decoding only ``columns``."""
+        names = [name for name, _ in self.fields]
+        wanted = names if columns is None else [c for c in columns if c not in ("time", "id")]
+        missing = [c for c in wanted if c not in names]
+        if missing:
+            raise KeyError(f"Archive {self.path.name} has no fields {missing}")
+        decimals = dict(self.fields)
+        position = {name: i + 1 for i, name in enumerate(names)}      # column 0 is the time
+
+        parts = {name: [] for name in ["time", *wanted]}
+        chunk_ids = []
+        lo = None if start is None else pd.Timestamp(start).to_datetime64().astype("datetime64[ms]").view(np.int64)
+        hi = None if end is None else pd.Timestamp(end).to_datetime64().astype("datetime64[ms]").view(np.int64)
+        for offset, n, key in self.chunks(start, end, ids)[["offset", "rows", "id"]].itertuples(index=False):
+            offsets = [offset]
+            for _ in range(len(names)):
+                offsets.append(offsets[-1] + _column_size(self._map, offsets[-1], n))
+            times, _ = _decode(self._map, offsets[0], n)
+            rows = slice(None)
+            if lo is not None or hi is not None:
+                # Times are sorted within a chunk
+                rows = slice(np.searchsorted(times, lo) if lo is not None else 0,
+                             np.searchsorted(times, hi, side="right") if hi is not None else n)
+            parts["time"].append(times[rows])
+            for name in wanted:
+                q, nan = _decode(self._map, offsets[position[name]], n)
+                values = q[rows] / 10.0 ** decimals[name]
+                if nan is not None:
+                    values[nan[rows]] = np.nan
+                parts[name].append(values)
+            chunk_ids.append((key, len(parts["time"][-1])))
+
+        def joined(name):
+            return np.concatenate(parts[name]) if parts[name] else np.array([], dtype=np.float64)
+
+        time = joined("time").astype(np.int64).view("datetime64[ms]").astype("datetime64[us]")
+        keys, lengths = zip(*chunk_ids) if chunk_ids else ((), ())
+        categories, codes = np.unique(np.array(keys, dtype=str), return_inverse=True)
+        out = {"id": pd.Categorical.from_codes(np.repeat(codes, lengths).astype(np.int32), categories),
+               "time": time}
+        for name in wanted:
+            out[name] = pd.array(joined(name), dtype="Int64") if name in INT_FIELDS else joined(name)
+        return pd.DataFrame(out)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_archive(path, start=None, end=None, ids: Optional[Iterable[str]] = None,
+                 columns: Optional[Sequence[str]] = None):
+    """Read a time range of an archive; see ``Archive.read``."""
+    with Archive(path) as archive:
+        return archive.read(start, end, ids, columns)
+
+
+# --- Converters ----------------------------------------------------------------
+
+def iot_to_archive(source, path, keys: Sequence[str] = IOT_KEYS, chunk_bytes=CHUNK_BYTES,
+                   chunk_rows=CHUNK_ROWS, report: Optional[ParseReport] = None):
+    """Append a key/value telemetry file to an archive, ``chunk_bytes`` of text at a time."""
+    fields = {key: DECIMALS.get(key, DEFAULT_DECIMALS) for key in keys if key not in ("id", "dt")}
+    with ArchiveWriter(path, fields, chunk_rows) as writer:
+        for frame in iter_iot(source, chunk_bytes, keys, report):
+            writer.append(frame)
+
+
+def _text(values, decimals):
+    return ["nan" if v != v else f"{v:.{decimals}f}" for v in values]
+
+
+def archive_to_iot(path, out, start=None, end=None, ids: Optional[Iterable[str]] = None):
+    """Write (part of) an archive as key/value telemetry lines, like BR_IOT.csv."""
+    with Archive(path) as archive:
+        df = archive.read(start, end, ids)
+        decimals = dict(archive.fields)
+    lines = pd.DataFrame({"k0": "id", "id": df["id"].astype(str),
+                          "k1": "dt", "dt": df["time"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")})
+    for i, (name, places) in enumerate(decimals.items(), start=2):
+        lines[f"k{i}"] = name
+        values = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        lines[name] = _text(values, places)
+    last = lines.columns[-1]
+    lines[last] = lines[last] + ";"
+    lines.to_csv(out, header=False, index=False)
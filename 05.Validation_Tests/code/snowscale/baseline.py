@@ -0,0 +1,206 @@
+"""Automatic dry-period (zero-load baseline) detection and per-interval thermal fits.
+
+``DryPeriod`` picks one hand-tuned baseline per site. ``DryDetection``
+instead scans the whole record, in one pass, for every snow-free interval
+(see ``find_dry_intervals``), fits the thermal model on each of them
+(``fit_baselines``) and corrects every sample with the fit of the latest
+interval that started before it (``apply_baselines``), so a multi-year
+record is re-baselined every summer.
+
+All three take a frame with ``time``, ``weight``, ``sensor_temp`` and
+``snow_height`` and, with ``group_column``, handle many stations stacked in
+one frame at once. The work is a few vectorised passes over the rows for
+each candidate lag; no Python loop runs per interval or per station.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import DryDetection
+from .lag import shift
+from .resample import rolling_mean
+
+
+FIT_COLUMNS = ("lag", "slope", "intercept", "r", "n_fit")
+
+
+def _prepare(df, group_column):
+    """Row order by (group, time), group codes and labels, and int64 ns times in that order."""
+    times = np.asarray(df["time"].to_numpy(), dtype="datetime64[ns]").view(np.int64)
+    if group_column is None:
+        codes, labels = np.zeros(len(df), dtype=np.int64), None
+    else:
+        codes, labels = pd.factorize(df[group_column], sort=True)
+        codes = codes.astype(np.int64)
+    order = np.lexsort((times, codes))
+    if np.array_equal(order, np.arange(len(order))):
+        order = None
+    else:
+        codes, times = codes[order], times[order]
+    return order, codes, labels, times
+
+
+def _column(df, name, order):
+    values = df[name].to_numpy(dtype=np.float64)
+    return values if order is None else values[order]
+
+
+def _duration(text):
+    return pd.Timedelta(text).to_timedelta64().astype("timedelta64[ns]").view(np.int64)
+
+
+def _intervals(df, rule: DryDetection, order, codes, times):
+    """First and last sorted row of each qualifying interval, and the qualifying rows."""
+    height = _column(df, "snow_height", order)
+    if rule.height_window is not None:
+        height = rolling_mean(times, height, rule.height_window, groups=codes)
+    weight = _column(df, "weight", order)
+    with np.errstate(invalid="ignore"):
+        mask = (height <= rule.max_height) & ~np.isnan(weight) & ~np.isnan(_column(df, "sensor_temp", order))
+        if rule.max_weight is not None:
+            mask &= np.abs(weight) <= rule.max_weight
+    rows = np.flatnonzero(mask)
+    if not len(rows):
+        return rows, rows, mask
+    # A qualifying row continues the interval of the previous qualifying row
+    # of its group when at most max_gap separates them, so a missing record
+    # or a brief snowy reading does not split it
+    joined = np.zeros(len(rows), dtype=bool)
+    joined[1:] = ((codes[rows[1:]] == codes[rows[:-1]])
+                  & (times[rows[1:]] - times[rows[:-1]] <= _duration(rule.max_gap)))
+    starts = np.flatnonzero(~joined)
+    first = rows[starts]
+    last = rows[np.append(starts[1:] - 1, len(rows) - 1)]
+    count = np.diff(np.append(starts, len(rows)))
+    keep = (times[last] - times[first] >= _duration(rule.min_duration)) & (count >= rule.min_samples)
+    # Leave the excluded rows out of the intervals that are kept
+    kept = np.repeat(keep, count)
+    mask[rows[~kept]] = False
+    return first[keep], last[keep], mask
+
+
+def _table(first, last, mask, codes, labels, times, group_column):
+    counts = np.append(0, np.cumsum(mask))
+    table = pd.DataFrame({
+        "start": times[first].astype("datetime64[ns]"),
+        "end": times[last].astype("datetime64[ns]"),
+        "n": counts[last + 1] - counts[first],
+    })
+    if group_column is not None:
+        table.insert(0, group_column, labels[codes[first]])
+    return table
+
+
+def find_dry_intervals(df, rule: DryDetection = DryDetection(), group_column: Optional[str] = None):
+    """Every snow-free interval of ``df`` under ``rule``: ``start``, ``end`` and ``n`` samples.
+
+    With ``group_column`` the intervals of every station are returned in one
+    table, led by that column. Linear in the number of rows.
+    """
+    order, codes, labels, times = _prepare(df, group_column)
+    first, last, mask = _intervals(df, rule, order, codes, times)
+    return _table(first, last, mask, codes, labels, times, group_column)
+
+
+def fit_baselines(df, rule: DryDetection = DryDetection(), lags=range(-3, 4),
+                  group_column: Optional[str] = None):
+    """Thermal fit ``weight = slope * sensor_temp(t - lag) + intercept`` on every dry interval.
+
+    Each interval takes the lag in ``lags`` with the highest correlation, as
+    ``fit_thermal`` does for one period, but over the samples' real
+    predecessors. Returns the ``find_dry_intervals`` table with ``lag``,
+    ``slope``, ``intercept``, ``r`` and ``n_fit`` (pairs used); intervals
+    whose fit is undefined (constant temperature) are dropped.
+    """
+    order, codes, labels, times = _prepare(df, group_column)
+    first, last, mask = _intervals(df, rule, order, codes, times)
+    table = _table(first, last, mask, codes, labels, times, group_column)
+    k = len(first)
+    # Interval of every row: +1 at each first row, -1 after each last row
+    marks = np.zeros(len(times) + 1, dtype=np.int64)
+    np.add.at(marks, first, np.arange(1, k + 1))
+    np.add.at(marks, last + 1, -np.arange(1, k + 1))
+    label = np.cumsum(marks[:-1]) - 1
+    inside = mask & (label >= 0)
+
+    weight = _column(df, "weight", order)
+    temp = _column(df, "sensor_temp", order)
+    lags = np.asarray(lags, dtype=np.int64)
+    best = np.full(k, -np.inf)
+    fits = np.full((k, len(FIT_COLUMNS)), np.nan)
+    for lag in lags:
+        x = shift(temp, int(lag), codes)
+        use = inside & ~np.isnan(x) & ~np.isnan(weight)
+        ids, xs, ys = label[use], x[use], weight[use]
+        n = np.bincount(ids, minlength=k).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mx = np.bincount(ids, xs, minlength=k) / n
+            my = np.bincount(ids, ys, minlength=k) / n
+            dx, dy = xs - mx[ids], ys - my[ids]
+            sxx = np.bincount(ids, dx * dx, minlength=k)
+            syy = np.bincount(ids, dy * dy, minlength=k)
+            sxy = np.bincount(ids, dx * dy, minlength=k)
+            r = sxy / np.sqrt(sxx * syy)
+            slope = sxy / sxx
+        defined = (n >= 2) & (sxx > 0)
+        # Highest correlation wins, ties keep the first lag (as best_lag); where the
+        # correlation is undefined (constant weight) lag 0 is preferred, as there
+        score = np.where(defined, np.where(np.isnan(r), -1.5 if lag == 0 else -2.0, r), -np.inf)
+        better = score > best
+        best = np.where(better, score, best)
+        fits[better] = np.column_stack([np.full(k, lag), slope, my - slope * mx, r, n])[better]
+
+    for column, values in zip(FIT_COLUMNS, fits.T):
+        table[column] = values
+    table = table[np.isfinite(best)].reset_index(drop=True)
+    table["lag"] = table["lag"].astype(np.int64)
+    table["n_fit"] = table["n_fit"].astype(np.int64)
+    return table
+
+
+def apply_baselines(df, fits, group_column: Optional[str] = None):
+    """Weight of ``df`` with the thermal response of the baseline in effect removed.
+
+    Each sample uses the latest fit of its station whose interval started at
+    or before it; samples before a station's first interval use that first
+    fit. Stations without any fit get NaN.
+    """
+    order, codes, labels, times = _prepare(df, group_column)
+    n = len(times)
+    if group_column is None:
+        fit_codes = np.zeros(len(fits), dtype=np.int64)
+    else:
+        fit_codes = pd.Index(labels).get_indexer(fits[group_column].to_numpy()).astype(np.int64)
+    fits, fit_codes = fits[fit_codes >= 0], fit_codes[fit_codes >= 0]
+    if not n or not len(fits):
+        return np.full(n, np.nan)
+    starts = np.asarray(fits["start"].to_numpy(), dtype="datetime64[ns]").view(np.int64)
+    fit_order = np.lexsort((starts, fit_codes))
+    fits, fit_codes, starts = fits.iloc[fit_order], fit_codes[fit_order], starts[fit_order]
+
+    # One searchsorted over (group, start) keys, as in recompute.lookup
+    lo = min(times.min(), starts.min())
+    span = int(max(times.max(), starts.max()) - lo) + 1
+    if (max(codes.max(), fit_codes.max()) + 1) * span >= 2 ** 63:
+        raise ValueError("Too many stations over too long a time span to index")
+    pos = np.searchsorted(fit_codes * span + (starts - lo), codes * span + (times - lo), side="right") - 1
+    # Before its first interval a station takes the next fit, its first
+    before = (pos < 0) | (fit_codes[np.maximum(pos, 0)] != codes)
+    pos = np.where(before, np.minimum(pos + 1, len(fits) - 1), pos)
+    found = fit_codes[pos] == codes
+    lag, slope, intercept = (fits[c].to_numpy()[pos] for c in ("lag", "slope", "intercept"))
+
+    src = np.arange(n) - lag
+    ok = found & (src >= 0) & (src < n)
+    src = np.clip(src, 0, n - 1)
+    ok &= codes[src] == codes
+    lagged = np.where(ok, _column(df, "sensor_temp", order)[src], np.nan)
+    corrected = np.where(found, _column(df, "weight", order) - (slope * lagged + intercept), np.nan)
+    if order is None:
+        return corrected
+    out = np.empty(n)
+    out[order] = corrected
+    return out
@@ -0,0 +1,172 @@
+"""Block-bootstrap confidence intervals for the validation metrics.
+
+Scale and reference series are autocorrelated, so resampling single pairs
+would understate the uncertainty; a moving-block bootstrap resamples runs of
+``block`` consecutive samples instead, circularly so every sample is equally
+likely to be drawn. Given the sample times, the series are first laid on
+their regular time grid, so a block spans ``block`` sampling steps even
+where records are missing.
+
+Every metric except the count outside the limits of agreement is a function
+of the nine sums of ``metrics._sums``. Those sums are computed once for the
+block starting at every sample, so a resample of ``n`` samples costs the sum
+of ``n / block`` rows of that table rather than a pass over ``n`` pairs, and
+all resamples of a batch are drawn and reduced as one array operation. The
+counts outside the limits, when asked for, do need each resample's
+differences and are gathered batch by batch. Batches can be spread over a
+process pool; each draws from its own spawned seed, so the result depends on
+``seed`` only, not on the number of workers.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .metrics import _from_sums, _pairs, _sums, compute_metrics
+
+
+SUM_METRICS = ("r2", "pearson_r", "rmse", "mae", "mape", "bias", "std_diff", "loa_lower", "loa_upper")
+OUTSIDE_METRICS = ("n_outside_loa", "pct_outside_loa")
+CI_METRICS = ("r2", "rmse", "bias", "loa_lower", "loa_upper")   # reported by the runner and the CLI
+JOB_BATCHES = 4      # batches of resamples per process-pool job
+
+
+@dataclass
+class BootstrapResult:
+    intervals: pd.DataFrame      # estimate, lower, upper and std of every metric
+    replicates: pd.DataFrame     # the metrics of every resample
+    block: int
+    confidence: float
+
+
+def default_block(n):
+    """Block length of ``n ** (1/3)`` samples, the usual rate for the moving-block bootstrap."""
+    return max(1, int(round(n ** (1 / 3))))
+
+
+def _block_sums(diff, reference, block):
+    """Sums (9, n) of the ``block`` samples starting at each sample, wrapping round the end."""
+    valid = ~np.isnan(diff)
+    d = np.where(valid, diff, 0.0)
+    ref = np.where(valid, reference, 0.0)
+    centre = ref[valid].mean() if valid.any() else 0.0
+    # Invalid pairs must add nothing, so every term is masked, not just reduced
+    terms = _sums(d, np.where(valid, ref, centre), lambda x: np.where(valid, 1.0 if x is None else x, 0.0))
+    wrapped = np.concatenate([terms, terms[:, :block]], axis=1)
+    cumulative = np.zeros((terms.shape[0], wrapped.shape[1] + 1))
+    np.cumsum(wrapped, axis=1, out=cumulative[:, 1:])
+    n = len(diff)
+    return cumulative[:, block:block + n] - cumulative[:, :n], cumulative
+
+
+def _on_grid(times, diff, reference):
+    """``diff`` and ``reference`` on the regular grid of ``times``, NaN in the slots of missing samples.
+
+    The step is the median spacing; each spacing counts as the nearest
+    whole number of steps, so jitter in the clock does not accumulate.
+    """
+    t = np.asarray(times, dtype="datetime64[ns]").view(np.int64)
+    if t.shape != diff.shape:
+        raise ValueError(f"times and the series differ in shape: {t.shape} vs {diff.shape}")
+    spacing = np.diff(t)
+    if (spacing <= 0).any():
+        raise ValueError("times must be strictly increasing")
+    if not len(spacing):
+        return diff, reference
+    steps = np.maximum(1, np.rint(spacing / np.median(spacing))).astype(np.int64)
+    slots = np.append(0, np.cumsum(steps))
+    grid_diff, grid_reference = np.full(slots[-1] + 1, np.nan), np.full(slots[-1] + 1, np.nan)
+    grid_diff[slots], grid_reference[slots] = diff, reference
+    return grid_diff, grid_reference
+
+
+def _draw(rng, n, block, count):
+    """Block starts (count, k) and the length of the last, partial block."""
+    k = -(-n // block)
+    return rng.integers(0, n, size=(count, k)), n - (k - 1) * block
+
+
+def _replicates(diff, reference, block, count, seed, batch, outside):
+    """Metric arrays of ``count`` resamples, drawn from ``seed``."""
+    rng = np.random.default_rng(seed)
+    n = len(diff)
+    full, cumulative = _block_sums(diff, reference, block)
+    wrapped_diff = np.concatenate([diff, diff[:block]])
+    out = {name: np.empty(count) for name in ("n", *SUM_METRICS, *(OUTSIDE_METRICS if outside else ()))}
+    for lo in range(0, count, batch):
+        rows = slice(lo, min(lo + batch, count))
+        starts, last = _draw(rng, n, block, rows.stop - rows.start)
+        # Whole blocks from the table, the last one cut to length from the cumulative sums
+        sums = full[:, starts[:, :-1]].sum(axis=2)
+        sums += cumulative[:, starts[:, -1] + last] - cumulative[:, starts[:, -1]]
+        stats = _from_sums(sums)
+        for name in ("n", *SUM_METRICS):
+            out[name][rows] = stats[name]
+        if outside:
+            # Only the last block is partial, so cutting the joined blocks to n samples is exact
+            values = wrapped_diff[(starts[:, :, None] + np.arange(block)).reshape(len(starts), -1)[:, :n]]
+            with np.errstate(invalid="ignore"):
+                beyond = (values < stats["loa_lower"][:, None]) | (values > stats["loa_upper"][:, None])
+            out["n_outside_loa"][rows] = np.where(np.isnan(stats["n"]), np.nan, beyond.sum(axis=1))
+            out["pct_outside_loa"][rows] = 100 * out["n_outside_loa"][rows] / stats["n"]
+    return out
+
+
+def bootstrap_metrics(tested, reference, block: Optional[int] = None, n_boot: int = 2000,
+                      confidence: float = 0.95, seed=None, metrics: Sequence[str] = SUM_METRICS,
+                      workers: Optional[int] = None, batch: int = 256, times=None):
+    """Percentile confidence intervals of the agreement metrics by circular block bootstrap.
+
+    ``tested`` and ``reference`` are the aligned series in time order, NaN
+    where a pair is missing; blocks are drawn over positions, so gaps stay
+    gaps. With ``times`` the positions are those of the regular time grid
+    (see ``_on_grid``), so dropped rows are gaps too. ``block`` defaults to
+    ``default_block`` of the number of positions.
+    ``metrics`` may include the counts outside the limits of agreement,
+    which make each resample a pass over its samples. With ``workers`` the
+    batches of resamples run in a process pool.
+    """
+    unknown = sorted(set(metrics) - set(SUM_METRICS) - set(OUTSIDE_METRICS))
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown}")
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, got {confidence}")
+    diff, reference = _pairs(tested, reference)
+    if diff.ndim != 1:
+        raise ValueError("bootstrap_metrics takes 1-D inputs")
+    estimate = compute_metrics(tested, reference)
+    if times is not None:
+        diff, reference = _on_grid(times, diff, reference)
+    block = default_block(len(diff)) if block is None else int(block)
+    if not 1 <= block <= len(diff):
+        raise ValueError(f"block must be between 1 and {len(diff)}, got {block}")
+    outside = any(m in OUTSIDE_METRICS for m in metrics)
+
+    # Jobs of a fixed number of batches, each with its own stream of random
+    # numbers, so the resamples do not depend on how many workers run them
+    per_job = batch * JOB_BATCHES
+    counts = [min(per_job, n_boot - lo) for lo in range(0, n_boot, per_job)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    args = [(diff, reference, block, count, s, batch, outside) for count, s in zip(counts, seeds)]
+    if workers is not None and workers > 1 and len(args) > 1:
+        from concurrent.futures import ProcessPoolExecutor   # multiprocessing is slow to import
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_replicates, *zip(*args)))
+    else:
+        parts = [_replicates(*a) for a in args]
+    replicates = pd.DataFrame({name: np.concatenate([p[name] for p in parts]) for name in ("n", *metrics)})
+
+    tail = (1 - confidence) / 2 * 100
+    values = replicates[list(metrics)].to_numpy()
+    with np.errstate(invalid="ignore"):
+        lower, upper = np.nanpercentile(values, [tail, 100 - tail], axis=0)
+    intervals = pd.DataFrame({
+        "estimate": [getattr(estimate, m) for m in metrics],
+        "lower": lower,
+        "upper": upper,
+        "std": np.nanstd(values, axis=0, ddof=1),
+    }, index=pd.Index(list(metrics), name="metric"))
+    return BootstrapResult(intervals, replicates, block, confidence)
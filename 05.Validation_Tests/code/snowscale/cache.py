@@ -0,0 +1,88 @@
+"""On-disk Feather cache for parsed station data.
+
+Parsing the CSV/TOA5 sources (especially mixed-format dates) is slower than
+everything that follows, so loaders can store their cleaned, typed frame as
+an Arrow/Feather file and memory-map it on later runs. Entries are keyed on
+the source path, its modification time and size, and the loader parameters;
+editing or replacing the source file invalidates the entry automatically.
+
+Caching is off unless a ``cache_dir`` is given or the ``SNOWSCALE_CACHE``
+environment variable is set. It needs ``pyarrow``; without it frames are
+simply rebuilt.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import warnings
+from pathlib import Path
+
+import pandas as pd
+
+
+CACHE_DIR = os.environ.get("SNOWSCALE_CACHE") or None
+FORMAT_VERSION = 1
+
+
+def _cache_key(source, params):
+    stat = source.stat()
+    text = f"{FORMAT_VERSION}|{source}|{stat.st_mtime_ns}|{stat.st_size}|{params!r}"
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _prefix(source):
+    return f"{source.name}-{hashlib.sha1(str(source).encode()).hexdigest()[:8]}"
+
+
+def cached_frame(source, build, params=(), cache_dir=CACHE_DIR):
+    """Return ``build()`` for ``source``, reading it from the cache when still valid.
+
+    ``params`` identifies everything besides the file that changes the result
+    (e.g. the ``SiteConfig``); it must have a stable ``repr``.
+    """
+    if cache_dir is None:
+        return build()
+    try:
+        from pyarrow import feather
+    except ImportError:
+        warnings.warn("pyarrow is not installed; snowscale cache disabled", stacklevel=2)
+        return build()
+
+    source = Path(source).resolve()
+    cache_dir = Path(cache_dir)
+    entry = cache_dir / f"{_prefix(source)}-{_cache_key(source, params)}.feather"
+    if entry.exists():
+        return feather.read_table(entry, memory_map=True).to_pandas()
+
+    df = build()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for stale in cache_dir.glob(f"{_prefix(source)}-*.feather"):
+        if stale.name != entry.name and _same_params(stale, params):
+            stale.unlink(missing_ok=True)
+            _params_file(stale).unlink(missing_ok=True)
+    tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+    os.replace(tmp, entry)
+    _params_file(entry).write_text(repr(params))
+    return df
+
+
+def _params_file(entry):
+    return entry.with_suffix(".params")
+
+
+def _same_params(entry, params):
+    """Whether a cache entry was built with ``params`` (so it is an older version of the file)."""
+    try:
+        return _params_file(entry).read_text() == repr(params)
+    except FileNotFoundError:
+        return True
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Delete every cache entry in ``cache_dir``."""
+    if cache_dir is None:
+        return
+    for path in Path(cache_dir).glob("*.feather"):
+        path.unlink(missing_ok=True)
+        _params_file(path).unlink(missing_ok=True)
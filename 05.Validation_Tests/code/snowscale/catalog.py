@@ -0,0 +1,164 @@
+"""Time index over many station files, so a date range opens only what holds it.
+
+``StationIndex`` covers binary archives (``snowscale.archive``) and key/value
+telemetry text. For every file it keeps the size, modification time, scale
+ids and earliest and latest record, and for telemetry text the block index
+of ``telemetry.iot_index`` (archives carry their own chunk index). A query
+skips files outside the range, then reads only the overlapping chunks or
+blocks of the rest.
+
+With a ``cache_dir`` (or ``SNOWSCALE_CACHE``) the entry of each file is
+saved as JSON next to the frame cache and reused while the file is
+unchanged; a telemetry file that has only grown is indexed from its last
+block onwards.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import pandas as pd
+
+from .archive import MAGIC, Archive
+from .cache import CACHE_DIR, _prefix
+from .telemetry import IOT_KEYS, INDEX_COLUMNS, iot_index, read_iot
+
+
+INDEX_VERSION = 1
+
+
+def _kind(path):
+    with open(path, "rb") as file:
+        return "archive" if file.read(len(MAGIC)) == MAGIC else "iot"
+
+
+def _timestamp(value):
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+
+def _entry_path(source, cache_dir):
+    return Path(cache_dir) / f"{_prefix(source)}.index.json"
+
+
+def _load_entry(source, cache_dir):
+    if cache_dir is None:
+        return None
+    try:
+        entry = json.loads(_entry_path(source, cache_dir).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return entry if entry.get("version") == INDEX_VERSION else None
+
+
+def _save_entry(source, entry, cache_dir):
+    if cache_dir is None:
+        return
+    path = _entry_path(source, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(entry))
+    os.replace(tmp, path)
+
+
+def _blocks_frame(rows):
+    blocks = pd.DataFrame(rows, columns=list(INDEX_COLUMNS))
+    for column in ("start", "end"):
+        blocks[column] = pd.to_datetime(blocks[column]).astype("datetime64[us]")
+    return blocks
+
+
+def _index_file(source, cached):
+    """Index entry of one file, reusing ``cached`` where the file is unchanged or only grew."""
+    stat = source.stat()
+    if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached
+    kind = _kind(source)
+    entry = {"version": INDEX_VERSION, "kind": kind, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if kind == "archive":
+        with Archive(source) as archive:
+            chunks = archive.index
+        entry.update(start=_timestamp(chunks["start"].min()), end=_timestamp(chunks["end"].max()),
+                     ids=sorted(chunks["id"].unique()), blocks=None)
+        return entry
+    previous = None
+    if cached is not None and cached["kind"] == "iot" and cached["size"] <= stat.st_size and cached["blocks"]:
+        previous = _blocks_frame(cached["blocks"])
+    blocks = iot_index(source, index=previous)
+    entry.update(start=_timestamp(blocks["start"].min()), end=_timestamp(blocks["end"].max()), ids=None,
+                 blocks=[[int(o), int(n), int(line), _timestamp(s), _timestamp(e)]
+                         for o, n, line, s, e in blocks[list(INDEX_COLUMNS)].itertuples(index=False)])
+    return entry
+
+
+class StationIndex:
+    """Earliest and latest time of every file in ``paths``; see the module docstring.
+
+    ``files`` has one row per file: ``path``, ``kind`` ("archive" or
+    "iot"), ``start``, ``end`` and ``ids`` (None for telemetry text, whose ids
+    are only known once parsed). ``keys`` are the telemetry keys of the text
+    files, as for ``read_iot``.
+    """
+
+    def __init__(self, paths: Iterable, cache_dir=CACHE_DIR, keys: Sequence[str] = IOT_KEYS):
+        self.paths = [Path(p).resolve() for p in paths]
+        self.cache_dir = cache_dir
+        self.keys = tuple(keys)
+        self._entries = {}
+        self.refresh()
+
+    def refresh(self):
+        """Index files that are new or changed since the last refresh."""
+        for source in self.paths:
+            cached = self._entries.get(source) or _load_entry(source, self.cache_dir)
+            entry = _index_file(source, cached)
+            if entry is not cached:
+                _save_entry(source, entry, self.cache_dir)
+            self._entries[source] = entry
+        self.files = pd.DataFrame(
+            [(str(p), e["kind"], e["start"], e["end"], e["ids"]) for p, e in self._entries.items()],
+            columns=["path", "kind", "start", "end", "ids"])
+        for column in ("start", "end"):
+            self.files[column] = pd.to_datetime(self.files[column]).astype("datetime64[us]")
+
+    def blocks(self, path):
+        """Block index of the telemetry file ``path`` (see ``iot_index``); None for an archive."""
+        entry = self._entries[Path(path).resolve()]
+        return None if entry["blocks"] is None else _blocks_frame(entry["blocks"])
+
+    def select(self, start=None, end=None, ids: Optional[Iterable] = None):
+        """Rows of ``files`` that can hold records of ``ids`` in ``[start, end]``."""
+        keep = self.files["start"].notna()
+        if start is not None:
+            keep &= self.files["end"] >= pd.Timestamp(start)
+        if end is not None:
+            keep &= self.files["start"] <= pd.Timestamp(end)
+        if ids is not None:
+            wanted = {str(i) for i in ids}
+            keep &= self.files["ids"].map(lambda have: have is None or bool(wanted.intersection(have)))
+        return self.files[keep]
+
+    def read(self, start=None, end=None, ids: Optional[Iterable] = None,
+             columns: Optional[Sequence[str]] = None):
+        """Records with ``start <= time <= end`` from every file, sorted by time.
+
+        ``ids`` and ``columns`` restrict the scales and fields returned.
+        """
+        frames = []
+        for path, kind in self.select(start, end, ids)[["path", "kind"]].itertuples(index=False):
+            if kind == "archive":
+                with Archive(path) as archive:
+                    df = archive.read(start, end, ids, columns)
+            else:
+                df = read_iot(path, keys=self.keys, start=start, end=end, index=self.blocks(path))
+                if ids is not None:
+                    df = df[df["id"].astype(str).isin([str(i) for i in ids])]
+                if columns is not None:
+                    df = df[["id", "time", *[c for c in columns if c not in ("id", "time")]]]
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["id", "time", *(columns or [])])
+        df = pd.concat(frames, ignore_index=True)
+        df["id"] = df["id"].astype(str).astype("category")
+        return df.sort_values("time", kind="stable", ignore_index=True)
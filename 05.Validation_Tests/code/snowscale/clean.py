@@ -0,0 +1,246 @@
+"""Cleaning of the scale and depth channels: range rules, despiking and smoothing.
+
+Each channel gets a ``ChannelCleaning`` (see ``snowscale.config``):
+
+* a valid range, replacing the per-site ``weight_range`` clip;
+* a rolling-median/MAD spike detector over a centred time window. A value
+  is blanked when it lies more than ``spike_threshold * 1.4826 * MAD`` from
+  the window median;
+* a Savitzky-Golay filter (``height_savgol``) that is gap-aware. It runs
+  separately over every stretch of valid samples, with the edges of each
+  stretch fitted as ``savgol_filter(mode="interp")`` fits the ends of a
+  record. A missing sample therefore no longer turns its whole window into
+  NaN. Stretches shorter than the window are left as they are.
+
+``clean`` handles a frame, many stations at once with ``group_column``.
+``clean_blocks`` does the same over an iterator of blocks (``iter_iot``,
+archive chunks) with bounded memory: it holds back the end of each block
+until the next one brings the context it needs. A ``CleaningReport`` counts
+the points each rule removed from each channel.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import ChannelCleaning
+from .resample import _keys
+
+
+MAD_SCALE = 1.4826   # MAD of a normal distribution -> standard deviation
+RULES = ("range", "spike")
+
+
+@dataclass
+class CleaningReport:
+    rows: int = 0
+    removed: Dict[str, Dict[str, int]] = field(default_factory=dict)   # channel -> rule -> points
+
+    def add(self, channel, rule, count):
+        counts = self.removed.setdefault(channel, dict.fromkeys(RULES, 0))
+        counts[rule] += int(count)
+
+    def as_frame(self):
+        """Removed points as a table: one row per channel, one column per rule."""
+        return pd.DataFrame.from_dict(self.removed, orient="index", columns=list(RULES)).rename_axis("channel")
+
+
+# --- Rules -----------------------------------------------------------------------
+
+def _spikes(keys, values, rule: ChannelCleaning):
+    """Values further than the threshold from the median of their centred window."""
+    # The (group, time) keys stand in for times so one rolling call never crosses stations
+    series = pd.Series(values, index=pd.DatetimeIndex(keys.astype("datetime64[ns]")))
+    window = pd.Timedelta(rule.spike_window)
+    median = series.rolling(window, center=True, min_periods=1).median().to_numpy()
+    deviation = np.abs(values - median)
+    mad = pd.Series(deviation, index=series.index).rolling(window, center=True, min_periods=1).median().to_numpy()
+    with np.errstate(invalid="ignore"):
+        return (deviation > rule.spike_threshold * MAD_SCALE * mad) & (deviation > rule.spike_min)
+
+
+def _savgol_coeffs(window, order, pos):
+    """Weights of the samples of a window for the degree-``order`` least-squares fit at ``pos``."""
+    x = np.arange(window) - pos
+    return np.linalg.pinv(np.vander(x, order + 1, increasing=True))[0]
+
+
+def _savgol(values, breaks, window, order):
+    """Savitzky-Golay filter restarting after every ``breaks`` row and at every NaN."""
+    if window % 2 == 0 or window <= order:
+        raise ValueError(f"savgol_window must be odd and larger than savgol_order, got {window}")
+    n = len(values)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return values.copy()
+    starts = valid & ~np.append(False, valid[:-1] & ~breaks[1:])
+    segment = np.cumsum(starts) - 1
+    first = np.flatnonzero(starts)
+    length = np.bincount(segment[valid], minlength=len(first))
+    out = values.copy()
+    half = window // 2
+    # Interior: the plain convolution, used where the whole window is in one stretch
+    centre = np.convolve(np.where(valid, values, 0.0), _savgol_coeffs(window, order, half)[::-1], mode="same")
+    pos = np.arange(n) - np.where(valid, first[np.maximum(segment, 0)], 0)
+    seg_len = np.where(valid, length[np.maximum(segment, 0)], 0)
+    long = valid & (seg_len >= window)
+    interior = long & (pos >= half) & (pos < seg_len - half)
+    out[interior] = centre[interior]
+    # Edges: the fit to the first or last window of the stretch, evaluated at the sample
+    heads = first[length >= window]
+    tails = heads + length[length >= window] - window
+    offsets = np.arange(window)
+    for p in range(half):
+        for base, at in ((heads, p), (tails, window - 1 - p)):
+            out[base + at] = values[base[:, None] + offsets] @ _savgol_coeffs(window, order, at)
+    return out
+
+
+def _gaps(keys, max_gap):
+    gap = np.zeros(len(keys), dtype=bool)
+    gap[1:] = np.diff(keys) > pd.Timedelta(max_gap).value
+    return gap
+
+
+def _apply(df, rules: Mapping[str, ChannelCleaning], group_column):
+    """Cleaned values and removal masks of every channel, in the row order of ``df``."""
+    missing = [c for c in rules if c not in df.columns]
+    if missing:
+        raise ValueError(f"Frame has no columns {missing} to clean")
+    margin = max([pd.Timedelta(r.spike_window).value for r in rules.values() if r.spike_window] + [0])
+    groups = None if group_column is None else df[group_column].to_numpy()
+    keys = _keys(df["time"].to_numpy(), groups, margin)
+    order = np.argsort(keys, kind="stable") if len(keys) > 1 and np.any(keys[1:] < keys[:-1]) else None
+    if order is not None:
+        keys = keys[order]
+    # A new station starts a new stretch for the Savitzky-Golay filter
+    breaks = np.zeros(len(keys), dtype=bool)
+    if groups is not None and len(keys):
+        codes = pd.factorize(groups)[0]
+        codes = codes if order is None else codes[order]
+        breaks[1:] = codes[1:] != codes[:-1]
+
+    values, masks = {}, {}
+    for channel, rule in rules.items():
+        column = df[channel].to_numpy(dtype=np.float64)
+        x = column.copy() if order is None else column[order]
+        if rule.valid_range is not None:
+            low, high = rule.valid_range
+            with np.errstate(invalid="ignore"):
+                removed = (x < low) | (x > high)
+            x[removed] = np.nan
+            masks[(channel, "range")] = removed
+        if rule.spike_window is not None:
+            removed = _spikes(keys, x, rule)
+            x[removed] = np.nan
+            masks[(channel, "spike")] = removed
+        if rule.savgol_window is not None:
+            gaps = breaks if rule.max_gap is None else breaks | _gaps(keys, rule.max_gap)
+            x = _savgol(x, gaps, rule.savgol_window, rule.savgol_order)
+        values[channel] = x
+    if order is not None:
+        for store in (values, masks):
+            for name, x in store.items():
+                unsorted = np.empty_like(x)
+                unsorted[order] = x
+                store[name] = unsorted
+    return values, masks
+
+
+def _count(report, masks, rows):
+    """Add the removals among ``rows`` (a boolean mask) to ``report``."""
+    if report is None:
+        return
+    report.rows += int(np.count_nonzero(rows))
+    for (channel, rule), removed in masks.items():
+        report.add(channel, rule, np.count_nonzero(removed & rows))
+
+
+# --- Frames ----------------------------------------------------------------------
+
+def clean(df, rules: Mapping[str, ChannelCleaning], group_column: Optional[str] = None,
+          report: Optional[CleaningReport] = None):
+    """``df`` with every channel in ``rules`` cleaned; see the module docstring.
+
+    Removal counts are added to ``report`` when given.
+    """
+    values, masks = _apply(df, rules, group_column)
+    _count(report, masks, np.ones(len(df), dtype=bool))
+    return df.assign(**values)
+
+
+def _context(rules: Mapping[str, ChannelCleaning]):
+    """Samples and time either side of a sample that its cleaned value can depend on."""
+    rows = max([r.savgol_window for r in rules.values() if r.savgol_window] + [0])
+    # The MAD is a median of deviations from medians: up to a whole window away
+    time = max([pd.Timedelta(r.spike_window).value for r in rules.values() if r.spike_window] + [0])
+    return rows, 2 * time
+
+
+def _nth_last(times, codes, n):
+    """Per group: the ``n``-th last of ``times`` (sorted by group, then time), or the first."""
+    ends = np.append(np.flatnonzero(codes[1:] != codes[:-1]), len(codes) - 1)
+    starts = np.append(0, ends[:-1] + 1)
+    return codes[ends], times[np.maximum(ends - n + 1, starts)]
+
+
+def _yield(frame, rules, group_column, rows, report):
+    values, masks = _apply(frame, rules, group_column)
+    _count(report, masks, rows)
+    return frame[rows].assign(**{c: v[rows] for c, v in values.items()}).reset_index(drop=True)
+
+
+def clean_blocks(blocks: Iterable[pd.DataFrame], rules: Mapping[str, ChannelCleaning],
+                 group_column: Optional[str] = None,
+                 report: Optional[CleaningReport] = None) -> Iterator[pd.DataFrame]:
+    """Clean a stream of time-ordered blocks, yielding cleaned blocks.
+
+    A row is yielded once every row within the context of the rules (the
+    Savitzky-Golay window, twice the spike window) has arrived, so the
+    result equals ``clean`` over all blocks at once, unless a station falls
+    silent for longer than that context and later resumes. Memory is the
+    block size plus that context.
+    """
+    rows, span = _context(rules)
+    pending = None
+    done = np.zeros(0, dtype=bool)     # rows of ``pending`` already yielded, kept as context
+    for block in blocks:
+        if not len(block):
+            continue
+        buffer = block if pending is None else pd.concat([pending, block], ignore_index=True)
+        done = np.append(done, np.zeros(len(block), dtype=bool))
+        times = np.asarray(buffer["time"].to_numpy(), dtype="datetime64[ns]").view(np.int64)
+        codes = (np.zeros(len(buffer), dtype=np.int64) if group_column is None
+                 else pd.factorize(buffer[group_column])[0])
+        order = np.lexsort((times, codes))
+        latest = times.max()
+
+        # Final rows have all their context: ``span`` of time after them and
+        # ``rows`` later samples of their station with theirs. Stations silent
+        # for longer than ``span`` do not hold the others back.
+        cutoff = latest - span
+        complete = order[times[order] <= cutoff]
+        if rows and len(complete):
+            last = np.full(codes.max() + 1, np.iinfo(np.int64).min)
+            np.maximum.at(last, codes, times)
+            group, nth = _nth_last(times[complete], codes[complete], rows)
+            recent = last[group] > cutoff
+            if recent.any():
+                cutoff = min(cutoff, nth[recent].min())
+        final = times < cutoff
+        if (final & ~done).any():
+            yield _yield(buffer, rules, group_column, final & ~done, report)
+
+        # Keep the rows not yet final, and ``rows`` samples and ``span`` of time before them
+        keep_from = cutoff - span
+        if rows and final.any():
+            behind = order[final[order]]
+            keep_from = min(keep_from, _nth_last(times[behind], codes[behind], rows)[1].min() - span)
+        keep = (times >= keep_from) | ~final
+        pending = buffer[keep].reset_index(drop=True)
+        done = final[keep]
+    if pending is not None and not done.all():
+        yield _yield(pending, rules, group_column, ~done, report)
@@ -0,0 +1,92 @@
+"""Command-line validation of single sites, for cron jobs and quick checks::
+
+    python -m snowscale tapado                       # metrics, as text
+    python -m snowscale tapado guandacol --json      # one JSON object per site and line
+    python -m snowscale broken_river --plots figs    # and the figures
+
+The metrics path loads NumPy and pandas and nothing else of weight;
+matplotlib is only imported with ``--plots``, and multiprocessing only by
+the runner. ``benchmarks/bench_startup.py`` tracks the start-up time.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+
+from .bootstrap import CI_METRICS, bootstrap_metrics
+from .cache import CACHE_DIR
+from .config import SITES
+from .correction import ThermalFit
+from .io import DATA_DIR
+from .metrics import format_metrics
+from .pipeline import run_site
+
+
+def _json_value(value):
+    """``value`` as strict JSON takes it: NaN and infinities become None (null)."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _report(key, result, boot):
+    """JSON-ready summary of one site's run; metrics that are undefined are None."""
+    report = {"site": key, "name": result.config.name, "reference_lag": result.lag, **result.metrics.as_dict()}
+    if isinstance(result.thermal, ThermalFit):
+        report.update(thermal_slope=result.thermal.slope, thermal_intercept=result.thermal.intercept,
+                      thermal_lag=result.thermal.lag)
+    if boot is not None:
+        for metric, (lower, upper) in boot.intervals[["lower", "upper"]].iterrows():
+            report[f"{metric}_lower"], report[f"{metric}_upper"] = lower, upper
+    return {name: _json_value(value) for name, value in report.items()}
+
+
+def _print_text(key, result, boot):
+    print(f"\n--- Analysis Results: {result.config.name} ---")
+    if isinstance(result.thermal, ThermalFit):
+        print(f"Thermal fit: slope {result.thermal.slope:.4f}, intercept {result.thermal.intercept:.2f}, "
+              f"temperature lag {result.thermal.lag} records")
+    print(f"Best alignment shift: {result.lag} records")
+    print(format_metrics(result.metrics))
+    if boot is not None:
+        level = round(boot.confidence * 100)
+        for metric, (lower, upper) in boot.intervals[["lower", "upper"]].iterrows():
+            print(f"{metric} {level}% interval: [{lower:.3f}, {upper:.3f}] (block {boot.block})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m snowscale",
+                                     description="Validate Snow Scale sites against their reference.")
+    parser.add_argument("sites", nargs="+", choices=list(SITES), metavar="SITE",
+                        help=f"one or more of: {', '.join(SITES)}")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per site")
+    parser.add_argument("--plots", default=None, metavar="DIR", help="also render the figures into DIR")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="block-bootstrap resamples for confidence intervals of R², RMSE, bias and LoA")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for key in args.sites:
+        try:
+            result = run_site(SITES[key], args.data_dir, args.cache_dir)
+        except Exception as exc:   # report and go on with the other sites
+            print(f"{key}: {type(exc).__name__}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        boot = None
+        if args.bootstrap:
+            aligned = result.aligned
+            boot = bootstrap_metrics(aligned["tested"], aligned["reference"], n_boot=args.bootstrap, seed=0,
+                                     metrics=CI_METRICS, times=aligned["time"])
+        if args.json:
+            print(json.dumps(_report(key, result, boot), allow_nan=False))
+        else:
+            _print_text(key, result, boot)
+        if args.plots is not None:
+            from .plotting import render
+            render(result, args.plots, key)
+    return 1 if failed else 0
@@ -0,0 +1,233 @@
+"""Per-site configuration for the Snow Scale validation pipeline.
+
+Each validation site is described by a ``SiteConfig``: where its data lives,
+how its columns map onto the canonical names used by the pipeline, which rule
+selects the dry (snow-free) period used for the thermal fit, how the corrected
+weight is smoothed and where the reference SWE comes from.
+
+Canonical column names produced by the loaders:
+
+    time, weight, sensor_temp, reference, snow_height, air_temp
+
+Stations with a second load cell add ``weight_2`` and ``sensor_temp_2``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Mapping, Optional, Tuple, Union
+
+
+SENSOR = "sensor_temp"   # in a ThermalTerm: the sensor temperature of the channel being fitted
+
+
+@dataclass(frozen=True)
+class DryPeriod:
+    """Rule selecting the snow-free samples used to fit the thermal model.
+
+    Rows are kept when ``snow_height <= max_height`` and, if given, they fall
+    between ``start`` and ``end`` or within ``first_days`` of the first record.
+    Of those, the first ``first_samples`` rows with valid weight and sensor
+    temperature are used.
+    """
+    max_height: Optional[float] = 10.0
+    first_samples: Optional[int] = 7
+    first_days: Optional[float] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DryDetection:
+    """Rule finding every snow-free interval of the record, each with its own thermal fit.
+
+    A sample qualifies while the snow height (averaged over ``height_window``
+    when given) is at most ``max_height``, weight and sensor temperature are
+    valid and, if given, ``|weight| <= max_weight``. Consecutive qualifying
+    samples form an interval until a gap longer than ``max_gap``; intervals
+    shorter than ``min_duration`` or ``min_samples`` are dropped.
+    """
+    max_height: float = 10.0
+    height_window: Optional[str] = "24h"
+    max_weight: Optional[float] = None
+    max_gap: str = "6h"
+    min_duration: str = "7D"
+    min_samples: int = 24
+
+
+@dataclass(frozen=True)
+class ThermalTerm:
+    """One regressor of a ``ThermalModel``: ``column`` at ``t - lag``, or its first difference.
+
+    ``column="sensor_temp"`` stands for the sensor temperature of each
+    channel (``ThermalModel.channels``); any other column is used as is.
+    Lags are in samples, as ``SiteConfig.thermal_lags``.
+    """
+    column: str = SENSOR
+    lag: int = 0
+    diff: bool = False   # x(t - lag) - x(t - lag - 1): warming or cooling, for hysteresis
+
+    @property
+    def name(self):
+        name = f"d_{self.column}" if self.diff else self.column
+        return f"{name}@{self.lag}" if self.lag else name
+
+
+@dataclass(frozen=True)
+class ThermalModel:
+    """Multi-term thermal model fitted on the dry samples of every load cell.
+
+    Each weight column in ``channels`` (mapped to its own sensor
+    temperature) is regressed on ``terms`` with, if ``intercept``, a
+    constant; see ``snowscale.thermal``.
+    """
+    terms: Tuple[ThermalTerm, ...] = (ThermalTerm(),)
+    channels: Mapping[str, str] = field(default_factory=lambda: {"weight": SENSOR})
+    intercept: bool = True
+
+
+@dataclass(frozen=True)
+class ChannelCleaning:
+    """Cleaning of one channel; the rules run in this order.
+
+    Values outside ``valid_range`` are blanked. With ``spike_window`` a value
+    further than ``spike_threshold`` scaled MADs (and more than
+    ``spike_min``) from the median of the centred window is blanked. With
+    ``savgol_window`` (odd, in samples) the channel is smoothed by a
+    Savitzky-Golay filter of ``savgol_order`` that restarts at missing values
+    and at gaps longer than ``max_gap``.
+    """
+    valid_range: Optional[Tuple[float, float]] = None
+    spike_window: Optional[str] = None
+    spike_threshold: float = 5.0
+    spike_min: float = 0.0
+    savgol_window: Optional[int] = None
+    savgol_order: int = 2
+    max_gap: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DriftAlert:
+    """Alert raised while a rolling agreement metric of a station pair is out of bounds.
+
+    ``metric`` is a ``Metrics`` statistic computed from sums (``rmse``,
+    ``bias``, ``std_diff``, ``loa_lower``, ``loa_upper``, ``r2``, ...) or
+    ``abs_bias`` or ``loa_width``. The alert is active while the metric over
+    ``window`` is above ``limit`` (below it with ``below``), once the window
+    holds ``min_samples`` pairs.
+    """
+    metric: str
+    limit: float
+    window: str = "7D"
+    below: bool = False
+    min_samples: int = 24
+
+
+@dataclass(frozen=True)
+class CRDSource:
+    """Cosmic-ray (CRD) reference computed from a TOA5 neutron-count file."""
+    path: str
+    af: float = 1829.0
+    target_ratio: float = 0.5356
+    dry_start: str = "2023-12-01"
+    dry_end: str = "2023-12-31"
+    ground_range: Tuple[float, float] = (25000, 40000)
+    reference_range: Tuple[float, float] = (15000, 22000)
+    smooth_window: Union[int, str] = "12h"  # duration, or a number of samples
+    tolerance: str = "30min"
+    lag: str = "0min"                      # added to the CRD timestamps before matching
+    calibrations: Optional[str] = None     # CSV of dated calibrations (see crd.py); overrides the fields above
+    site: Optional[str] = None             # this file's site in a calibrations table shared by several sites
+
+
+@dataclass(frozen=True)
+class SiteConfig:
+    name: str
+    path: str
+    columns: Mapping[str, str]
+    reader: str = "ceazamet"              # "ceazamet" (semicolon CSV), "iot" (key/value telemetry) or "archive"
+    iot_keys: Optional[Tuple[str, ...]] = None   # keys of each telemetry record; None -> telemetry.IOT_KEYS
+    time_format: Optional[str] = "%d-%m-%Y %H:%M"   # None -> mixed, day first
+    # None -> no thermal correction; DryDetection -> a fit per detected dry interval
+    dry: Optional[Union[DryPeriod, DryDetection]] = field(default_factory=DryPeriod)
+    thermal_lags: range = range(-3, 4)
+    thermal_min_pairs: int = 5             # dry pairs a lag needs before its correlation counts
+    # Multi-term, multi-channel model fitted on the dry rows instead of the one-term fit
+    thermal_model: Optional[ThermalModel] = None
+    smooth_window: Union[int, str] = "12h"   # duration, or a number of samples
+    smooth_center: bool = True
+    reference: Optional[CRDSource] = None  # None -> "reference" column of the site file
+    reference_lags: range = range(0, 1)
+    calibrate: bool = False                # linear calibration of the scale against the reference
+    period: Optional[Tuple[str, str]] = None
+    height_offset: Optional[float] = None  # snow_height = height_offset - raw sensor distance
+    height_savgol: Optional[int] = None    # shorthand for cleaning["snow_height"].savgol_window
+    weight_range: Optional[Tuple[float, float]] = None   # shorthand for cleaning["weight"].valid_range
+    cleaning: Mapping[str, ChannelCleaning] = field(default_factory=dict)   # channel -> rules
+    scale_area_m2: Optional[float] = None  # weight column in kg -> kg/m²
+
+
+SITES = {
+    "tapado": SiteConfig(
+        name="El Tapado",
+        path="tapado_full.csv",
+        columns={
+            "Fecha": "time",
+            "El Tapado-Altura de Nieve[cm]": "snow_height",
+            "El Tapado-Peso de la Nieve[kg/m²]": "weight",
+            "El Tapado-Temperatura Sensor[°C]": "sensor_temp",
+            "El Tapado-Agua equivalente[mm]": "reference",
+            "El Tapado-Temperatura del Aire[°C]": "air_temp",
+        },
+        reference_lags=range(-24, 25),
+    ),
+    "tascadero": SiteConfig(
+        name="Tascadero",
+        path="tascadero_full.csv",
+        columns={
+            "Fecha": "time",
+            "Tascadero Nodo IOT-Peso de la Nieve1[kg/m²]": "weight",
+            "Tascadero Nodo IOT-Temperatura Sensor1[°C]": "sensor_temp",
+            "Tascadero Nodo IOT-Peso de la Nieve2[kg/m²]": "weight_2",
+            "Tascadero Nodo IOT-Temperatura Sensor2[°C]": "sensor_temp_2",
+            "Tascadero-Altura de Nieve[cm]": "snow_height",
+            "Tascadero-Peso de la Nieve[kg/m²]": "reference",
+            "Tascadero Nodo IOT-Temperatura del Aire[°C]": "air_temp",
+        },
+        time_format=None,
+    ),
+    "guandacol": SiteConfig(
+        name="Guandacol",
+        path="Guandacol_Data_FROM_CEAZAMET.csv",
+        columns={
+            "Fecha": "time",
+            "Guandacol IOT-Temperatura Sensor[°C]": "sensor_temp",
+            "Guandacol IOT-Peso de la Nieve[kg/m²]": "weight",
+            "Guandacol-Peso de la Nieve[kg/m²]": "reference",
+            "Guandacol IOT-Altura de Nieve[cm]": "snow_height",
+        },
+        dry=DryPeriod(max_height=15.0, first_samples=None, first_days=7),
+        smooth_center=False,
+        calibrate=True,
+        height_offset=25.0,
+        height_savgol=13,
+        weight_range=(-10.0, float("inf")),
+    ),
+    "broken_river": SiteConfig(
+        name="Broken River",
+        path="BR_IOT.csv",
+        columns={
+            "dt": "time",
+            "sw": "weight",
+            "swt": "sensor_temp",
+            "sh": "snow_height",
+            "at": "air_temp",
+        },
+        reader="iot",
+        dry=None,
+        reference=CRDSource(path="BR_CRD.dat"),
+        period=("2023-06-06", "2023-12-31"),
+        height_offset=200.0,
+        weight_range=(0.0, 500.0),
+        scale_area_m2=0.28 * 0.28,
+    ),
+}
@@ -0,0 +1,141 @@
+"""Thermal correction of the Snow Scale weight.
+
+The load cells drift with temperature. During a dry (snow-free) period the
+measured weight is regressed on the lagged sensor temperature and the fitted
+line is subtracted from the whole record.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .baseline import apply_baselines, fit_baselines
+from .config import DryDetection, DryPeriod, SiteConfig
+from .lag import shift
+from .profiling import stage
+from .resample import rolling_mean
+from .thermal import apply_thermal_model, fit_thermal_model
+
+
+@dataclass(frozen=True)
+class ThermalFit:
+    slope: float
+    intercept: float
+    lag: int
+    n: int
+
+
+def dry_period(df, rule: DryPeriod):
+    """Rows of ``df`` selected by the dry-period ``rule``."""
+    mask = pd.Series(True, index=df.index)
+    if rule.max_height is not None:
+        mask &= df["snow_height"] <= rule.max_height
+    if rule.start is not None:
+        mask &= df["time"] >= rule.start
+    if rule.end is not None:
+        mask &= df["time"] <= rule.end
+    if rule.first_days is not None:
+        mask &= df["time"] < df["time"].min() + pd.Timedelta(days=rule.first_days)
+    mask &= df["weight"].notna() & df["sensor_temp"].notna()
+    dry = df[mask]
+    if rule.first_samples is not None:
+        dry = dry.iloc[:rule.first_samples]
+    return dry
+
+
+def fit_thermal(df, rule: DryPeriod, lags=range(-3, 4), min_pairs=5):
+    """Fit ``weight = slope * sensor_temp(t - lag) + intercept`` on the dry period.
+
+    The dry rows are split into stretches of consecutive rows, and a sample
+    is only paired with the temperature ``lag`` rows before it in the same
+    stretch. The lag with the highest correlation over at least
+    ``min_pairs`` pairs is chosen, and the line is fitted on those pairs.
+    """
+    dry = dry_period(df, rule)
+    if len(dry) < 2:
+        raise ValueError(f"Dry period has {len(dry)} valid samples, at least 2 are needed")
+    rows = df.index.get_indexer(dry.index)
+    stretch = np.cumsum(np.diff(rows, prepend=rows[0] - 2) != 1)
+    temp = dry["sensor_temp"].to_numpy(dtype=float)
+    weight = dry["weight"].to_numpy(dtype=float)
+
+    best, fit = -np.inf, None
+    for lag in lags:
+        x = shift(temp, int(lag), stretch)
+        use = ~np.isnan(x)
+        if use.sum() < max(min_pairs, 2) or np.ptp(x[use]) == 0:
+            continue
+        r = np.corrcoef(x[use], weight[use])[0, 1]
+        # Highest correlation wins, ties keep the first lag; with a constant
+        # weight the correlation is undefined and lag 0 is preferred
+        score = r if not np.isnan(r) else (-1.5 if lag == 0 else -2.0)
+        if score > best:
+            best, fit = score, (int(lag), x[use], weight[use])
+    if fit is None:
+        raise ValueError(f"No lag in {lags} has {min_pairs} dry pairs with varying temperature")
+    lag, x, y = fit
+    slope, intercept = np.polyfit(x, y, 1)
+    return ThermalFit(float(slope), float(intercept), lag, len(x))
+
+
+def apply_thermal(df, fit: ThermalFit):
+    """Weight with the fitted thermal response removed."""
+    temp = shift(df["sensor_temp"].values, fit.lag)
+    return df["weight"].values - (fit.slope * temp + fit.intercept)
+
+
+def smooth(values, window, center=True, times=None):
+    """Moving average over ``window``, tolerant to gaps.
+
+    A duration such as ``"12h"`` averages over that much time around each of
+    ``times``; an int averages over that many samples.
+    """
+    if isinstance(window, int):
+        return pd.Series(values).rolling(window=window, center=center, min_periods=1).mean().values
+    if times is None:
+        raise ValueError(f"Smoothing over {window!r} needs the sample times")
+    return rolling_mean(times, values, window, center=center)
+
+
+def correct(df, config: SiteConfig):
+    """Add the thermally corrected and smoothed ``corrected`` column to ``df``.
+
+    Returns the frame and the ``ThermalFit`` (None when the site has no dry
+    rule); with a ``DryDetection`` rule, the table of per-interval fits of
+    ``fit_baselines`` instead. With a ``thermal_model`` it returns the
+    ``fit_thermal_model`` table and adds a smoothed ``corrected_<channel>``
+    column for every channel besides ``weight``.
+    """
+    df = df.copy()
+    fit = None
+    weight = df["weight"].values
+    channels = {}
+    if config.thermal_model is not None and config.dry is not None:
+        with stage("thermal_fit", df) as record:
+            fit = fit_thermal_model(df, config.thermal_model, config.dry)
+            record.rows_out = fit
+        if set(fit["channel"]) != set(config.thermal_model.channels):
+            raise ValueError("Too few dry samples to fit the thermal model of every channel")
+        corrected = apply_thermal_model(df, fit, config.thermal_model)
+        weight = corrected["weight"].to_numpy() if "weight" in corrected else weight
+        channels = {f"corrected_{c}": corrected[c].to_numpy() for c in corrected if c != "weight"}
+    elif isinstance(config.dry, DryDetection):
+        with stage("thermal_fit", df) as record:
+            fit = fit_baselines(df, config.dry, config.thermal_lags)
+            record.rows_out = fit
+        if not len(fit):
+            raise ValueError("No dry interval found for the thermal fit")
+        weight = apply_baselines(df, fit)
+    elif config.dry is not None:
+        with stage("thermal_fit", df) as record:
+            fit = fit_thermal(df, config.dry, config.thermal_lags, config.thermal_min_pairs)
+            record.rows_out = fit.n
+        weight = apply_thermal(df, fit)
+    with stage("smooth", df) as record:
+        df["corrected"] = smooth(weight, config.smooth_window, config.smooth_center, df["time"].values)
+        for name, values in channels.items():
+            df[name] = smooth(values, config.smooth_window, config.smooth_center, df["time"].values)
+        record.rows_out = df
+    return df, fit
@@ -0,0 +1,289 @@
+"""Cosmic-ray neutron (CRD) count to SWE conversion.
+
+The ratio of reference to ground detector counts is normalised by its mean
+over a snow-free (dry) window and converted with
+``SWE = AF * (ratio / target_ratio - 1)``, after out-of-range counts are
+dropped, then smoothed. ``crd_swe`` does this with one ``CRDSource``.
+
+For many sites and multi-year archives the parameters are a calibration
+table, one row per site and validity period, as in ``snowscale.recompute``::
+
+    site, valid_from[, valid_to], dry_start, dry_end[, af, target_ratio,
+    ground_min, ground_max, reference_min, reference_max]
+
+Each period is normalised by the dry window of its own row, which may lie
+before the period starts. ``convert_crd`` converts the counts of every site
+at once; ``reprocess_crd`` applies a revised table by reconverting only the
+time spans whose calibration changed, read from the TOA5 archives by time
+range, and keeps the rest of a previous result.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Mapping, Union
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIR, cached_frame
+from .config import CRDSource
+from .correction import smooth
+from .io import DATA_DIR
+from .periods import lookup, seconds, take
+from .resample import rolling_mean
+from .toa5 import read_toa5
+
+
+COUNT_COLUMNS = ("Ground_Det", "Reference_Det")
+PARAMETERS = ("af", "target_ratio", "ground_min", "ground_max", "reference_min", "reference_max")
+SINCE_EVER = pd.Timestamp("1900-01-01")   # valid_from of a calibration taken from a CRDSource
+
+
+def crd_swe(counts, source: CRDSource):
+    """Convert TOA5 CRD counts into a smoothed SWE ``reference`` series.
+
+    The Reference/Ground count ratio is normalized by its mean over the dry
+    period and converted with ``SWE = AF * (ratio / target_ratio - 1)``.
+    """
+    valid = (counts["Ground_Det"].between(*source.ground_range)
+             & counts["Reference_Det"].between(*source.reference_range))
+    crd = counts.loc[valid, ["time"]].copy()
+    raw_ratio = counts.loc[valid, "Reference_Det"] / counts.loc[valid, "Ground_Det"]
+
+    dry = (crd["time"] >= source.dry_start) & (crd["time"] <= source.dry_end)
+    normalized = raw_ratio / raw_ratio[dry].mean() * source.target_ratio
+    swe = source.af * (normalized / source.target_ratio - 1)
+    crd["reference"] = smooth(swe.to_numpy(), source.smooth_window, times=crd["time"].values)
+    return crd.reset_index(drop=True)
+
+
+def load_crd(source: CRDSource, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    path = Path(data_dir) / source.path
+    columns = list(COUNT_COLUMNS)
+    counts = cached_frame(path, lambda: read_toa5(path, columns=columns), ("toa5", columns), cache_dir)
+    if source.calibrations is None:
+        return crd_swe(counts, source)
+    table = read_crd_calibrations(Path(data_dir) / source.calibrations, source)
+    sites = table["site"].unique()
+    if source.site is not None:
+        table = table[table["site"] == str(source.site)].reset_index(drop=True)
+        if not len(table):
+            raise ValueError(f"{source.calibrations} has no calibration for site {source.site!r}")
+    elif len(sites) > 1:
+        raise ValueError(f"{source.calibrations} holds sites {', '.join(sites)}; set CRDSource.site")
+    swe = convert_crd(counts.assign(site=table["site"].iloc[0]), table, source.smooth_window)
+    return swe.drop(columns="site")
+
+
+# --- Calibration table ----------------------------------------------------------
+
+def crd_calibrations(table, source: CRDSource = CRDSource(path="")):
+    """Check and complete a CRD calibration table: defaults from ``source``, ``valid_to`` and order.
+
+    Raises ``ValueError`` for missing columns or overlapping periods of one site.
+    """
+    missing = [c for c in ("site", "valid_from", "dry_start", "dry_end") if c not in table.columns]
+    if missing:
+        raise ValueError(f"CRD calibration table is missing columns {missing}")
+    defaults = {"af": source.af, "target_ratio": source.target_ratio,
+                "ground_min": source.ground_range[0], "ground_max": source.ground_range[1],
+                "reference_min": source.reference_range[0], "reference_max": source.reference_range[1]}
+    table = table.copy()
+    table["site"] = table["site"].astype(str)
+    for column, default in defaults.items():
+        table[column] = table[column].fillna(default) if column in table.columns else default
+    for column in ("valid_from", "dry_start", "dry_end"):
+        table[column] = pd.to_datetime(table[column])
+    table = table.sort_values(["site", "valid_from"], kind="stable", ignore_index=True)
+
+    following = table.groupby("site", sort=False)["valid_from"].shift(-1)
+    if "valid_to" in table.columns:
+        table["valid_to"] = pd.to_datetime(table["valid_to"]).fillna(following)
+        overlap = (table["valid_to"] > following).to_numpy()
+        if overlap.any():
+            row = table.loc[overlap].iloc[0]
+            raise ValueError(f"CRD calibration of {row['site']} from {row['valid_from']} "
+                             f"overlaps the next one (valid to {row['valid_to']})")
+    else:
+        table["valid_to"] = following
+    return table
+
+
+def read_crd_calibrations(path, source: CRDSource = CRDSource(path=""), **kwargs):
+    """Read a CRD calibration table from CSV; ``kwargs`` go to ``pd.read_csv``."""
+    return crd_calibrations(pd.read_csv(path, **kwargs), source)
+
+
+def source_calibration(source: CRDSource, site="crd"):
+    """The one-period calibration table equivalent to ``source``."""
+    return crd_calibrations(pd.DataFrame({"site": [site], "valid_from": [SINCE_EVER],
+                                          "dry_start": [source.dry_start], "dry_end": [source.dry_end]}), source)
+
+
+# --- Conversion -------------------------------------------------------------------
+
+def _site_keys(sites, times, site_index):
+    """Codes of ``sites`` (as text) in ``site_index`` and int64 seconds, for sorting and searching."""
+    return site_index.get_indexer(np.asarray(sites).astype(str)), seconds(times)
+
+
+def _dry_means(codes, stamps, ground, reference, table, site_index):
+    """Mean count ratio of every calibration row over its dry window, within its count ranges."""
+    order = np.lexsort((stamps, codes))
+    codes, stamps, ground, reference = codes[order], stamps[order], ground[order], reference[order]
+    table_codes = site_index.get_indexer(table["site"].to_numpy())
+    means = np.full(len(table), np.nan)
+    # One slice per calibration row: there are few rows, and each looks only at its window
+    starts, ends = seconds(table["dry_start"]), seconds(table["dry_end"])
+    for k, (code, start, end) in enumerate(zip(table_codes, starts, ends)):
+        first, last = np.searchsorted(codes, code, side="left"), np.searchsorted(codes, code, side="right")
+        lo = first + np.searchsorted(stamps[first:last], start, side="left")
+        hi = first + np.searchsorted(stamps[first:last], end, side="right")
+        g, r = ground[lo:hi], reference[lo:hi]
+        row = table.iloc[k]
+        valid = ((g >= row["ground_min"]) & (g <= row["ground_max"])
+                 & (r >= row["reference_min"]) & (r <= row["reference_max"]))
+        if valid.any():
+            means[k] = (r[valid] / g[valid]).mean()
+    return means
+
+
+def convert_crd(counts, table, smooth_window: Union[int, str] = "12h", site_column="site"):
+    """SWE of the ``counts`` of every site with the calibration in effect at each record.
+
+    ``counts`` holds ``time``, ``Ground_Det``, ``Reference_Det`` and the
+    site in ``site_column``; ``table`` is a CRD calibration table. Records
+    out of their period's count ranges, or outside every period, are
+    dropped; a site without any calibration is a ``ValueError``. Returns
+    ``time``, the site and the smoothed SWE as ``reference``, sorted by
+    site and time.
+    """
+    if "valid_to" not in table.columns or "af" not in table.columns:
+        table = crd_calibrations(table)
+    missing = [c for c in ("time", site_column, *COUNT_COLUMNS) if c not in counts.columns]
+    if missing:
+        raise ValueError(f"CRD counts are missing columns {missing}")
+    site_index = pd.Index(table["site"].unique())
+    codes, stamps = _site_keys(counts[site_column], counts["time"].to_numpy(), site_index)
+    ground = counts["Ground_Det"].to_numpy(dtype=np.float64)
+    reference = counts["Reference_Det"].to_numpy(dtype=np.float64)
+    means = _dry_means(codes, stamps, ground, reference, table, site_index)
+
+    rows = lookup(counts[site_column], counts["time"].to_numpy(), table, key="site")
+    with np.errstate(invalid="ignore"):
+        valid = ((ground >= take(table, "ground_min", rows)) & (ground <= take(table, "ground_max", rows))
+                 & (reference >= take(table, "reference_min", rows))
+                 & (reference <= take(table, "reference_max", rows)))
+    ratio = reference[valid] / ground[valid]
+    rows = rows[valid]
+    target = take(table, "target_ratio", rows)
+    normalized = ratio / np.append(means, np.nan)[rows] * target
+    swe = take(table, "af", rows) * (normalized / target - 1)
+
+    out = pd.DataFrame({"time": counts["time"].to_numpy()[valid],
+                        site_column: counts[site_column].to_numpy()[valid]})
+    order = np.lexsort((stamps[valid], codes[valid]))
+    out, swe = out.iloc[order].reset_index(drop=True), swe[order]
+    if isinstance(smooth_window, int):
+        # Sample windows count records, so they are applied site by site
+        starts = np.flatnonzero(np.append(True, codes[valid][order][1:] != codes[valid][order][:-1]))
+        out["reference"] = np.concatenate([smooth(part, smooth_window) for part in np.split(swe, starts[1:])]
+                                          if len(swe) else [swe])
+    else:
+        out["reference"] = rolling_mean(out["time"].to_numpy(), swe, smooth_window, groups=codes[valid][order])
+    return out
+
+
+def read_crd_counts(paths: Mapping[str, Union[str, Path]], start=None, end=None, site_column="site"):
+    """Counts of every site's TOA5 file in ``paths`` (site -> file), stacked with a ``site_column``.
+
+    Only the records within ``start``/``end`` are parsed.
+    """
+    frames = [read_toa5(path, columns=list(COUNT_COLUMNS), start=start, end=end).assign(**{site_column: site})
+              for site, path in paths.items()]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["time", *COUNT_COLUMNS, site_column])
+
+
+# --- Recalibration ----------------------------------------------------------------
+
+def affected_spans(old, new):
+    """``site``, ``start``, ``end`` of the periods whose calibration differs between two tables.
+
+    A period is affected when a row of either table covering it was added,
+    removed or changed. ``end`` is NaT for a period that runs on.
+    """
+    old, new = crd_calibrations(old), crd_calibrations(new)
+    key = ["site", "valid_from", "valid_to", "dry_start", "dry_end", *PARAMETERS]
+    both = pd.concat([old[key].assign(_table=0), new[key].assign(_table=1)], ignore_index=True)
+    # A row present in only one of the tables, identical in every column, is a change
+    changed = ~both.duplicated(subset=key, keep=False)
+    spans = both.loc[changed, ["site", "valid_from", "valid_to"]].rename(columns={"valid_from": "start",
+                                                                                   "valid_to": "end"})
+    return spans.drop_duplicates().sort_values(["site", "start"], ignore_index=True)
+
+
+def _merge_spans(spans, margin):
+    """Per site, the union of ``spans`` widened by ``margin`` on both sides."""
+    merged = []
+    for site, group in spans.groupby("site", sort=True):
+        start = group["start"] - margin
+        end = (group["end"] + margin).fillna(pd.Timestamp.max)
+        current = None
+        for s, e in sorted(zip(start, end)):
+            if current is not None and s <= current[2]:
+                current[2] = max(current[2], e)
+            else:
+                current = [site, s, e]
+                merged.append(current)
+    return pd.DataFrame(merged, columns=["site", "start", "end"])
+
+
+def reprocess_crd(previous, old, new, paths: Mapping[str, Union[str, Path]],
+                  smooth_window: str = "12h", site_column="site"):
+    """``previous`` (a ``convert_crd`` result under table ``old``) updated to table ``new``.
+
+    Only the spans of ``affected_spans`` are reconverted, from the records of
+    those spans, the smoothing window around them and the dry windows of the
+    new calibrations, read from the TOA5 files in ``paths``. Everything else
+    is kept from ``previous``, so a recalibration of one season of one site
+    reads a season, not the archive. The result equals ``convert_crd`` of
+    the whole archive with ``new`` up to rounding.
+    """
+    if isinstance(smooth_window, int):
+        raise ValueError("Reprocessing spans needs a smoothing window in time, not samples")
+    new = crd_calibrations(new)
+    paths = {str(site): path for site, path in paths.items()}
+    margin = pd.Timedelta(smooth_window)
+    spans = affected_spans(old, new)
+    # Records change within half a window of a span, and read a further half window
+    keep_spans = _merge_spans(spans, margin / 2)
+    read_spans = _merge_spans(spans, margin)
+    if not len(read_spans):
+        return previous
+
+    parts = []
+    for site, span in read_spans.groupby("site", sort=False):
+        if site not in paths:
+            raise ValueError(f"No CRD file for site {site!r}")
+        dry = new.loc[new["site"] == site, ["dry_start", "dry_end"]].rename(columns={"dry_start": "start",
+                                                                                      "dry_end": "end"})
+        needed = _merge_spans(pd.concat([span[["start", "end"]], dry], ignore_index=True).assign(site=site),
+                              pd.Timedelta(0))
+        for start, end in zip(needed["start"], needed["end"]):
+            parts.append(read_crd_counts({site: paths[site]}, start, None if end == pd.Timestamp.max else end,
+                                         site_column))
+    counts = pd.concat(parts, ignore_index=True).drop_duplicates(subset=[site_column, "time"])
+    # A site dropped from the table leaves nothing to convert, only records to remove
+    counts = counts[counts[site_column].isin(new["site"])]
+    fresh = convert_crd(counts, new, smooth_window, site_column)
+
+    def within(frame):
+        inside = np.zeros(len(frame), dtype=bool)
+        sites = frame[site_column].astype(str)
+        for site, start, end in keep_spans.itertuples(index=False):
+            inside |= ((sites == site) & (frame["time"] >= start) & (frame["time"] <= end)).to_numpy()
+        return inside
+
+    out = pd.concat([previous[~within(previous)], fresh[within(fresh)]], ignore_index=True)
+    return out.sort_values([site_column, "time"], kind="stable", ignore_index=True)
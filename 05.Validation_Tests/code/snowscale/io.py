@@ -0,0 +1,95 @@
+"""Readers for the station data formats used in the validation tests.
+
+* CEAZAMET exports: semicolon separated CSV, one column per variable.
+* Snow Scale telemetry: ``key,value,key,value,...;`` lines (BR_IOT.csv).
+* Campbell TOA5 logger files (BR_CRD.dat).
+* Binary telemetry archives (``snowscale.archive``), with the same keys.
+
+All readers return a DataFrame with a ``time`` column of naive datetimes.
+"""
+from __future__ import annotations
+
+import dataclasses
+from pathlib import Path
+
+import pandas as pd
+
+from .archive import read_archive
+from .cache import CACHE_DIR, cached_frame
+from .catalog import StationIndex
+from .clean import clean
+from .config import ChannelCleaning, SiteConfig
+from .profiling import stage
+from .telemetry import IOT_KEYS, read_iot
+from .toa5 import read_toa5
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+
+
+def read_ceazamet(path, columns, time_format=None):
+    """Read a CEAZAMET semicolon CSV and rename ``columns`` (source -> canonical)."""
+    df = pd.read_csv(path, sep=";", usecols=list(columns))
+    df = df.rename(columns=dict(columns))
+    if time_format is None:
+        df["time"] = pd.to_datetime(df["time"], format="mixed", dayfirst=True)
+    else:
+        df["time"] = pd.to_datetime(df["time"], format=time_format)
+    return df
+
+
+def load_site(config: SiteConfig, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Load a site file into the canonical columns described in ``config``.
+
+    With a ``cache_dir`` the cleaned frame is cached; see ``snowscale.cache``.
+    The block index of a telemetry file is cached there too, so a period is
+    read without scanning the whole file even when the frame must be rebuilt.
+    """
+    path = Path(data_dir) / config.path
+    return cached_frame(path, lambda: _build_site(config, path, cache_dir), config, cache_dir)
+
+
+def _build_site(config: SiteConfig, path, cache_dir=CACHE_DIR):
+    with stage("parse") as record:
+        if config.reader == "ceazamet":
+            df = read_ceazamet(path, config.columns, config.time_format)
+        elif config.reader in ("iot", "archive"):
+            # Only the blocks or chunks within the period are parsed
+            start, end = config.period if config.period is not None else (None, None)
+            if config.reader == "archive":
+                df = read_archive(path, start, end, columns=[k for k in config.columns if k != "dt"])
+            else:
+                keys = config.iot_keys or IOT_KEYS
+                index = None if config.period is None else StationIndex([path], cache_dir, keys).blocks(path)
+                df = read_iot(path, keys=keys, start=start, end=end, index=index)
+            df = df.rename(columns={k: v for k, v in config.columns.items() if k != "dt"})
+            df = df[[c for c in config.columns.values() if c in df.columns]].sort_values("time", kind="stable")
+            df = df.reset_index(drop=True)
+        else:
+            raise ValueError(f"Unknown reader: {config.reader!r}")
+        record.rows_out = df
+
+    if config.period is not None:
+        start, end = config.period
+        df = df[(df["time"] >= start) & (df["time"] <= end)].reset_index(drop=True)
+    if config.scale_area_m2 is not None:
+        df["weight"] = df["weight"] / config.scale_area_m2
+    if config.height_offset is not None:
+        df["snow_height"] = config.height_offset - df["snow_height"]
+    rules = cleaning_rules(config)
+    if rules:
+        with stage("clean", df):
+            df = clean(df, rules)
+    return df
+
+
+def cleaning_rules(config: SiteConfig):
+    """``config.cleaning`` with the ``weight_range`` and ``height_savgol`` shorthands folded in."""
+    rules = dict(config.cleaning)
+    if config.weight_range is not None:
+        rules["weight"] = dataclasses.replace(rules.get("weight", ChannelCleaning()),
+                                              valid_range=config.weight_range)
+    if config.height_savgol is not None:
+        rules["snow_height"] = dataclasses.replace(rules.get("snow_height", ChannelCleaning()),
+                                                   savgol_window=config.height_savgol)
+    return rules
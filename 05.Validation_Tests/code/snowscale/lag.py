@@ -0,0 +1,109 @@
+"""Lag estimation between two equally sampled series.
+
+Convention: a positive ``lag`` means ``y`` follows ``x`` by ``lag`` samples,
+i.e. ``y[t]`` is compared with ``x[t - lag]``, and ``shift(x, lag)`` aligns
+``x`` onto ``y``.
+
+The correlation for every lag is computed at once with FFTs. NaNs are handled
+with masks: each lag uses exactly the pairs where both samples are valid, and
+nothing wraps around the ends of the record.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+
+def shift(values, lag, groups=None):
+    """Shift ``values`` by ``lag`` samples, filling with NaN instead of wrapping.
+
+    With ``groups`` (a label per sample) no value moves into another group.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full_like(values, np.nan)
+    if lag == 0:
+        out[:] = values
+    elif abs(lag) < len(values):
+        if lag > 0:
+            out[lag:] = values[:-lag]
+        else:
+            out[:lag] = values[-lag:]
+    if groups is not None and lag:
+        groups = np.asarray(groups)
+        src = np.arange(len(values)) - lag
+        inside = (src >= 0) & (src < len(values))
+        inside[inside] = groups[src[inside]] == groups[inside]
+        out[~inside] = np.nan
+    return out
+
+
+def _lagged_sums(a, b, lags, n_fft):
+    """``sum_t a[t - lag] * b[t]`` for every lag, given the rFFTs of ``a`` and ``b``."""
+    full = np.fft.irfft(np.conj(a) * b, n_fft)
+    return full[lags % n_fft]
+
+
+def lag_correlation(x, y, lags, min_overlap=2):
+    """Pearson correlation of ``x[t - lag]`` and ``y[t]`` for every lag in ``lags``.
+
+    Only pairs where both values are finite contribute. Lags with fewer than
+    ``min_overlap`` pairs or with a constant series over the overlap are NaN.
+    Runs in O(n log n) regardless of the number of lags.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lags = np.asarray(lags, dtype=int)
+    if x.shape != y.shape or x.ndim != 1:
+        raise ValueError("x and y must be 1-D arrays of the same length")
+    n = len(x)
+    corr = np.full(len(lags), np.nan)
+    if n == 0 or len(lags) == 0:
+        return corr
+    in_range = np.abs(lags) < n
+
+    mx = np.isfinite(x)
+    my = np.isfinite(y)
+    if not mx.any() or not my.any():
+        return corr
+    # Centering first keeps the one-pass variance below free of cancellation
+    xz = np.where(mx, x - x[mx].mean(), 0.0)
+    yz = np.where(my, y - y[my].mean(), 0.0)
+
+    n_fft = 1 << int(2 * n - 1).bit_length()
+    fx = np.fft.rfft(np.stack([mx.astype(float), xz, xz * xz]), n_fft)
+    fy = np.fft.rfft(np.stack([my.astype(float), yz, yz * yz]), n_fft)
+    lg = lags[in_range]
+    if not len(lg):
+        return corr
+    count = _lagged_sums(fx[0], fy[0], lg, n_fft)
+    sx = _lagged_sums(fx[1], fy[0], lg, n_fft)
+    sxx = _lagged_sums(fx[2], fy[0], lg, n_fft)
+    sy = _lagged_sums(fx[0], fy[1], lg, n_fft)
+    syy = _lagged_sums(fx[0], fy[2], lg, n_fft)
+    sxy = _lagged_sums(fx[1], fy[1], lg, n_fft)
+
+    count = np.rint(count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / count
+        var_x = sxx - sx * sx / count
+        var_y = syy - sy * sy / count
+        r = cov / np.sqrt(var_x * var_y)
+    # A variance that is tiny next to its own lag's sums is zero. FFT round-off
+    # adds a floor set by the whole series, the same whichever lags are asked for.
+    eps = 1e-10
+    floor_x = 1e-13 * max(float(np.dot(xz, xz)), 1.0)
+    floor_y = 1e-13 * max(float(np.dot(yz, yz)), 1.0)
+    degenerate = ((count < max(min_overlap, 2))
+                  | (var_x <= np.maximum(eps * sxx, floor_x))
+                  | (var_y <= np.maximum(eps * syy, floor_y)))
+    r[degenerate] = np.nan
+    corr[in_range] = np.clip(r, -1.0, 1.0)
+    return corr
+
+
+def best_lag(x, y, lags, min_overlap=2):
+    """Lag in ``lags`` with the highest correlation between ``x`` and ``y`` (0 if undefined)."""
+    lags = np.asarray(lags)
+    corr = lag_correlation(x, y, lags, min_overlap)
+    if np.all(np.isnan(corr)):
+        return 0
+    return int(lags[np.nanargmax(corr)])
@@ -0,0 +1,198 @@
+"""Agreement statistics between the tested scale and a reference."""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Metrics:
+    n: int
+    r2: float            # coefficient of determination of tested vs reference
+    pearson_r: float
+    rmse: float
+    mae: float
+    mape: float          # %, over reference != 0
+    bias: float          # mean(tested - reference)
+    std_diff: float
+    loa_lower: float     # bias - 1.96 std_diff
+    loa_upper: float     # bias + 1.96 std_diff
+    n_outside_loa: int
+    pct_outside_loa: float
+
+    def as_dict(self):
+        return asdict(self)
+
+
+# --- Kernel -------------------------------------------------------------------
+#
+# Every statistic is a function of nine sums over the valid pairs: the counts
+# of pairs and of non-zero references, and the sums of r, r^2, d, d^2, r*d,
+# |d| and |d / reference|, with d = tested - reference and r the reference
+# centred on its mean (which keeps the squared sums well conditioned). The
+# same terms are reduced as plain sums, per group with ``np.bincount`` or per
+# window with cumulative sums. Only the count outside the limits of agreement
+# needs the limits first, so it is a second pass over the differences alone.
+
+def _pairs(tested, reference):
+    """Differences (NaN where a pair is missing) and the reference, as float arrays."""
+    tested = np.asarray(tested, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    if tested.shape != reference.shape:
+        raise ValueError(f"tested and reference differ in shape: {tested.shape} vs {reference.shape}")
+    return tested - reference, reference
+
+
+def _sums(diff, reference, reduce):
+    """Stacked sums (9, ...) of the valid pairs ``diff``/``reference``, reduced by ``reduce``.
+
+    ``reduce(None)`` must return the pair count.
+    """
+    r = reference - (reference.mean() if len(reference) else 0.0)
+    abs_d = np.abs(diff)
+    non_zero = reference != 0
+    pct = np.divide(abs_d, np.abs(reference), out=np.zeros_like(abs_d), where=non_zero)
+    return np.stack([reduce(None), reduce(non_zero), reduce(r), reduce(r * r), reduce(diff),
+                     reduce(diff * diff), reduce(r * diff), reduce(abs_d), reduce(pct)]).astype(float)
+
+
+def _from_sums(sums):
+    """Metric arrays from stacked sums; NaN where there are fewer than 2 pairs."""
+    n, n_non_zero, s_r, s_rr, s_d, s_dd, s_rd, s_abs, s_pct = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = np.where(n >= 2, n, np.nan)
+        bias = s_d / n
+        var_d = np.maximum(s_dd / n - bias ** 2, 0)
+        std_diff = np.sqrt(var_d)
+        ss_tot = s_rr - s_r ** 2 / n
+        var_r = ss_tot / n
+        cov_rd = s_rd / n - s_r / n * bias
+        # tested = reference + d
+        var_t = np.maximum(var_r + 2 * cov_rd + var_d, 0)
+        return {
+            "n": n,
+            "r2": 1 - s_dd / ss_tot,
+            "pearson_r": (var_r + cov_rd) / np.sqrt(var_t * var_r),
+            "rmse": np.sqrt(s_dd / n),
+            "mae": s_abs / n,
+            "mape": 100 * s_pct / n_non_zero,
+            "bias": bias,
+            "std_diff": std_diff,
+            "loa_lower": bias - 1.96 * std_diff,
+            "loa_upper": bias + 1.96 * std_diff,
+        }
+
+
+def _with_outside(stats, outside):
+    stats["n_outside_loa"] = np.where(np.isnan(stats["n"]), np.nan, outside)
+    stats["pct_outside_loa"] = 100 * stats["n_outside_loa"] / stats["n"]
+    return stats
+
+
+def _table(stats, index):
+    table = pd.DataFrame(stats, index=index)[[f.name for f in fields(Metrics)]]
+    return table.astype({"n": "Int64", "n_outside_loa": "Int64"})
+
+
+# --- Public API ---------------------------------------------------------------
+
+def compute_metrics(tested, reference):
+    """Metrics and Bland-Altman limits of agreement over the pairs without NaN."""
+    diff, reference = _pairs(tested, reference)
+    valid = ~np.isnan(diff)
+    diff, reference = diff[valid], reference[valid]
+    n = len(diff)
+    if n < 2:
+        raise ValueError(f"Need at least 2 aligned samples, got {n}")
+
+    stats = _from_sums(_sums(diff, reference, lambda x: n if x is None else x.sum()))
+    outside = int(np.count_nonzero((diff < stats["loa_lower"]) | (diff > stats["loa_upper"])))
+    values = {key: float(value) for key, value in _with_outside(stats, outside).items()}
+    return Metrics(**{**values, "n": n, "n_outside_loa": outside})
+
+
+def grouped_metrics(tested, reference, groups=None):
+    """One row of metrics per group, computed without a loop over the groups.
+
+    ``groups`` labels every sample (station, day, ...). Without it, 2-D
+    ``tested``/``reference`` arrays give one group per row, e.g. several
+    stations padded with NaN to a common length. Groups with fewer than 2
+    valid pairs get NaN.
+    """
+    diff, reference = _pairs(tested, reference)
+    if groups is None:
+        if diff.ndim != 2:
+            raise ValueError("groups are required for 1-D inputs")
+        codes = np.repeat(np.arange(len(diff)), diff.shape[1])
+        labels = pd.RangeIndex(len(diff))
+    else:
+        codes, labels = pd.factorize(np.asarray(groups).ravel(), sort=True)
+        labels = pd.Index(labels, name="group")
+    diff, reference = diff.ravel(), reference.ravel()
+    if len(codes) != len(diff):
+        raise ValueError(f"{len(codes)} group labels for {len(diff)} samples")
+
+    keep = ~np.isnan(diff) & (codes >= 0)   # factorize codes NaN labels as -1
+    codes, diff, reference = codes[keep], diff[keep], reference[keep]
+    size = len(labels)
+    stats = _from_sums(_sums(diff, reference, lambda x: np.bincount(codes, weights=x, minlength=size)))
+    outside = (diff < stats["loa_lower"][codes]) | (diff > stats["loa_upper"][codes])
+    return _table(_with_outside(stats, np.bincount(codes, weights=outside, minlength=size)), labels)
+
+
+def window_metrics(tested, reference, window, step=1, block=1 << 22):
+    """Metrics over sliding windows of ``window`` samples, one every ``step`` samples.
+
+    Window sums are differences of cumulative sums, so the cost does not grow
+    with the window length; only the count outside the limits of agreement
+    looks at each window's samples, ``block`` values at a time. Rows are
+    indexed by the first sample of the window.
+    """
+    diff, reference = _pairs(tested, reference)
+    if diff.ndim != 1:
+        raise ValueError("window_metrics takes 1-D inputs")
+    if not 1 <= window <= len(diff):
+        raise ValueError(f"window must be between 1 and {len(diff)}, got {window}")
+    starts = np.arange(0, len(diff) - window + 1, step)
+
+    # Cumulative sums run over the valid pairs only; a window maps to the
+    # valid pairs before its start and before its end.
+    valid = ~np.isnan(diff)
+    before = np.concatenate([[0], np.cumsum(valid)])
+    lo, hi = before[starts], before[starts + window]
+
+    def reduce(x):
+        if x is None:
+            return hi - lo
+        cumulative = np.concatenate([[0], np.cumsum(x)])
+        return cumulative[hi] - cumulative[lo]
+
+    stats = _from_sums(_sums(diff[valid], reference[valid], reduce))
+
+    views = np.lib.stride_tricks.sliding_window_view(diff, window)
+    outside = np.empty(len(starts))
+    per_block = max(1, block // window)
+    for i in range(0, len(starts), per_block):
+        rows = slice(i, i + per_block)
+        values = views[starts[rows]]
+        outside[rows] = ((values < stats["loa_lower"][rows, None]) |
+                         (values > stats["loa_upper"][rows, None])).sum(axis=1)
+    return _table(_with_outside(stats, outside), pd.Index(starts, name="start"))
+
+
+def format_metrics(metrics: Metrics, unit="mm"):
+    return "\n".join([
+        f"Samples: {metrics.n}",
+        f"R²: {metrics.r2:.3f}",
+        f"Pearson r: {metrics.pearson_r:.3f}",
+        f"RMSE: {metrics.rmse:.2f} {unit}",
+        f"MAE: {metrics.mae:.2f} {unit}",
+        f"MAPE: {metrics.mape:.2f}%",
+        f"Bias (mean diff): {metrics.bias:.2f} {unit}",
+        f"Standard deviation of differences: {metrics.std_diff:.2f} {unit}",
+        f"Limits of agreement: [{metrics.loa_lower:.2f}, {metrics.loa_upper:.2f}] {unit}",
+        f"Points outside limits of agreement: {metrics.n_outside_loa} out of {metrics.n} "
+        f"({metrics.pct_outside_loa:.2f}%)",
+    ])
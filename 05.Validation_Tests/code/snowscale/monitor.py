@@ -0,0 +1,276 @@
+"""Rolling agreement between scales and their references, updated sample by sample.
+
+``AgreementMonitor`` tracks any number of (scale, reference) station pairs
+over trailing time windows, 7 and 30 days by default, and reports for each
+pair and window the same statistics as ``compute_metrics``: RMSE, bias,
+Bland-Altman limits of agreement and the rest::
+
+    monitor = AgreementMonitor.load("monitor.json")  # or AgreementMonitor(alerts=[DriftAlert("abs_bias", 15)])
+    for pair, time, tested, reference in new_rows:
+        for alert in monitor.update(pair, time, tested, reference):
+            notify(alert)
+    monitor.metrics()
+    monitor.save("monitor.json")
+
+Each window of each pair keeps the nine sums of ``metrics._sums``; a sample
+is added to them when it arrives and subtracted when it leaves the window,
+so an update is O(1) (amortised) however long the window. The sums are
+recomputed exactly from the kept samples whenever old samples are dropped,
+so rounding does not build up over months of streaming. The counts outside
+the limits of agreement need a pass over the window and are not tracked.
+
+A ``DriftAlert`` rule is checked on each update of a pair; ``update``
+returns an ``Alert`` when a rule becomes active and another when it clears.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import DriftAlert
+from .metrics import _from_sums
+
+
+SUM_METRICS = ("n", "r2", "pearson_r", "rmse", "mae", "mape", "bias", "std_diff", "loa_lower", "loa_upper")
+ALERT_METRICS = (*SUM_METRICS[1:], "abs_bias", "loa_width")
+COMPACT_MIN = 64     # samples dropped before a pair's buffer is compacted
+
+
+@dataclass(frozen=True)
+class Alert:
+    pair: Hashable
+    time: pd.Timestamp
+    rule: DriftAlert
+    value: float
+    active: bool         # True when the rule became active, False when it cleared
+
+
+def _terms(diff, reference, shift):
+    """The ``metrics._sums`` terms (9, n) of arrays of pairs, reference centred on ``shift``."""
+    r = reference - shift
+    abs_d = np.abs(diff)
+    non_zero = reference != 0
+    pct = np.divide(abs_d, np.abs(reference), out=np.zeros_like(abs_d), where=non_zero)
+    return np.stack([np.ones_like(diff), non_zero.astype(float), r, r * r, diff, diff * diff, r * diff,
+                     abs_d, pct])
+
+
+def _term_row(diff, reference, shift):
+    """``_terms`` of one pair, in plain floats: numpy costs more than the arithmetic here."""
+    r = reference - shift
+    return (1.0, float(reference != 0), r, r * r, diff, diff * diff, r * diff, abs(diff),
+            abs(diff) / abs(reference) if reference != 0 else 0.0)
+
+
+def _stat(stats, metric):
+    if metric == "abs_bias":
+        return abs(stats["bias"])
+    if metric == "loa_width":
+        return stats["loa_upper"] - stats["loa_lower"]
+    return stats[metric]
+
+
+def _hashable(pair):
+    """A pair read back from JSON, with the tuples that JSON turned into lists restored."""
+    return tuple(_hashable(p) for p in pair) if isinstance(pair, list) else pair
+
+
+class _Pair:
+    """Samples of one pair within the longest window, and the sums of every window."""
+    __slots__ = ("times", "diffs", "refs", "heads", "sums", "shift", "last", "active")
+
+    def __init__(self, n_windows):
+        self.times: List[int] = []
+        self.diffs: List[float] = []
+        self.refs: List[float] = []
+        self.heads = [0] * n_windows           # first sample of each window
+        self.sums = [[0.0] * 9 for _ in range(n_windows)]
+        self.shift: Optional[float] = None      # reference centre of the sums
+        self.last: Optional[int] = None
+        self.active: Dict[int, bool] = {}       # alert rule -> active
+
+    def resync(self):
+        """Drop the samples that left every window and recompute the sums exactly."""
+        drop = min(self.heads)
+        del self.times[:drop], self.diffs[:drop], self.refs[:drop]
+        self.heads = [h - drop for h in self.heads]
+        if not self.refs:
+            self.sums = [[0.0] * 9 for _ in self.heads]
+            return
+        refs = np.asarray(self.refs)
+        self.shift = float(refs.mean())
+        terms = _terms(np.asarray(self.diffs), refs, self.shift)
+        self.sums = [terms[:, h:].sum(axis=1).tolist() for h in self.heads]
+
+
+class AgreementMonitor:
+    """Trailing-window agreement metrics and drift alerts for many station pairs."""
+
+    def __init__(self, windows: Sequence[str] = ("7D", "30D"), alerts: Sequence[DriftAlert] = ()):
+        self.windows = tuple(windows)
+        self.alerts = tuple(alerts)
+        self._spans = [pd.Timedelta(w).value for w in self.windows]
+        for rule in self.alerts:
+            if rule.window not in self.windows:
+                raise ValueError(f"Alert window {rule.window!r} is not one of the monitored {self.windows}")
+            if rule.metric not in ALERT_METRICS:
+                raise ValueError(f"Unknown alert metric {rule.metric!r}")
+        self._pairs: Dict[Hashable, _Pair] = {}
+
+    @property
+    def pairs(self):
+        return list(self._pairs)
+
+    def update(self, pair: Hashable, time, tested, reference) -> List[Alert]:
+        """Add one sample of ``pair``; returns the alerts it raised or cleared.
+
+        A missing value (NaN) still moves the windows forward. Samples not
+        after the pair's latest are ignored, so replaying an overlap after a
+        restart does not count them twice.
+        """
+        stamp = pd.Timestamp(time).value
+        state = self._add(pair, stamp, float(tested), float(reference))
+        if state is None or not self.alerts:
+            return []
+        return self._transitions([(pair, state, stamp)], np.array([state.sums]))
+
+    def update_frame(self, df, pair_column="pair", chunk=1 << 14) -> List[Alert]:
+        """``update`` every row of ``df`` (``time``, ``tested``, ``reference`` and ``pair_column``) in order.
+
+        The window sums after every row are kept and the alerts of ``chunk``
+        rows checked in one vectorised pass, which is what makes replaying a
+        long history quick.
+        """
+        events = []
+        times = np.asarray(df["time"].to_numpy(), dtype="datetime64[ns]").view(np.int64).tolist()
+        pairs = df[pair_column].to_numpy().tolist()
+        tested = df["tested"].to_numpy(dtype=float).tolist()
+        reference = df["reference"].to_numpy(dtype=float).tolist()
+        for lo in range(0, len(times), chunk):
+            updated, sums = [], []
+            for row in range(lo, min(lo + chunk, len(times))):
+                state = self._add(pairs[row], times[row], tested[row], reference[row])
+                if state is not None and self.alerts:
+                    updated.append((pairs[row], state, times[row]))
+                    sums.append([x for window in state.sums for x in window])
+            if updated:
+                events.extend(self._transitions(updated, np.array(sums).reshape(len(updated), -1, 9)))
+        return events
+
+    def _add(self, pair, stamp, tested, reference):
+        """Add one sample to ``pair``'s windows; returns its state, or None if the sample was ignored."""
+        state = self._pairs.get(pair)
+        if state is None:
+            state = self._pairs[pair] = _Pair(len(self.windows))
+        if state.last is not None and stamp <= state.last:
+            return None
+        state.last = stamp
+        times, heads, sums = state.times, state.heads, state.sums
+        diff = tested - reference
+        if not math.isnan(diff):
+            if state.shift is None:
+                state.shift = reference
+            times.append(stamp)
+            state.diffs.append(diff)
+            state.refs.append(reference)
+            row = _term_row(diff, reference, state.shift)
+            for window in sums:
+                for k in range(9):
+                    window[k] += row[k]
+        # Expire what fell out of each window: (stamp - span, stamp]
+        for w, span in enumerate(self._spans):
+            h = heads[w]
+            while h < len(times) and times[h] <= stamp - span:
+                row = _term_row(state.diffs[h], state.refs[h], state.shift)
+                for k in range(9):
+                    sums[w][k] -= row[k]
+                h += 1
+            heads[w] = h
+        drop = min(heads)
+        if drop >= COMPACT_MIN and 2 * drop >= len(times):
+            state.resync()
+        return state
+
+    def _transitions(self, updated, sums):
+        """Alerts raised or cleared by ``updated`` ``(pair, state, stamp)`` samples, in order.
+
+        ``sums`` (samples, windows, 9) are the window sums after each sample.
+        """
+        stats = _from_sums(sums.reshape(-1, 9).T)
+        checks = []
+        for rule in self.alerts:
+            w = self.windows.index(rule.window)
+            values = _stat(stats, rule.metric).reshape(len(updated), -1)[:, w]
+            with np.errstate(invalid="ignore"):
+                active = (values < rule.limit) if rule.below else (values > rule.limit)
+            active &= sums[:, w, 0] >= rule.min_samples
+            checks.append((values.tolist(), active.tolist()))
+        events = []
+        for k, (pair, state, stamp) in enumerate(updated):
+            for i, (values, active) in enumerate(checks):
+                if active[k] != state.active.get(i, False):
+                    state.active[i] = active[k]
+                    events.append(Alert(pair, pd.Timestamp(stamp), self.alerts[i], values[k], active[k]))
+        return events
+
+    # --- Reports ---
+
+    def metrics(self, pairs: Optional[Sequence[Hashable]] = None):
+        """Current metrics of every pair and window, as of each pair's latest sample.
+
+        One row per (pair, window); windows with fewer than 2 pairs are NaN.
+        """
+        pairs = self.pairs if pairs is None else list(pairs)
+        sums = np.array([self._pairs[p].sums for p in pairs]).reshape(len(pairs), len(self.windows), 9)
+        stats = _from_sums(sums.reshape(-1, 9).T)
+        # Pairs may be tuples such as ("scale", "pillow"): keep them as single labels
+        pair_index = pd.Index(pairs, dtype=object, tupleize_cols=False, name="pair")
+        index = pd.MultiIndex.from_product([pair_index, pd.Index(self.windows, name="window")])
+        table = pd.DataFrame({name: stats[name] for name in SUM_METRICS}, index=index)
+        return table.astype({"n": "Int64"})
+
+    def active_alerts(self):
+        """``(pair, rule)`` of every alert now active."""
+        return [(pair, self.alerts[i]) for pair, state in self._pairs.items()
+                for i, active in sorted(state.active.items()) if active]
+
+    # --- Checkpointing ---
+
+    def to_state(self):
+        return {
+            "windows": list(self.windows),
+            "alerts": [asdict(rule) for rule in self.alerts],
+            "pairs": [{"pair": pair, "last": s.last, "times": s.times[min(s.heads):],
+                       "diffs": s.diffs[min(s.heads):], "refs": s.refs[min(s.heads):],
+                       "heads": [h - min(s.heads) for h in s.heads],
+                       "active": [i for i, a in s.active.items() if a]} for pair, s in self._pairs.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state["windows"], [DriftAlert(**rule) for rule in state["alerts"]])
+        for saved in state["pairs"]:
+            pair = obj._pairs[_hashable(saved["pair"])] = _Pair(len(obj.windows))
+            pair.last, pair.times, pair.diffs, pair.refs = saved["last"], saved["times"], saved["diffs"], saved["refs"]
+            pair.heads = saved["heads"]
+            pair.active = {i: True for i in saved["active"]}
+            pair.resync()
+        return obj
+
+    def save(self, path):
+        """Write the state atomically, so a crash mid-write keeps the previous checkpoint."""
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_state()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_state(json.loads(Path(path).read_text()))
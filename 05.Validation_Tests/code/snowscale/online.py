@@ -0,0 +1,184 @@
+"""Incremental thermal correction for live ingestion.
+
+``OnlineThermalCorrector`` applies the same dry-period model as
+``correction.fit_thermal`` one sample at a time. The fit is kept as running
+means and co-moments (Welford updates), so every ``update`` is O(1), and the
+whole state is a small JSON document that can be checkpointed and restored
+without replaying the archive::
+
+    corrector = OnlineThermalCorrector.load("tapado.json")   # or OnlineThermalCorrector(lag=1)
+    for time, weight, temp, height in new_samples:
+        corrected = corrector.update(weight, temp, height, time)
+    corrector.save("tapado.json")
+
+A negative lag (weight leading temperature) needs temperatures that have
+not arrived yet, so the corrector holds ``|lag|`` samples back and each
+``update`` returns the corrected weight of the sample ``delay`` updates
+earlier.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from .config import DryPeriod, SiteConfig
+from .correction import ThermalFit
+
+
+class OnlineThermalCorrector:
+    """Running dry-period fit of ``weight = slope * sensor_temp(t - lag) + intercept``.
+
+    A sample is dry while ``snow_height <= max_height`` (or when no height
+    is given), its weight and temperature are valid and its time falls
+    within ``start``/``end`` and ``max_days`` of the first sample. A weight
+    feeds the fit with the temperature ``lag`` samples away when every
+    sample between them is dry, as ``fit_thermal`` pairs consecutive dry
+    rows, until ``max_samples`` dry samples have been seen; after that the
+    fit is frozen. ``max_samples=None`` keeps refining it while the time
+    window lasts. Corrected weights are NaN until ``min_samples`` pairs
+    have been fitted.
+    """
+
+    def __init__(self, lag=0, max_height: Optional[float] = 10.0, max_samples: Optional[int] = 7,
+                 min_samples=2, max_days: Optional[float] = None, start=None, end=None):
+        self.lag = int(lag)
+        self.max_height = max_height
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.max_days = max_days
+        self.start = None if start is None else pd.Timestamp(start).isoformat()
+        self.end = None if end is None else pd.Timestamp(end).isoformat()
+        self.n = 0
+        self.dry_seen = 0
+        self.mean_t = 0.0
+        self.mean_w = 0.0
+        self.m2_t = 0.0
+        self.c_tw = 0.0
+        self.first_time: Optional[str] = None
+        self.last_time: Optional[str] = None
+        # (weight, temperature, dry) of the last |lag| + 1 samples, oldest first
+        self._window = deque(maxlen=abs(self.lag) + 1)
+
+    @classmethod
+    def from_config(cls, config: SiteConfig, lag=0):
+        """A corrector with ``config``'s ``DryPeriod`` rule; other rules cannot run online."""
+        rule = config.dry
+        if not isinstance(rule, DryPeriod):
+            kind = "no dry-period rule" if rule is None else f"a {type(rule).__name__} rule"
+            raise ValueError(f"{config.name} has {kind}; online correction needs a DryPeriod")
+        return cls(lag=lag, max_height=rule.max_height, max_samples=rule.first_samples,
+                   max_days=rule.first_days, start=rule.start, end=rule.end)
+
+    @property
+    def delay(self):
+        """Updates between a sample and the return of its corrected weight."""
+        return max(-self.lag, 0)
+
+    @property
+    def frozen(self):
+        return self.max_samples is not None and self.dry_seen >= self.max_samples
+
+    @property
+    def fit(self) -> Optional[ThermalFit]:
+        if self.n < self.min_samples or self.m2_t <= 0:
+            return None
+        slope = self.c_tw / self.m2_t
+        return ThermalFit(slope, self.mean_w - slope * self.mean_t, self.lag, self.n)
+
+    def _learn(self, temp, weight):
+        self.n += 1
+        dt = temp - self.mean_t
+        self.mean_t += dt / self.n
+        self.mean_w += (weight - self.mean_w) / self.n
+        self.m2_t += dt * (temp - self.mean_t)
+        self.c_tw += dt * (weight - self.mean_w)
+
+    def _in_window(self, time):
+        """Whether a sample at ``time`` (a Timestamp, or None) is within the time bounds."""
+        if time is None:
+            if self.max_days is not None or self.start is not None or self.end is not None:
+                raise ValueError("A dry rule with a time window needs the sample times")
+            return True
+        if self.start is not None and time < pd.Timestamp(self.start):
+            return False
+        if self.end is not None and time > pd.Timestamp(self.end):
+            return False
+        return self.max_days is None or time < pd.Timestamp(self.first_time) + pd.Timedelta(days=self.max_days)
+
+    def update(self, weight, sensor_temp, snow_height=None, time=None):
+        """Ingest one sample and return a thermally corrected weight (NaN if not yet fitted).
+
+        The weight returned is that of the sample ``delay`` updates earlier.
+        Samples with a ``time`` not after the last one seen are ignored, so
+        replaying an overlap after a restart does not count samples twice.
+        """
+        if time is not None:
+            time = pd.Timestamp(time)
+            stamp = time.isoformat()
+            if self.last_time is not None and stamp <= self.last_time:
+                return math.nan
+            self.last_time = stamp
+            if self.first_time is None:
+                self.first_time = stamp
+
+        weight, temp = float(weight), float(sensor_temp)
+        dry = (self._in_window(time) and not (math.isnan(temp) or math.isnan(weight))
+               and (snow_height is None or self.max_height is None or snow_height <= self.max_height))
+        # Only the first max_samples dry samples feed the fit, as dry_period takes the first rows
+        dry = dry and not self.frozen
+        self.dry_seen += dry
+        self._window.append((weight, temp, dry))
+        if len(self._window) < self._window.maxlen:
+            return math.nan
+
+        # Weight now with the temperature lag samples ago, or the weight |lag| samples ago with the temperature now
+        weight, temp = (weight, self._window[0][1]) if self.lag >= 0 else (self._window[0][0], temp)
+        if all(d for _, _, d in self._window):
+            self._learn(temp, weight)
+        fit = self.fit
+        if fit is None or math.isnan(temp):
+            return math.nan
+        return weight - (fit.slope * temp + fit.intercept)
+
+    # --- Checkpointing ---
+    def to_state(self):
+        return {
+            "lag": self.lag, "max_height": self.max_height, "max_samples": self.max_samples,
+            "min_samples": self.min_samples, "max_days": self.max_days, "start": self.start, "end": self.end,
+            "n": self.n, "dry_seen": self.dry_seen, "mean_t": self.mean_t, "mean_w": self.mean_w,
+            "m2_t": self.m2_t, "c_tw": self.c_tw, "first_time": self.first_time, "last_time": self.last_time,
+            "window": [[None if math.isnan(w) else w, None if math.isnan(t) else t, d] for w, t, d in self._window],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state["lag"], state["max_height"], state["max_samples"], state["min_samples"],
+                  state.get("max_days"), state.get("start"), state.get("end"))
+        for key in ("n", "mean_t", "mean_w", "m2_t", "c_tw", "last_time"):
+            setattr(obj, key, state[key])
+        obj.dry_seen = state.get("dry_seen", obj.n)
+        obj.first_time = state.get("first_time")
+        if "window" in state:
+            obj._window.extend((math.nan if w is None else w, math.nan if t is None else t, d)
+                               for w, t, d in state["window"])
+        else:
+            # Checkpoints from before negative lags kept only the temperatures
+            obj._window.extend((math.nan, math.nan if t is None else t, False) for t in state["temps"])
+        return obj
+
+    def save(self, path):
+        """Write the state atomically, so a crash mid-write keeps the previous checkpoint."""
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_state()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_state(json.loads(Path(path).read_text()))
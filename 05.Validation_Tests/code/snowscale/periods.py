@@ -0,0 +1,66 @@
+"""Tables of dated parameters: one row per station id and validity period.
+
+The load-cell calibrations of ``snowscale.recompute`` and the CRD
+calibrations of ``snowscale.crd`` are both such tables, completed with a
+``valid_to`` and sorted by id and ``valid_from``. ``lookup`` finds the row
+in effect for every record at once and ``take`` gathers a parameter for
+each record.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def seconds(times):
+    """datetime64 values as int64 seconds, with NaT as the int64 minimum."""
+    values = np.asarray(times, dtype="datetime64[s]")
+    return values.view(np.int64)
+
+
+def lookup(ids: pd.Series, times, table, key="id"):
+    """Row of the completed ``table`` in effect for each ``(id, time)``; -1 where none is.
+
+    Ids are compared as text with the table's ``key`` column. Raises
+    ``ValueError`` for an id with no row in the table at all; a time outside
+    every period of a known id gives -1. The table is keyed by
+    ``id code * span + seconds`` so one ``searchsorted`` matches every row,
+    whatever the order of ``times``.
+    """
+    table_id = table[key].astype(str).to_numpy()
+    table_ids = pd.Index(pd.unique(table_id))
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        # Match the categories once rather than every row (telemetry ids are categorical)
+        codes = np.append(table_ids.get_indexer(ids.cat.categories.astype(str)), -1)
+        row_code = codes[ids.cat.codes.to_numpy()]
+    else:
+        row_code = table_ids.get_indexer(np.asarray(ids).astype(str))
+    unknown = (row_code < 0) & ids.notna().to_numpy()
+    if unknown.any():
+        missing = sorted(set(np.asarray(ids)[unknown].astype(str)))
+        raise ValueError(f"No calibration for {key} {', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}")
+    table_code = table_ids.get_indexer(table_id)
+    t = seconds(times)
+    start = seconds(table["valid_from"])
+    end = seconds(table["valid_to"])
+    nat = np.iinfo(np.int64).min
+    found = (row_code >= 0) & (t != nat)
+    if not len(table) or not found.any():
+        return np.full(len(t), -1, dtype=np.int64)
+
+    lo = min(t[found].min(), start.min())
+    span = int(max(t[found].max(), start.max()) - lo) + 1
+    if len(table_ids) * span >= 2 ** 63:
+        raise ValueError("Calibration periods span too long a time to index")
+    keys = table_code * span + (start - lo)          # ascending: the table is sorted by id, valid_from
+    row_keys = np.where(found, row_code * span + (t - lo), 0)
+    pos = np.searchsorted(keys, row_keys, side="right") - 1
+    safe = np.maximum(pos, 0)
+    found &= (pos >= 0) & (table_code[safe] == row_code)
+    found &= (end[safe] == nat) | (t < end[safe])
+    return np.where(found, safe, -1)
+
+
+def take(table, column, rows):
+    """``column`` of the table for every row, NaN where ``rows`` is -1."""
+    return np.append(table[column].to_numpy(dtype=np.float64), np.nan)[rows]
@@ -0,0 +1,104 @@
+"""Validation pipeline: load -> correct -> align -> evaluate.
+
+Each stage is a plain function of a ``SiteConfig`` and the previous stage's
+output, so many stations can be processed in the same interpreter::
+
+    from snowscale import SITES, run_site
+    results = [run_site(config) for config in SITES.values()]
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .align import Source, align_sources
+from .cache import CACHE_DIR
+from .config import SiteConfig
+from .correction import ThermalFit, correct
+from .crd import load_crd
+from .io import DATA_DIR, load_site
+from .lag import best_lag, shift
+from .metrics import Metrics, compute_metrics
+from .profiling import stage
+
+
+@dataclass
+class SiteResult:
+    config: SiteConfig
+    frame: pd.DataFrame      # canonical site data with the ``corrected`` column
+    aligned: pd.DataFrame    # time, tested, reference, snow_height
+    thermal: Optional[Union[ThermalFit, pd.DataFrame]]   # per-interval fits with DryDetection
+    lag: int                 # shift applied to the tested series to match the reference
+    metrics: Metrics
+
+
+def load(config: SiteConfig, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Site data in canonical columns, with ``reference`` merged in for external sources."""
+    with stage("read") as record:
+        df = load_site(config, data_dir, cache_dir)
+        record.rows_out = df
+    if config.reference is not None:
+        with stage("read_reference") as record:
+            ref = load_crd(config.reference, data_dir, cache_dir)
+            record.rows_out = ref
+        with stage("merge_reference", df) as record:
+            source = Source("reference", ("reference",), config.reference.tolerance, config.reference.lag)
+            df, _ = align_sources(df, {"reference": ref}, [source])
+            record.rows_out = df
+    return df
+
+
+def align(df, config: SiteConfig):
+    """Pair the corrected scale series with the reference.
+
+    Applies the best lag in ``config.reference_lags`` and, if requested, a linear
+    calibration of the scale onto the reference. Returns the aligned frame
+    without NaN and the lag.
+    """
+    tested = df["corrected"].values
+    reference = df["reference"].values
+    with stage("lag_search", df):
+        lag = best_lag(tested, reference, config.reference_lags)
+    tested = shift(tested, lag)
+
+    valid = ~(np.isnan(tested) | np.isnan(reference) | df["snow_height"].isna().values)
+    if config.calibrate:
+        slope, intercept = np.polyfit(tested[valid], reference[valid], 1)
+        tested = slope * tested + intercept
+
+    aligned = pd.DataFrame({
+        "time": df["time"].values,
+        "tested": tested,
+        "reference": reference,
+        "snow_height": df["snow_height"].values,
+    })
+    return aligned[valid].reset_index(drop=True), lag
+
+
+def evaluate(aligned):
+    return compute_metrics(aligned["tested"].values, aligned["reference"].values)
+
+
+def run_site(config: SiteConfig, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Run every stage for one site.
+
+    Each stage is recorded by an active ``profiling.Profiler``, under the
+    site's name.
+    """
+    with stage("site", station=config.name) as site:
+        with stage("load") as record:
+            df = load(config, data_dir, cache_dir)
+            record.rows_out = df
+        with stage("correct", df) as record:
+            df, fit = correct(df, config)
+            record.rows_out = df
+        with stage("align", df) as record:
+            aligned, lag = align(df, config)
+            record.rows_out = aligned
+        with stage("evaluate", aligned):
+            metrics = evaluate(aligned)
+        site.rows_out = aligned
+    return SiteResult(config, df, aligned, fit, lag, metrics)
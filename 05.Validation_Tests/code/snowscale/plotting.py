@@ -0,0 +1,140 @@
+"""Figures for a ``SiteResult``. matplotlib is only imported when plotting.
+
+Figures are built with ``matplotlib.figure.Figure`` directly rather than
+pyplot, so rendering needs no display, never blocks and is safe in worker
+processes. Long time series are reduced with ``minmax_decimate`` before
+drawing, which keeps every local extreme visible at a fraction of the cost.
+"""
+from __future__ import annotations
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import SiteConfig
+from .metrics import Metrics
+
+
+MAX_POINTS = 4000
+
+
+@dataclass
+class PlotData:
+    """The part of a ``SiteResult`` needed to draw it, cheap to send to a worker."""
+    config: SiteConfig
+    aligned: pd.DataFrame
+    metrics: Metrics
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(result.config, result.aligned, result.metrics)
+
+
+def minmax_decimate(*series, max_points=MAX_POINTS):
+    """Indices keeping the first, last, min and max sample of each bucket of ``series``.
+
+    All arrays in ``series`` have the same length and the extremes of each are
+    kept, so peaks survive in every line drawn. Returns every index when no
+    reduction is needed.
+    """
+    n = len(series[0])
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    per_bucket = 2 + 2 * len(series)
+    size = -(-n * per_bucket // max_points)
+    n_full = n // size
+    starts = np.arange(0, n, size)
+    keep = [starts, np.minimum(starts + size - 1, n - 1)]
+    for values in series:
+        values = np.asarray(values, dtype=float)
+        missing = np.isnan(values)
+        for filled, pick in ((np.where(missing, np.inf, values), np.argmin),
+                             (np.where(missing, -np.inf, values), np.argmax)):
+            keep.append(starts[:n_full] + pick(filled[:n_full * size].reshape(n_full, size), axis=1))
+            if n_full * size < n:
+                keep.append([n_full * size + pick(filled[n_full * size:])])
+    return np.unique(np.concatenate(keep))
+
+
+def _figure(**kwargs):
+    from matplotlib.figure import Figure
+    return Figure(**kwargs)
+
+
+def plot_timeseries(result, path=None, max_points=MAX_POINTS, dpi=300):
+    """Snow height (top) and tested vs reference SWE (bottom)."""
+    aligned = result.aligned
+    idx = minmax_decimate(aligned["snow_height"], aligned["tested"], aligned["reference"],
+                          max_points=max_points)
+    aligned = aligned.iloc[idx]
+
+    fig = _figure(figsize=(14, 10))
+    axs = fig.subplots(2, 1, sharex=True)
+
+    axs[0].plot(aligned["time"], aligned["snow_height"], label="Snow Height [cm]", color="purple", alpha=0.8)
+    axs[0].set_xlabel("Date")
+    axs[0].set_ylabel("Snow Height [cm]")
+    axs[0].legend()
+    axs[0].grid(True)
+
+    axs[1].plot(aligned["time"], aligned["tested"], label="Snow Scale (Tested)", color="blue", alpha=0.9)
+    axs[1].plot(aligned["time"], aligned["reference"], label="Reference", color="orange", alpha=0.7)
+    axs[1].set_ylabel("SWE [mm]")
+    axs[1].legend()
+    axs[1].grid(True)
+
+    fig.suptitle(f"Aligned Time Series: SWE and Snow Height - {result.config.name}")
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path, format="png", dpi=dpi, bbox_inches="tight")
+    return fig
+
+
+def plot_bland_altman(result, path=None, dpi=300):
+    """Bland-Altman plot of tested - reference against their mean."""
+    aligned = result.aligned
+    m = result.metrics
+    means = (aligned["tested"] + aligned["reference"]) / 2
+    diff = aligned["tested"] - aligned["reference"]
+
+    fig = _figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.scatter(means, diff, alpha=0.5, rasterized=True)
+    ax.axhline(m.bias, color="red", linestyle="--", label=f"Mean: {m.bias:.2f} mm")
+    ax.axhline(m.loa_upper, color="green", linestyle="--", label=f"Upper LoA: {m.loa_upper:.2f} mm")
+    ax.axhline(m.loa_lower, color="green", linestyle="--", label=f"Lower LoA: {m.loa_lower:.2f} mm")
+    ax.set_xlabel("Average of Measurements (mm)")
+    ax.set_ylabel("Difference (Tested - Reference) (mm)")
+    ax.set_title(f"Bland-Altman Plot - {result.config.name}")
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path, format="png", dpi=dpi, bbox_inches="tight")
+    return fig
+
+
+def render(result, out_dir, stem, max_points=MAX_POINTS, dpi=300):
+    """Save ``<stem>_Fig_1.png`` (time series) and ``<stem>_Fig_2.png`` (Bland-Altman)."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = [out_dir / f"{stem}_Fig_1.png", out_dir / f"{stem}_Fig_2.png"]
+    plot_timeseries(result, paths[0], max_points, dpi)
+    plot_bland_altman(result, paths[1], dpi)
+    return paths
+
+
+def render_many(items, out_dir, workers: Optional[int] = None, max_points=MAX_POINTS, dpi=300):
+    """Render ``(stem, PlotData)`` pairs in a process pool; returns the written paths."""
+    items = [(stem, data if isinstance(data, PlotData) else PlotData.from_result(data)) for stem, data in items]
+    stems = [stem for stem, _ in items]
+    data = [d for _, d in items]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        paths = pool.map(render, data, itertools.repeat(out_dir), stems,
+                         itertools.repeat(max_points), itertools.repeat(dpi))
+        return [p for pair in paths for p in pair]
@@ -0,0 +1,426 @@
+"""Asynchronous poller for Snow Scales daisy-chained on an RS485 bus.
+
+``BusPoller`` sends the firmware's read commands (``snowscale.protocol``)
+to each scale ID in turn and turns the replies into rows in the pipeline's
+canonical columns (``time``, ``id``, ``weight``, ``sensor_temp`` plus the
+per-cell values). The rows can be collected with ``readings_frame`` or
+appended to a key/value telemetry file that ``load_site`` reads with
+``reader="iot"``.
+
+Replies carry no address, so a bus has one request in flight at a time. The
+next frame goes out as soon as the previous reply line is complete, with no
+fixed pause in between. Each request's deadline comes from the firmware's
+timing at the bus baud rate. It includes the pause every scale takes after
+reading a frame and the pause the addressed scale takes after answering, so a
+scale asked again too soon is not counted as missing. Timeouts and malformed
+replies are retried. Separate buses run concurrently with ``poll_buses``::
+
+    python -m snowscale.poller --bus /dev/ttyUSB0=141,142 --interval 600 --out scales.csv
+
+Serial ports are opened with ``termios`` (POSIX only, no pyserial). A pty
+works too, which is how the poller is exercised against the simulator.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import os
+import warnings
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from .protocol import (BROADCAST_ID, BROADCAST_JITTER, COMMAND_GAP, DEFAULT_BAUD, REPLY_LINES, RX_SETTLE,
+                       ProtocolError, byte_time, frame, frame_fits, parse_reply, reply_time)
+
+
+POLL_COMMANDS = ("GET_W4X", "GET_T")
+FIELDS = {
+    "GET_W": ("weight",),
+    "GET_W4X": ("cell_1", "cell_2", "cell_3", "cell_4", "weight"),
+    "GET_T": ("sensor_temp",),
+    "GET_RAW": ("raw_1", "raw_2", "raw_3", "raw_4"),
+}
+
+
+def poll_fields(commands: Sequence[str] = POLL_COMMANDS):
+    """Value columns filled by ``commands``, in order."""
+    return tuple(dict.fromkeys(f for command in commands for f in FIELDS[command]))
+
+
+def iot_keys(commands: Sequence[str] = POLL_COMMANDS):
+    """Telemetry keys of the lines written for ``commands`` (``SiteConfig.iot_keys``)."""
+    return ("id", "dt") + poll_fields(commands)
+
+
+# --- Serial link --------------------------------------------------------------
+
+class SerialLink(asyncio.Protocol):
+    """Line-oriented reads and writes on a serial device or pty."""
+
+    def __init__(self):
+        self.writer: Optional[asyncio.WriteTransport] = None
+        self._reader: Optional[asyncio.ReadTransport] = None
+        self._buffer = bytearray()
+        self._lines = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._closed = False
+
+    def connection_made(self, transport):
+        self._reader = transport
+
+    def data_received(self, data):
+        self._buffer += data
+        end = self._buffer.find(b"\n")
+        while end >= 0:
+            self._lines.append(bytes(self._buffer[:end + 1]))
+            del self._buffer[:end + 1]
+            end = self._buffer.find(b"\n")
+        self._wake()
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def readline(self) -> bytes:
+        while not self._lines:
+            if self._closed:
+                raise ConnectionError("Serial link closed")
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+        return self._lines.popleft()
+
+    def discard(self):
+        """Drop everything received and not yet read (late or stray replies)."""
+        self._buffer.clear()
+        self._lines.clear()
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def close(self):
+        for transport in (self.writer, self._reader):
+            if transport is not None:
+                transport.close()
+
+
+async def open_serial(path, baud=DEFAULT_BAUD) -> SerialLink:
+    """Open ``path`` raw, 8N1 at ``baud``, as a ``SerialLink``."""
+    import termios
+    import tty
+
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[4] = attrs[5] = getattr(termios, f"B{baud}")
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except Exception:
+        os.close(fd)
+        raise
+    loop = asyncio.get_running_loop()
+    link = SerialLink()
+    await loop.connect_read_pipe(lambda: link, os.fdopen(fd, "rb", buffering=0))
+    link.writer, _ = await loop.connect_write_pipe(asyncio.Protocol, os.fdopen(os.dup(fd), "wb", buffering=0))
+    return link
+
+
+# --- Poller -------------------------------------------------------------------
+
+@dataclass
+class BusStats:
+    requests: int = 0
+    replies: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    bad_replies: int = 0
+    failures: int = 0              # commands given up after all retries
+    last_error: Optional[str] = None
+
+
+class BusPoller:
+    """Polls ``scale_ids`` on one bus with ``commands`` (see ``FIELDS``).
+
+    ``smpl_avg`` and ``tx_delay_ms`` are the scales' ``SET_SMPL_AVG`` and
+    ``SET_TXD`` settings, which lengthen every reply. Changes made through
+    ``request`` are tracked per scale.
+    """
+
+    def __init__(self, link: SerialLink, scale_ids: Iterable[int], baud=DEFAULT_BAUD,
+                 commands: Sequence[str] = POLL_COMMANDS, retries=2, smpl_avg=1, tx_delay_ms=0, margin=0.2):
+        self.link = link
+        self.scale_ids = [int(i) for i in scale_ids]
+        self.baud = baud
+        self.commands = tuple(c.upper() for c in commands)
+        self.fields = poll_fields(self.commands)
+        self.retries = retries
+        self.smpl_avg = smpl_avg
+        self.tx_delay_ms = tx_delay_ms
+        self.margin = margin
+        self.stats = BusStats()
+        self._lock = asyncio.Lock()
+        self._bus_ready = 0.0          # loop time when every scale reads the bus again
+        self._ready = {}               # scale id -> loop time it reads again after answering
+        self._settings = {}            # scale id -> settings changed through this poller
+        longest = max((len(frame(i, c)) for i in self.scale_ids for c in self.commands), default=0)
+        if longest and not frame_fits(longest, baud):
+            warnings.warn(f"{longest}-byte frames do not reach the firmware within its {RX_SETTLE * 1000:.0f} ms "
+                          f"read window at {baud} baud; those commands will time out", stacklevel=2)
+
+    @classmethod
+    async def open(cls, path, scale_ids, baud=DEFAULT_BAUD, **kwargs):
+        return cls(await open_serial(path, baud), scale_ids, baud, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.link.close()
+
+    def _timeout(self, scale_id, command, n_bytes, now):
+        waiting = max(self._bus_ready, self._ready.get(scale_id, 0.0)) - now
+        settings = self._settings.get(scale_id, {})
+        return (max(waiting, 0.0) + self.margin
+                + reply_time(command, self.baud, settings.get("SET_SMPL_AVG", self.smpl_avg),
+                             settings.get("SET_TXD", self.tx_delay_ms), n_bytes))
+
+    async def request(self, scale_id, command, par=None, parse=None):
+        """Reply to one command, retried on a timeout or when ``parse`` raises ``ProtocolError``.
+
+        Returns the reply (its lines joined by newlines when the command
+        answers with several, see ``REPLY_LINES``), or ``parse(reply)``.
+        Raises ``TimeoutError`` or ``ProtocolError`` once the retries are
+        used up.
+        """
+        data = frame(scale_id, command, par)
+        n_lines = REPLY_LINES.get(command.upper(), 1)
+        loop = asyncio.get_running_loop()
+        error: Exception = TimeoutError()
+        async with self._lock:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.stats.retries += 1
+                self.link.discard()
+                self.link.write(data)
+                self.stats.requests += 1
+                now = loop.time()
+                timeout = self._timeout(scale_id, command, len(data), now)
+                # Every scale reads the frame, then pauses before reading again
+                self._bus_ready = (max(self._bus_ready, now + byte_time(len(data), self.baud))
+                                   + RX_SETTLE + COMMAND_GAP)
+                try:
+                    reply = await asyncio.wait_for(self._readlines(n_lines), timeout)
+                except asyncio.TimeoutError:
+                    self.stats.timeouts += 1
+                    error = TimeoutError(f"No reply from scale {scale_id} to {command} within {timeout:.2f} s")
+                    continue
+                self._ready[scale_id] = loop.time() + COMMAND_GAP
+                self.stats.replies += 1
+                if command.upper() in ("SET_SMPL_AVG", "SET_TXD") and reply == "OK":
+                    # Later deadlines for this scale depend on the new setting
+                    self._settings.setdefault(scale_id, {})[command.upper()] = int(float(par))
+                if parse is None:
+                    return reply
+                try:
+                    return parse(reply)
+                except ProtocolError as exc:
+                    self.stats.bad_replies += 1
+                    error = exc
+        self.stats.failures += 1
+        self.stats.last_error = str(error)
+        raise error
+
+    async def _readlines(self, n):
+        lines = [await self.link.readline() for _ in range(n)]
+        return "\n".join(line.decode("ascii", errors="replace").strip() for line in lines)
+
+    async def get_config(self, scale_id):
+        """``GET_CONFIG`` as a dict of its numbered parameters, e.g. ``{"RS-485 ID": "141", ...}``."""
+        reply = await self.request(scale_id, "GET_CONFIG")
+        config = {}
+        for line in reply.splitlines():
+            number, _, rest = line.partition(",")
+            if number.isdigit():
+                label, _, value = rest.partition(",")
+                config[label.strip()] = value
+        return config
+
+    async def read(self, scale_id, command):
+        """Numbers returned by a read command (``GET_W``, ``GET_W4X``, ``GET_T``, ``GET_RAW``)."""
+        command = command.upper()
+        return await self.request(scale_id, command, parse=lambda line: parse_reply(command, line))
+
+    async def poll_scale(self, scale_id):
+        """One row for ``scale_id``; values of failed commands are NaN."""
+        row = {"time": None, "id": int(scale_id), **dict.fromkeys(self.fields, math.nan)}
+        for command in self.commands:
+            try:
+                values = await self.read(scale_id, command)
+            except (TimeoutError, ProtocolError):
+                continue
+            row.update(zip(FIELDS[command], values))
+            if row["time"] is None:
+                row["time"] = _utcnow()
+        if row["time"] is None:
+            row["time"] = _utcnow()
+        return row
+
+    async def poll(self) -> List[dict]:
+        """One row per scale."""
+        return [await self.poll_scale(scale_id) for scale_id in self.scale_ids]
+
+    async def stream(self, interval: Optional[float] = None, cycles: Optional[int] = None) -> AsyncIterator[dict]:
+        """Rows for every scale, one cycle every ``interval`` seconds (back to back when None).
+
+        A cycle that overruns the interval skips the slots it missed instead
+        of bursting to catch up.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        done = 0
+        while cycles is None or done < cycles:
+            for scale_id in self.scale_ids:
+                yield await self.poll_scale(scale_id)
+            done += 1
+            if interval is not None and (cycles is None or done < cycles):
+                elapsed = loop.time() - start
+                await asyncio.sleep(math.ceil(elapsed / interval + 1e-9) * interval - elapsed)
+
+    async def discover(self, window=BROADCAST_JITTER + 0.5):
+        """IDs answering a broadcast ``AT`` within ``window`` seconds.
+
+        Each scale answers after a random delay of up to one second, so
+        replies on a crowded bus can still collide; garbled lines are
+        ignored.
+        """
+        loop = asyncio.get_running_loop()
+        found = set()
+        async with self._lock:
+            self.link.discard()
+            self.link.write(frame(BROADCAST_ID, "AT"))
+            end = loop.time() + window
+            while (left := end - loop.time()) > 0:
+                try:
+                    line = await asyncio.wait_for(self.link.readline(), left)
+                except asyncio.TimeoutError:
+                    break
+                text = line.decode("ascii", errors="replace").strip()
+                if text.isdigit() and int(text) < BROADCAST_ID:
+                    found.add(int(text))
+            self._bus_ready = loop.time() + COMMAND_GAP
+        return sorted(found)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def poll_buses(pollers: Sequence[BusPoller], interval: Optional[float] = None,
+                     cycles: Optional[int] = None) -> AsyncIterator[dict]:
+    """Rows from several buses polled concurrently, in arrival order."""
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump(poller):
+        try:
+            async for row in poller.stream(interval, cycles):
+                await queue.put(row)
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.ensure_future(pump(p)) for p in pollers]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            row = await queue.get()
+            if row is done:
+                remaining -= 1
+            else:
+                yield row
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# --- Output -------------------------------------------------------------------
+
+def readings_frame(rows: Iterable[dict], commands: Sequence[str] = POLL_COMMANDS):
+    """Rows as a DataFrame in the pipeline's column names."""
+    columns = ["time", "id", *poll_fields(commands)]
+    df = pd.DataFrame(list(rows), columns=columns)
+    df["time"] = pd.to_datetime(df["time"])
+    return df
+
+
+def iot_line(row, fields: Sequence[str]):
+    """``row`` as a key/value telemetry record (see ``snowscale.telemetry``)."""
+    values = ",".join(f"{key},{_format(row[key])}" for key in fields)
+    return f"id,{row['id']},dt,{row['time']:%Y-%m-%dT%H:%M:%S}Z,{values};\n"
+
+
+def _format(value):
+    return "nan" if value is None or value != value else f"{value:.6g}"
+
+
+# --- Command line ---------------------------------------------------------------
+
+def _parse_bus(text):
+    path, _, ids = text.rpartition("=")
+    if not path or not ids:
+        raise argparse.ArgumentTypeError(f"expected PATH=ID[,ID...], got {text!r}")
+    return path, [int(i) for i in ids.split(",")]
+
+
+async def _poll_to_file(args):
+    pollers = [await BusPoller.open(path, ids, args.baud, commands=args.commands, retries=args.retries,
+                                    smpl_avg=args.smpl_avg)
+               for path, ids in args.bus]
+    fields = poll_fields(args.commands)
+    try:
+        with open(args.out, "a") as out:
+            async for row in poll_buses(pollers, args.interval, args.cycles):
+                out.write(iot_line(row, fields))
+                out.flush()
+    finally:
+        for poller in pollers:
+            poller.close()
+    return pollers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll Snow Scales on RS485 buses into a telemetry file.")
+    parser.add_argument("--bus", type=_parse_bus, action="append", required=True,
+                        help="serial device and scale ids, e.g. /dev/ttyUSB0=141,142 (repeatable)")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--commands", nargs="+", default=list(POLL_COMMANDS), choices=list(FIELDS))
+    parser.add_argument("--interval", type=float, default=None, help="seconds between cycles")
+    parser.add_argument("--cycles", type=int, default=None)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--smpl-avg", type=int, default=1, help="the scales' SET_SMPL_AVG setting")
+    parser.add_argument("--out", default="scales.csv")
+    args = parser.parse_args(argv)
+
+    try:
+        pollers = asyncio.run(_poll_to_file(args))
+    except KeyboardInterrupt:
+        return 0
+    for (path, _), poller in zip(args.bus, pollers):
+        print(f"{path}: {poller.stats}")
+    return 1 if any(p.stats.failures for p in pollers) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
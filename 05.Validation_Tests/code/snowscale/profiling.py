@@ -0,0 +1,220 @@
+"""Per-stage timing, memory and profiling hooks for the pipeline.
+
+The pipeline stages (``run_site`` and the steps inside load, correct, align
+and evaluate) are wrapped in ``stage(...)`` blocks. They cost one context
+variable lookup when nothing is listening. Inside ``Profiler.activate()``
+every block is recorded with its wall and CPU time, rows in and out, and
+peak traced memory, keyed by the station of the enclosing ``site`` stage::
+
+    profiler = Profiler(cprofile=["lag_search"])
+    with profiler.activate():
+        run_site(SITES["tapado"])
+    profiler.to_frame()
+    profiler.write_chrome_trace("trace.json")   # chrome://tracing or ui.perfetto.dev
+
+Stages named in ``cprofile`` (or all, with ``cprofile=True``) also run
+under ``cProfile``. Their statistics are kept with the record and can be
+dumped as ``.prof`` files for snakeviz or pstats. Peak memory comes from
+``tracemalloc``, which numpy and pandas report their buffers to. It slows
+Python-heavy code, so it can be turned off with ``memory=False``.
+"""
+from __future__ import annotations
+
+import contextvars
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional, Union
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    import pstats
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    station: Optional[str]
+    depth: int                  # 0 for top-level stages
+    start: float                # epoch seconds, so records of several processes line up
+    wall: float = 0.0           # seconds
+    cpu: float = 0.0            # process CPU seconds
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    peak_memory: Optional[int] = None   # bytes allocated above the stage's start, at its peak
+    pid: int = field(default_factory=os.getpid)
+    thread: int = field(default_factory=threading.get_ident)
+    profile: Optional[pstats.Stats] = field(default=None, repr=False)
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "profile"}
+
+
+class _Ignored:
+    """Stand-in record while no profiler is active; attributes set on it are dropped."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_IGNORED = _Ignored()
+_active: contextvars.ContextVar[Optional["Profiler"]] = contextvars.ContextVar("snowscale_profiler", default=None)
+
+
+def _rows(value):
+    return None if value is None else int(value) if isinstance(value, int) else len(value)
+
+
+@contextmanager
+def stage(name, rows_in=None, station: Optional[str] = None):
+    """Record the enclosed block as stage ``name`` of the active profiler, if there is one.
+
+    ``rows_in`` is a row count or anything with a length. Set ``rows_out``
+    on the yielded record. ``station`` defaults to that of the enclosing
+    stage.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield _IGNORED
+        return
+    with profiler._stage(name, rows_in, station) as record:
+        yield record
+
+
+class Profiler:
+    """Collects a ``StageRecord`` for every ``stage`` run while it is active."""
+
+    def __init__(self, memory: bool = True, cprofile: Union[bool, Iterable[str]] = False):
+        self.memory = memory
+        self.cprofile = cprofile if isinstance(cprofile, bool) else frozenset(cprofile)
+        self.records: List[StageRecord] = []
+        self._stack: List[StageRecord] = []
+        self._peaks: List[int] = []      # highest traced memory seen by each open stage
+        self._profiling = False
+
+    @contextmanager
+    def activate(self):
+        """Record the stages run in this context (and the asyncio tasks it starts)."""
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            if started:
+                tracemalloc.stop()
+
+    def _wants_profile(self, name):
+        return self.cprofile is True or (self.cprofile is not False and name in self.cprofile)
+
+    @contextmanager
+    def _stage(self, name, rows_in, station):
+        if station is None and self._stack:
+            station = self._stack[-1].station
+        record = StageRecord(name, station, len(self._stack), time.time(), rows_in=_rows(rows_in))
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # Fold the peak so far into the open stages before resetting it for this one
+            self._peaks = [max(p, peak) for p in self._peaks]
+            tracemalloc.reset_peak()
+            base = current
+        profile = None
+        if self._wants_profile(name) and not self._profiling:
+            import cProfile   # only loaded when asked for, as pstats is slow to import
+            profile, self._profiling = cProfile.Profile(), True
+        self._stack.append(record)
+        self._peaks.append(0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                import pstats
+                record.profile = pstats.Stats(profile)
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            self._stack.pop()
+            peak = self._peaks.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record.peak_memory = max(peak - base, 0)
+                self._peaks = [max(p, peak) for p in self._peaks]
+            record.rows_out = _rows(record.rows_out)
+            self.records.append(record)
+
+    # --- Export --------------------------------------------------------------------
+
+    def to_frame(self):
+        """One row per recorded stage, in the order the stages finished."""
+        columns = [f.name for f in fields(StageRecord) if f.name != "profile"]
+        return pd.DataFrame([r.as_dict() for r in self.records], columns=columns)
+
+    def summary(self):
+        """Total wall and CPU time, calls and largest peak memory per station and stage."""
+        return (self.to_frame().groupby(["station", "stage"], dropna=False, sort=False)
+                .agg(calls=("wall", "size"), wall=("wall", "sum"), cpu=("cpu", "sum"),
+                     peak_memory=("peak_memory", "max")))
+
+    def write_json(self, path):
+        Path(path).write_text(json.dumps([r.as_dict() for r in self.records], indent=1))
+
+    def write_chrome_trace(self, path):
+        """Write the stages in the Chrome trace event format, one complete event each."""
+        Path(path).write_text(json.dumps(chrome_trace(r.as_dict() for r in self.records)))
+
+    def profiles(self):
+        """The cProfile statistics recorded: ``(record, pstats.Stats)`` pairs."""
+        return [(r, r.profile) for r in self.records if r.profile is not None]
+
+    def write_profiles(self, directory, prefix=""):
+        """Dump every cProfile run as ``<prefix><station>_<stage>_<n>.prof``; returns the paths."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for i, (record, stats) in enumerate(self.profiles()):
+            station = (record.station or "all").replace(" ", "_")
+            paths.append(directory / f"{prefix}{station}_{record.stage}_{i}.prof")
+            stats.dump_stats(paths[-1])
+        return paths
+
+    def profile_text(self, limit=20, sort="cumulative"):
+        """The top ``limit`` functions of every cProfile run, as text."""
+        out = io.StringIO()
+        for record, stats in self.profiles():
+            out.write(f"--- {record.station or ''} {record.stage} ---\n")
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def chrome_trace(records: Iterable[dict]):
+    """Trace-event JSON object for stage records (dicts as from ``StageRecord.as_dict``).
+
+    Records from several processes keep their ``pid``, so a process pool
+    shows one lane per worker.
+    """
+    records = list(records)
+    origin = min((r["start"] for r in records), default=0.0)
+    events = []
+    for r in records:
+        args = {k: r[k] for k in ("job", "station", "rows_in", "rows_out", "cpu", "peak_memory")
+                if r.get(k) is not None}
+        events.append({"name": r["stage"], "cat": r["station"] or "pipeline", "ph": "X",
+                       "ts": (r["start"] - origin) * 1e6, "dur": r["wall"] * 1e6, "pid": r["pid"], "tid": r["thread"],
+                       "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,144 @@
+"""The RS485 command protocol of the PESA_4CELL firmware (02.Firmware, cmd.h/com.h).
+
+A command is one frame of printable ASCII, ``<id,CMD>`` or ``<id,CMD,par>``,
+of at most 128 bytes. The scale with that ``id`` answers with one line ending
+in ``\\n``. Replies carry no address, so a bus can only have one request in
+flight. Every scale reads every frame and then ignores the serial port for
+``COMMAND_GAP``, whether it was addressed or not.
+
+The timing constants below are the firmware's own delays. ``reply_time``
+combines them into the time a command takes at a given baud rate, and the
+poller derives its deadlines from it.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Tuple
+
+
+BROADCAST_ID = 255
+DEFAULT_ID = 141
+MAX_FRAME = 128                 # bytes read per command, '<' included
+BAUD_RATES = (1200, 2400, 4800, 9600, 19200)
+DEFAULT_BAUD = 9600
+BITS_PER_BYTE = 10              # 8N1
+
+# --- Firmware timing (seconds) ----------------------------------------------
+
+RX_SETTLE = 0.05                # delay(50) after the first byte, before reading the frame
+READ_TIMEOUT = 0.1              # Serial.setTimeout(100)
+TX_ENABLE = 0.05                # delay(50) after enabling the RS485 driver
+COMMAND_GAP = 0.5               # delay(500) after every frame
+BROADCAST_JITTER = 1.0          # random(0, 1000) ms before answering id 255
+HX711_PERIOD = 0.1              # one conversion at 10 samples/s
+DS18B20_CONVERSION = 0.1875     # 10-bit resolution
+
+DISCONNECTED_C = -127.0         # DallasTemperature's DEVICE_DISCONNECTED_C
+
+# Numbers in a reply to each read command
+READ_COMMANDS = {"GET_W": 1, "GET_W4X": 5, "GET_T": 1, "GET_RAW": 4}
+# Longest reply (without newlines) used for timing
+REPLY_BYTES = {"GET_W": 12, "GET_W4X": 64, "GET_T": 8, "GET_RAW": 48, "GET_CONFIG": 420}
+# Lines in a reply, each sent after its own driver-enable delay
+REPLY_LINES = {"GET_CONFIG": 16, "TARE_ON": 2}
+
+
+class ProtocolError(ValueError):
+    """A frame or reply that does not follow the protocol."""
+
+
+def frame(scale_id, command, par=None) -> bytes:
+    """The bytes of ``<scale_id,command[,par]>``."""
+    if not 0 <= int(scale_id) <= BROADCAST_ID:
+        raise ProtocolError(f"Scale id must be 0-{BROADCAST_ID}, got {scale_id}")
+    text = f"<{int(scale_id)},{command}" + ("" if par is None else f",{par}") + ">"
+    data = text.encode("ascii")
+    if len(data) > MAX_FRAME:
+        raise ProtocolError(f"Frame is {len(data)} bytes, the firmware reads at most {MAX_FRAME}")
+    return data
+
+
+def parse_frame(text) -> Tuple[int, str, str]:
+    """``(id, CMD, par)`` of a frame's text as the firmware reads it.
+
+    Like ``String.toInt()``, an id that is not a number reads as 0. The
+    command is upper-cased and the parameter is kept as sent.
+    """
+    if not (text.startswith("<") and ">" in text):
+        raise ProtocolError(f"Not a frame: {text!r}")
+    body = text[1:text.index(">")]
+    head, _, rest = body.partition(",")
+    cmd, _, par = rest.partition(",")
+    return _to_int(head), cmd.upper(), par
+
+
+def _to_int(text):
+    digits = ""
+    for char in text.strip():
+        if not (char.isdigit() or (char in "+-" and not digits)):
+            break
+        digits += char
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+def parse_reply(command, line) -> Tuple[float, ...]:
+    """Numbers in the reply ``line`` to the read ``command``.
+
+    The Arduino prints "nan", "inf" and "ovf" for non-finite floats; they are
+    returned as NaN, as is a disconnected temperature sensor.
+    """
+    expected = READ_COMMANDS[command]
+    fields = line.strip().split(",")
+    if len(fields) != expected:
+        raise ProtocolError(f"{command} reply has {len(fields)} fields, expected {expected}: {line!r}")
+    try:
+        values = tuple(float(f) if f.strip() not in ("ovf", "") else math.nan for f in fields)
+    except ValueError:
+        raise ProtocolError(f"{command} reply is not numeric: {line!r}") from None
+    if command == "GET_T" and values[0] == DISCONNECTED_C:
+        return (math.nan,)
+    return tuple(v if math.isfinite(v) else math.nan for v in values)
+
+
+# --- Timing -------------------------------------------------------------------
+
+def byte_time(n_bytes, baud):
+    return n_bytes * BITS_PER_BYTE / baud
+
+
+def frame_fits(n_bytes, baud):
+    """Whether a frame arrives within ``RX_SETTLE`` of its first byte.
+
+    The firmware reads only the bytes already buffered after that delay and
+    drops a frame with no closing '>', so at 1200 baud only frames of up to 7
+    bytes get an answer.
+    """
+    return byte_time(n_bytes - 1, baud) <= RX_SETTLE
+
+
+def hx711_conversions(smpl_avg):
+    """Conversions in one ``leerBalanza``: per HX711, a dummy read per gain and ``smpl_avg`` per channel."""
+    return 2 * (2 + 2 * max(int(smpl_avg), 1))
+
+
+def measure_time(command, smpl_avg=1):
+    """Time the firmware spends measuring before it answers ``command``."""
+    balances = {"GET_W": 1, "GET_RAW": 1, "TARE_ON": 1, "GET_W4X": 2}.get(command, 0)   # GET_W4X reads twice
+    if balances:
+        return balances * hx711_conversions(smpl_avg) * HX711_PERIOD
+    if command == "GET_T":
+        return DS18B20_CONVERSION
+    return 0.0
+
+
+def reply_time(command, baud=DEFAULT_BAUD, smpl_avg=1, tx_delay_ms=0, frame_bytes=16,
+               reply_bytes: Optional[int] = None):
+    """Seconds from the end of writing a frame to the end of the last reply line."""
+    if reply_bytes is None:
+        reply_bytes = REPLY_BYTES.get(command, 8)
+    lines = REPLY_LINES.get(command, 1)
+    return (RX_SETTLE + byte_time(frame_bytes, baud) + measure_time(command, smpl_avg)
+            + lines * (tx_delay_ms / 1000 + TX_ENABLE) + byte_time(reply_bytes + lines, baud))
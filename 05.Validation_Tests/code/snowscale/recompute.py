@@ -0,0 +1,174 @@
+"""Recompute the scale weight from archived raw load-cell counts.
+
+The firmware turns the four HX711 counts into a weight with the calibration
+held in its EEPROM (``calculo_masa`` in system.h)::
+
+    masa   = sum(prop[i] * raw[i] + offset[i])
+    weight = masa * cal_p + cal_o + tara
+
+so a wrong ``prop``/``offset`` is baked into every ``GET_W`` and ``GET_W4X``
+reading. Archived ``GET_RAW`` counts (``raw_1``..``raw_4``, as written by the
+poller) can be run through a corrected calibration table instead, and
+``GET_W4X`` cells can be turned back into counts with the table the scale was
+using (``raw_from_cells``).
+
+A calibration table has one row per scale and validity period:
+
+    id, valid_from[, valid_to], prop_1..4, offset_1..4[, cal_p, cal_o, tara,
+    temp_coef_1..4, temp_ref]
+
+A missing ``valid_to`` runs to the next ``valid_from`` of the same scale (or
+forever). ``temp_coef_i`` is a per-cell thermal term in kg/°C around
+``temp_ref``, added to the cell before ``cal_p`` is applied. Rows are matched
+to their period to the second, all at once, and the arithmetic is done in
+float64 rather than the firmware's float32.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .periods import lookup, take
+
+
+CELLS = 4
+RAW_COLUMNS = tuple(f"raw_{i}" for i in range(1, CELLS + 1))
+CELL_COLUMNS = tuple(f"cell_{i}" for i in range(1, CELLS + 1))
+PROP_COLUMNS = tuple(f"prop_{i}" for i in range(1, CELLS + 1))
+OFFSET_COLUMNS = tuple(f"offset_{i}" for i in range(1, CELLS + 1))
+TEMP_COEF_COLUMNS = tuple(f"temp_coef_{i}" for i in range(1, CELLS + 1))
+# Optional columns and the firmware's defaults
+DEFAULTS = {"cal_p": 1.0, "cal_o": 0.0, "tara": 0.0, **dict.fromkeys(TEMP_COEF_COLUMNS, 0.0), "temp_ref": 20.0}
+
+
+# --- Calibration table ----------------------------------------------------------
+
+def calibration_table(table):
+    """Check and complete a calibration table: defaults, ``valid_to`` and order.
+
+    Raises ``ValueError`` for missing columns or overlapping periods of one scale.
+    """
+    missing = [c for c in ("id", "valid_from", *PROP_COLUMNS, *OFFSET_COLUMNS) if c not in table.columns]
+    if missing:
+        raise ValueError(f"Calibration table is missing columns {missing}")
+    table = table.copy()
+    # Telemetry ids are read as text, so '141' in a file and 141 in a table are the same scale
+    table["id"] = table["id"].astype(str)
+    for column, default in DEFAULTS.items():
+        table[column] = table[column].fillna(default) if column in table.columns else default
+    table["valid_from"] = pd.to_datetime(table["valid_from"])
+    table = table.sort_values(["id", "valid_from"], kind="stable", ignore_index=True)
+
+    following = table.groupby("id", sort=False)["valid_from"].shift(-1)
+    if "valid_to" in table.columns:
+        valid_to = pd.to_datetime(table["valid_to"])
+        table["valid_to"] = valid_to.fillna(following)
+        overlap = (table["valid_to"] > following).to_numpy()
+        if overlap.any():
+            row = table.loc[overlap].iloc[0]
+            raise ValueError(f"Calibration of scale {row['id']} from {row['valid_from']} "
+                             f"overlaps the next one (valid to {row['valid_to']})")
+    else:
+        table["valid_to"] = following
+    return table
+
+
+def read_calibrations(path, **kwargs):
+    """Read a calibration table from CSV; ``kwargs`` go to ``pd.read_csv``."""
+    return calibration_table(pd.read_csv(path, **kwargs))
+
+
+def _rows(frame, table, scale_id):
+    if scale_id is not None:
+        ids = pd.Series(pd.Categorical.from_codes(np.zeros(len(frame), dtype=np.int8), [scale_id]))
+    elif "id" in frame.columns:
+        ids = frame["id"]
+    else:
+        raise ValueError("Frame has no 'id' column; pass scale_id")
+    return lookup(ids, frame["time"].to_numpy(), table)
+
+
+def _columns(frame, columns):
+    return [frame[c].to_numpy(dtype=np.float64) for c in columns]
+
+
+# --- Recomputation ---------------------------------------------------------------
+
+def recompute(frame, table, scale_id=None, area_m2: Optional[float] = None, temp_column="sensor_temp",
+              cells=False):
+    """``frame`` with ``weight`` recomputed from ``raw_1``..``raw_4``.
+
+    ``table`` is a calibration table (completed with ``calibration_table``
+    if it was not already). Rows are matched on ``id`` and ``time``, or on
+    ``time`` alone for one ``scale_id``; rows outside every period get NaN,
+    and an id without any calibration is a ``ValueError``.
+    With ``area_m2`` the weight is returned in kg/m², the unit the correction
+    and metrics stages expect, and the frame can go straight to ``correct``.
+    ``cells=True`` also returns the calibrated ``cell_1``..``cell_4``.
+    """
+    if "valid_to" not in table.columns or "temp_ref" not in table.columns:
+        table = calibration_table(table)
+    missing = [c for c in ("time", *RAW_COLUMNS) if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Frame is missing columns {missing}")
+    rows = _rows(frame, table, scale_id)
+    raw = _columns(frame, RAW_COLUMNS)
+
+    # The calibration folded into one gain per cell, a temperature slope and
+    # an intercept per period, so each row takes six values from the table
+    cal_p = table["cal_p"].to_numpy(dtype=np.float64)
+    coef = table[list(TEMP_COEF_COLUMNS)].to_numpy(dtype=np.float64)
+    slope = cal_p * coef.sum(axis=1)
+    folded = table.assign(
+        **{f"gain_{i}": cal_p * table[c] for i, c in enumerate(PROP_COLUMNS, start=1)},
+        slope=slope,
+        intercept=cal_p * (table[list(OFFSET_COLUMNS)].sum(axis=1) - coef.sum(axis=1) * table["temp_ref"])
+        + table["cal_o"] + table["tara"])
+    weight = take(folded, "intercept", rows)
+    for i, values in enumerate(raw, start=1):
+        weight += take(folded, f"gain_{i}", rows) * values
+    used = np.bincount(rows + 1, minlength=len(table) + 1)[1:] > 0
+    thermal = bool(np.any(coef[used] != 0))
+    if thermal:
+        if temp_column not in frame.columns:
+            raise ValueError(f"Calibration has thermal terms but the frame has no {temp_column!r} column")
+        temp = frame[temp_column].to_numpy(dtype=np.float64)
+        row_slope = take(folded, "slope", rows)
+        # A period without thermal terms keeps its weight when the temperature is missing
+        weight += np.where(row_slope != 0, row_slope * temp, 0.0)
+    if area_m2 is not None:
+        weight /= area_m2
+
+    out = frame.assign(weight=weight)
+    if cells:
+        delta = frame[temp_column].to_numpy(dtype=np.float64) - take(table, "temp_ref", rows) if thermal else 0.0
+        for i, column in enumerate(CELL_COLUMNS):
+            cell = take(table, PROP_COLUMNS[i], rows) * raw[i] + take(table, OFFSET_COLUMNS[i], rows)
+            if thermal:
+                row_coef = take(table, TEMP_COEF_COLUMNS[i], rows)
+                cell += np.where(row_coef != 0, row_coef * delta, 0.0)
+            out[column] = cell
+    return out
+
+
+def raw_from_cells(frame, table, scale_id=None):
+    """``frame`` with ``raw_1``..``raw_4`` recovered from ``GET_W4X`` cells.
+
+    ``table`` must hold the calibration the scale was running when the cells
+    were read. The firmware prints cells with two decimals, so the counts are
+    only as fine as ``0.005 / prop``; they are rounded to whole counts.
+    """
+    if "valid_to" not in table.columns:
+        table = calibration_table(table)
+    missing = [c for c in ("time", *CELL_COLUMNS) if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Frame is missing columns {missing}")
+    rows = _rows(frame, table, scale_id)
+    out = frame.copy()
+    for i, cell in enumerate(_columns(frame, CELL_COLUMNS)):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            raw = (cell - take(table, OFFSET_COLUMNS[i], rows)) / take(table, PROP_COLUMNS[i], rows)
+        out[RAW_COLUMNS[i]] = np.rint(raw)
+    return out
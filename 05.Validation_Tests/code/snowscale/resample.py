@@ -0,0 +1,134 @@
+"""Rolling means and resampling over time windows instead of row counts.
+
+A window of "12h" stays 12 hours when a station changes its sample rate or
+loses records, where ``rolling(72)`` silently stretches or shrinks. Trailing
+windows cover ``(t - window, t]`` and centred ones
+``[t - window/2, t + window/2)``, so on an evenly spaced record they hold the
+same rows as pandas' row-count rolling with ``window / step`` rows.
+
+Both functions take a ``(n,)`` or ``(n, k)`` array (or a DataFrame) of
+values and an optional ``groups`` array of station ids, and handle all
+columns and stations in one call. Window sums come from cumulative sums of
+the valid values and their counts, so the cost is O(n) per column whatever
+the window, and NaNs simply do not count.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def _duration(window):
+    return pd.Timedelta(window).to_timedelta64().astype("timedelta64[ns]").view(np.int64)
+
+
+def _keys(times, groups, margin):
+    """Sortable int64 keys of ``(group, time)``, at least ``margin`` ns apart between groups."""
+    t = np.asarray(times, dtype="datetime64[ns]").view(np.int64)
+    if groups is None:
+        return t
+    codes, _ = pd.factorize(np.asarray(groups), sort=True)
+    if not len(t):
+        return t
+    lo = t.min()
+    span = int(t.max() - lo) + 2 * int(margin) + 1
+    if (codes.max() + 1) * span >= 2 ** 63:
+        raise ValueError("Too many groups over too long a time span to index")
+    return codes * span + (t - lo)
+
+
+def _as_2d(values):
+    frame = values if isinstance(values, pd.DataFrame) else None
+    array = values.to_numpy(dtype=np.float64) if frame is not None else np.asarray(values, dtype=np.float64)
+    return frame, array.reshape(len(array), -1), array.ndim == 1 and frame is None
+
+
+def rolling_mean(times, values, window, center=True, min_periods=1, groups=None):
+    """Mean of the valid ``values`` within the time ``window`` around each sample.
+
+    ``times`` need not be sorted. Windows never reach into another group.
+    Samples with fewer than ``min_periods`` valid values in their window are
+    NaN. Returns an array of the shape of ``values`` (a DataFrame for one).
+    """
+    frame, x, flat = _as_2d(values)
+    width = _duration(window)
+    keys = _keys(times, groups, width)
+    order = None
+    if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind="stable")
+        keys, x = keys[order], x[order]
+
+    if center:
+        lo = np.searchsorted(keys, keys - width // 2, side="left")
+        hi = np.searchsorted(keys, keys + (width - width // 2), side="left")
+    else:
+        lo = np.searchsorted(keys, keys - width, side="right")
+        hi = np.arange(1, len(keys) + 1)
+    lo, hi = lo.astype(np.intp), hi.astype(np.intp)
+
+    n_min = max(min_periods, 1)
+    full = hi - lo
+    out = np.empty_like(x)
+    for j, column in enumerate(np.ascontiguousarray(x.T)):
+        valid = ~np.isnan(column)
+        filled = np.where(valid, column, 0.0)
+        # Offsetting by the column mean keeps the differences of long cumulative sums accurate
+        offset = filled.sum() / max(valid.sum(), 1)
+        sums = np.zeros(len(column) + 1)
+        np.cumsum(np.where(valid, filled - offset, 0.0), out=sums[1:])
+        if valid.all():
+            n = full
+        else:
+            counts = np.zeros(len(column) + 1, dtype=np.int64)
+            np.cumsum(valid, out=counts[1:])
+            n = counts[hi] - counts[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (sums[hi] - sums[lo]) / n + offset
+        mean[n < n_min] = np.nan
+        out[:, j] = mean
+
+    if order is not None:
+        out[order] = out.copy()
+    if frame is not None:
+        return pd.DataFrame(out, index=frame.index, columns=frame.columns)
+    return out[:, 0] if flat else out
+
+
+def resample_mean(times, values, freq, groups=None, min_count=1):
+    """Mean of the valid ``values`` in each ``freq`` interval (per group).
+
+    Intervals are aligned to the epoch, like ``floor(freq)``. Returns a
+    DataFrame with ``group`` (when given), ``time`` (start of the interval),
+    one column per value column and ``n``, the rows that fell in the
+    interval; intervals without rows are not listed.
+    """
+    frame, x, _ = _as_2d(values)
+    if frame is not None:
+        names = list(frame.columns)
+    else:
+        names = ["value"] if x.shape[1] == 1 else [f"value_{i}" for i in range(x.shape[1])]
+    step = _duration(freq)
+    bins = np.asarray(times, dtype="datetime64[ns]").view(np.int64) // step
+    first = bins.min() if len(bins) else 0
+    span = int(bins.max() - first) + 1 if len(bins) else 1
+    if groups is None:
+        keys = bins - first
+    else:
+        codes, labels = pd.factorize(np.asarray(groups), sort=True)
+        keys = codes * span + (bins - first)
+    unique, inverse = np.unique(keys, return_inverse=True)
+
+    out = {}
+    if groups is not None:
+        out["group"] = labels[unique // span]
+    out["time"] = ((unique % span + first) * step).astype("datetime64[ns]")
+    for i, name in enumerate(names):
+        valid = ~np.isnan(x[:, i])
+        n = np.bincount(inverse[valid], minlength=len(unique))
+        total = np.bincount(inverse[valid], weights=x[valid, i], minlength=len(unique))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+        mean[n < max(min_count, 1)] = np.nan
+        out[name] = mean
+    out["n"] = np.bincount(inverse, minlength=len(unique))
+    return pd.DataFrame(out)
@@ -0,0 +1,239 @@
+"""Batch validation over many sites and parameter choices.
+
+Every (site, dry-period rule, smoothing window) combination runs in its own
+worker process and returns one row of metrics; the rows are collected into a
+single table and written to CSV or JSON::
+
+    python -m snowscale.runner --smooth 6h 12h 24h --dry-samples 7 24 --out results.csv
+
+Figures are only rendered with ``--plots DIR``, headless and in a separate
+pool, so a metrics-only run never imports matplotlib and nothing blocks.
+``--profile DIR`` records every stage of every run (see
+``snowscale.profiling``) to ``DIR/stages.json`` and a Chrome trace,
+``DIR/trace.json``, with one lane per worker process.
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, nullcontext
+from pathlib import Path
+from typing import Iterable, Mapping, Optional, Sequence, Union
+
+import pandas as pd
+
+from .bootstrap import CI_METRICS, bootstrap_metrics
+from .cache import CACHE_DIR
+from .config import SITES, DryDetection, DryPeriod, SiteConfig
+from .io import DATA_DIR
+from .correction import ThermalFit
+from .pipeline import run_site
+from .profiling import Profiler, chrome_trace
+
+
+@dataclasses.dataclass(frozen=True)
+class Job:
+    key: str
+    config: SiteConfig
+    bootstrap: int = 0                 # block-bootstrap resamples for confidence intervals; 0 -> none
+    block: Optional[int] = None        # bootstrap block length in samples; None -> bootstrap.default_block
+
+
+def variants(sites: Mapping[str, SiteConfig], dry_rules: Sequence[Optional[Union[DryPeriod, DryDetection]]] = (),
+             smooth_windows: Sequence[Union[int, str]] = ()) -> Iterable[Job]:
+    """Jobs for every site crossed with the given dry rules and smoothing windows.
+
+    An empty sequence keeps the site's own setting. Sites without thermal
+    correction (``dry=None``) are not given a dry rule.
+    """
+    for key, config in sites.items():
+        rules = dry_rules if dry_rules and config.dry is not None else [config.dry]
+        windows = smooth_windows or [config.smooth_window]
+        for rule, window in itertools.product(rules, windows):
+            yield Job(key, dataclasses.replace(config, dry=rule, smooth_window=window))
+
+
+def job_stem(job: Job):
+    """File name stem for ``job``'s figures."""
+    stem = f"{job.key}_smooth{job.config.smooth_window}"
+    if isinstance(job.config.dry, DryDetection):
+        stem += "_dryauto"
+    elif job.config.dry is not None and job.config.dry.first_samples is not None:
+        stem += f"_dry{job.config.dry.first_samples}"
+    return stem
+
+
+def run_job(job: Job, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """One table row for ``job``; failures are reported in the ``error`` column."""
+    return _run(job, data_dir, cache_dir)[0]
+
+
+def _run(job: Job, data_dir, cache_dir, keep_plot=False, profile_dir=None, cprofile: Sequence[str] = ()):
+    """Table row for ``job``, with ``keep_plot`` the data needed to draw it, and its stage records.
+
+    Stages are only recorded with a ``profile_dir``, which also receives the
+    ``.prof`` files of the stages in ``cprofile``.
+    """
+    config = job.config
+    dry = config.dry or DryPeriod(max_height=None, first_samples=None)
+    row = {
+        "site": job.key,
+        "name": config.name,
+        "smooth_window": config.smooth_window,
+        "dry_auto": isinstance(dry, DryDetection),
+        "dry_max_height": dry.max_height,
+        "dry_first_samples": getattr(dry, "first_samples", None),
+        "dry_first_days": getattr(dry, "first_days", None),
+    }
+    start = time.perf_counter()
+    plot = None
+    profiler = None if profile_dir is None else Profiler(cprofile=cprofile)
+    try:
+        with profiler.activate() if profiler else nullcontext():
+            result = run_site(config, data_dir, cache_dir)
+        boot = None
+        if job.bootstrap:
+            # Seeded, so reruns of the same job report the same intervals
+            boot = bootstrap_metrics(result.aligned["tested"], result.aligned["reference"], job.block,
+                                     job.bootstrap, seed=0, metrics=CI_METRICS, times=result.aligned["time"])
+    except Exception as exc:   # one bad station must not stop the batch
+        row["error"] = f"{type(exc).__name__}: {exc}"
+    else:
+        if keep_plot:
+            from .plotting import PlotData
+            plot = PlotData.from_result(result)
+        fit = result.thermal
+        single = fit if isinstance(fit, ThermalFit) else None
+        row.update({
+            "thermal_intervals": len(fit) if isinstance(fit, pd.DataFrame) and "start" in fit else int(fit is not None),
+            "thermal_lag": single.lag if single else None,
+            "thermal_slope": single.slope if single else None,
+            "thermal_intercept": single.intercept if single else None,
+            "reference_lag": result.lag,
+            **result.metrics.as_dict(),
+            "error": None,
+        })
+        if boot is not None:
+            row["bootstrap_block"] = boot.block
+            for metric, (lower, upper) in boot.intervals[["lower", "upper"]].iterrows():
+                row[f"{metric}_lower"], row[f"{metric}_upper"] = lower, upper
+    row["seconds"] = time.perf_counter() - start
+    records = []
+    if profiler is not None:
+        # pstats objects do not pickle, so the worker writes its own profiles
+        try:
+            profiler.write_profiles(profile_dir, prefix=f"{job_stem(job)}_")
+        except Exception as exc:   # nor must a profile that cannot be written
+            failure = f"profile: {type(exc).__name__}: {exc}"
+            row["error"] = failure if row.get("error") is None else f"{row['error']}; {failure}"
+        records = [{"job": job_stem(job), **r.as_dict()} for r in profiler.records]
+    return row, plot, records
+
+
+def run_batch(jobs: Iterable[Job], workers: Optional[int] = None, data_dir=DATA_DIR, cache_dir=CACHE_DIR,
+              plot_dir=None, plot_workers: Optional[int] = None, profile_dir=None, cprofile: Sequence[str] = ()):
+    """Run ``jobs`` in a process pool (``workers=1`` runs in-process) and return the metrics table.
+
+    With ``plot_dir`` each finished run is handed to a second pool that
+    renders its figures while the remaining metrics are still computing.
+    Without it matplotlib is never imported. With ``profile_dir`` the stage
+    records of all runs are written there; see ``write_profile``.
+    """
+    jobs = list(jobs)
+    rows = [None] * len(jobs)
+    records = [[] for _ in jobs]
+    if workers == 1 and plot_dir is None:
+        for i, job in enumerate(jobs):
+            rows[i], _, records[i] = _run(job, data_dir, cache_dir, False, profile_dir, cprofile)
+    else:
+        renders = []
+        keep_plot = plot_dir is not None
+        with ExitStack() as stack:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            plot_pool = stack.enter_context(ProcessPoolExecutor(max_workers=plot_workers)) if keep_plot else None
+            futures = {pool.submit(_run, job, data_dir, cache_dir, keep_plot, profile_dir, cprofile): i
+                       for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                rows[i], plot, records[i] = future.result()
+                if plot is not None:
+                    from .plotting import render
+                    renders.append(plot_pool.submit(render, plot, plot_dir, job_stem(jobs[i])))
+            for future in renders:
+                future.result()
+    if profile_dir is not None:
+        write_profile([r for job_records in records for r in job_records], profile_dir)
+    return pd.DataFrame(rows)
+
+
+def write_profile(records, directory):
+    """Write stage records as ``stages.json`` and ``trace.json`` (Chrome trace format) in ``directory``."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "stages.json").write_text(json.dumps(records, indent=1))
+    (directory / "trace.json").write_text(json.dumps(chrome_trace(records)))
+
+
+def write_table(table, path):
+    """Write ``table`` as CSV or JSON (records), chosen by the file extension."""
+    path = Path(path)
+    if path.suffix == ".json":
+        table.to_json(path, orient="records", indent=1, date_format="iso")
+    else:
+        table.to_csv(path, index=False)
+
+
+def _window(text):
+    """A smoothing window from the command line: a sample count or a duration."""
+    return int(text) if text.isdigit() else text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Snow Scale validation over many sites.")
+    parser.add_argument("--sites", nargs="+", default=list(SITES), choices=list(SITES))
+    parser.add_argument("--smooth", nargs="+", type=_window, default=[],
+                        help="smoothing windows: durations (12h) or sample counts")
+    parser.add_argument("--dry-samples", nargs="+", type=int, default=[],
+                        help="number of dry samples for the thermal fit")
+    parser.add_argument("--auto-dry", action="store_true",
+                        help="also run with every dry interval detected and fitted (DryDetection)")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="block-bootstrap resamples for confidence intervals of R², RMSE, bias and LoA")
+    parser.add_argument("--block", type=int, default=None, help="bootstrap block length (samples)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default="validation_results.csv")
+    parser.add_argument("--plots", default=None, help="directory for figures (skipped if not given)")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="directory for per-stage timings, memory and a Chrome trace")
+    parser.add_argument("--cprofile", nargs="+", default=[], metavar="STAGE",
+                        help="stages to run under cProfile (with --profile); .prof files go to DIR")
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for key in args.sites:
+        config = SITES[key]
+        # Vary the sample count of each site's own rule, keeping its height threshold
+        rules = []
+        if isinstance(config.dry, DryPeriod):
+            rules = [dataclasses.replace(config.dry, first_samples=n) for n in args.dry_samples]
+        if args.auto_dry and config.dry is not None:
+            rules = (rules or [config.dry]) + [DryDetection(max_height=config.dry.max_height)]
+        jobs.extend(dataclasses.replace(job, bootstrap=args.bootstrap, block=args.block)
+                    for job in variants({key: config}, rules, args.smooth))
+
+    table = run_batch(jobs, args.workers, args.data_dir, args.cache_dir, plot_dir=args.plots,
+                      profile_dir=args.profile, cprofile=args.cprofile)
+    write_table(table, args.out)
+    failed = table["error"].notna().sum()
+    print(f"{len(table)} runs, {failed} failed -> {args.out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
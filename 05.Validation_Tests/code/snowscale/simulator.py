@@ -0,0 +1,454 @@
+"""Software model of the PESA_4CELL firmware, for exercising the host side without hardware.
+
+``VirtualScale`` reproduces the command handler of cmd.h/system.h: the
+same commands, replies, number formatting and EEPROM settings. Its load cells
+and temperature sensor follow a simple physical model. The raw counts drift
+with a lagged, daily-cycling temperature plus noise that averages down with
+``SET_SMPL_AVG``, and the snow load is a constant or any function of time.
+
+``SimulatedBus`` puts any number of scales on one pty, as if they were
+daisy-chained on an RS485 bus. It keeps the firmware's timing:
+
+* the 50 ms read window after a frame's first byte, so long frames are lost
+  at low baud rates;
+* the 128-byte frame limit;
+* HX711/DS18B20 conversion times that scale with ``smpl_avg``;
+* the 500 ms pause every scale takes after any frame, with frames received
+  meanwhile buffered and handled afterwards;
+* the random delay before answering a broadcast (``id == 255``), where
+  overlapping replies are garbled;
+* ``SET_BAUD`` only taking effect after ``reboot``, and a scale whose baud
+  differs from the host port's ignoring the bus.
+
+Per-scale state is kept in arrays, so a frame costs one vectorized update
+however many scales share the bus::
+
+    python -m snowscale.simulator --buses 20 --scales 10 --baud 9600
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .protocol import (BROADCAST_ID, BROADCAST_JITTER, COMMAND_GAP, DEFAULT_BAUD, DEFAULT_ID, DISCONNECTED_C,
+                       DS18B20_CONVERSION, MAX_FRAME, RX_SETTLE, TX_ENABLE, byte_time, frame_fits,
+                       measure_time, parse_frame)
+
+
+FIRMWARE_VERSION = "V20241018"
+SENSOR_TYPES = (141,)
+NAME_CHARS = 10
+HX711_RANGE = (-(1 << 23), (1 << 23) - 1)
+
+
+# --- Firmware state -------------------------------------------------------------
+
+@dataclass
+class FirmwareConfig:
+    """The EEPROM ``SCALE_CONFIG``, with the firmware's defaults."""
+    rs485_id: int = DEFAULT_ID
+    baud_com: int = DEFAULT_BAUD
+    prop: List[float] = field(default_factory=lambda: [1.0] * 4)
+    offset: List[float] = field(default_factory=lambda: [0.0] * 4)
+    sensor_name: str = "DFLT"
+    masa_smpl_avg: int = 1
+    tara: float = 0.0
+    cal_p: float = 1.0
+    cal_o: float = 0.0
+    transmit_delay: int = 0          # ms
+
+
+@dataclass
+class ScalePhysics:
+    """What the load cells and temperature sensor see."""
+    counts_per_kg: float = 2000.0                    # per cell
+    zero: Tuple[float, ...] = (0.0, 0.0, 0.0, 0.0)  # counts with no load at 20 °C
+    temp_coef: Tuple[float, ...] = (0.0, 0.0, 0.0, 0.0)   # counts per °C
+    noise: float = 20.0                              # counts, one conversion
+    temp_mean: float = 5.0
+    temp_amplitude: float = 8.0                      # daily cycle, warmest mid-afternoon
+    thermal_lag: float = 1800.0                      # s, cells follow the sensor temperature late
+    load_kg: Union[float, Callable[[float], float]] = 0.0
+    temp_sensor: bool = True                         # False reads DEVICE_DISCONNECTED_C
+
+    @classmethod
+    def random(cls, rng: np.random.Generator, **kwargs):
+        return cls(zero=tuple(rng.normal(0, 5e4, 4)), temp_coef=tuple(rng.normal(0, 40, 4)), **kwargs)
+
+
+def _fstr(value, digits=2):
+    """Arduino ``String(float, digits)``."""
+    value = float(np.float32(value))
+    if math.isnan(value):
+        return "nan"
+    if math.isinf(value):
+        return "inf"
+    if abs(value) > 4294967040.0:
+        return "ovf"
+    return f"{value:.{digits}f}"
+
+
+def _to_float(text):
+    """Arduino ``String.toFloat()``: the leading number, 0 if there is none."""
+    number = ""
+    for char in text.strip():
+        candidate = number + char
+        try:
+            float(candidate + ("0" if candidate[-1] in "+-.eE" else ""))
+        except ValueError:
+            break
+        number = candidate
+    try:
+        return float(number.rstrip("eE+-"))
+    except ValueError:
+        return 0.0
+
+
+class VirtualScale:
+    """One scale: firmware settings, command handler and sensor model.
+
+    ``clock`` returns seconds; the daily temperature cycle is taken from it.
+    """
+
+    def __init__(self, config: Optional[FirmwareConfig] = None, physics: Optional[ScalePhysics] = None,
+                 seed=None, clock: Optional[Callable[[], float]] = None):
+        self.config = config or FirmwareConfig()
+        self.physics = physics or ScalePhysics()
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock or time.time
+        self.baud = self.config.baud_com           # serial speed since the last boot
+        self.reading_raw = np.zeros(4, dtype=np.int64)
+
+    def reboot(self):
+        """Apply settings that the firmware only reads at start-up (``SET_BAUD``)."""
+        self.baud = self.config.baud_com
+
+    def calibrate(self):
+        """Set ``prop``/``offset`` so each cell reads kg at 20 °C, as after a bench calibration."""
+        self.config.prop = [1 / self.physics.counts_per_kg] * 4
+        self.config.offset = [-z / self.physics.counts_per_kg for z in self.physics.zero]
+        return self
+
+    # --- Sensors ---
+
+    def temperature(self, t=None):
+        p = self.physics
+        t = self.clock() if t is None else t
+        return p.temp_mean + p.temp_amplitude * math.sin(2 * math.pi * (t / 86400 - 0.375))
+
+    def _load(self, t):
+        load = self.physics.load_kg
+        return load(t) if callable(load) else load
+
+    def read_balance(self, smpl_avg):
+        """``leerBalanza``: the four averaged raw counts."""
+        p = self.physics
+        t = self.clock()
+        drift = np.asarray(p.temp_coef) * (self.temperature(t - p.thermal_lag) - 20.0)
+        signal = np.asarray(p.zero) + self._load(t) / 4 * p.counts_per_kg + drift
+        noise = self.rng.normal(0, p.noise / math.sqrt(max(smpl_avg, 1)), 4)
+        self.reading_raw = np.clip(np.rint(signal + noise), *HX711_RANGE).astype(np.int64)
+        return self.reading_raw
+
+    def read_temperature(self):
+        """``leerTemperatura``: DS18B20 at 10-bit resolution."""
+        if not self.physics.temp_sensor:
+            return DISCONNECTED_C
+        return round((self.temperature() + self.rng.normal(0, 0.05)) * 4) / 4
+
+    def _cells(self):
+        c = self.config
+        return [np.float32(c.prop[i]) * np.float32(self.reading_raw[i]) + np.float32(c.offset[i]) for i in range(4)]
+
+    def _mass(self, smpl_avg):
+        """``calculo_masa``."""
+        self.read_balance(smpl_avg)
+        return np.float32(sum(self._cells(), np.float32(0)))
+
+    def _weight(self):
+        c = self.config
+        return self._mass(c.masa_smpl_avg) * np.float32(c.cal_p) + np.float32(c.cal_o) + np.float32(c.tara)
+
+    # --- Command handler ---
+
+    def handle(self, cmd, par="") -> List[Tuple[float, str]]:
+        """``processCmd`` for a command addressed to this scale.
+
+        Returns the reply lines, each with the seconds spent measuring before
+        it is sent. Settings change immediately; unknown commands get no reply.
+        """
+        c = self.config
+        ok = [(0.0, "OK")]
+        setters = {
+            "SET_PROP": "cal_p", "SET_OFFSET": "cal_o",
+            "SET_PROP_A1": ("prop", 0), "SET_PROP_B1": ("prop", 1),
+            "SET_PROP_A2": ("prop", 2), "SET_PROP_B2": ("prop", 3),
+            "SET_OFFSET_A1": ("offset", 0), "SET_OFFSET_B1": ("offset", 1),
+            "SET_OFFSET_A2": ("offset", 2), "SET_OFFSET_B2": ("offset", 3),
+        }
+        if cmd == "SET_BAUD":
+            baud = int(_to_float(par))
+            if baud in (1200, 2400, 4800, 9600, 19200):
+                c.baud_com = baud
+                return ok
+            return [(0.0, "ERR: Baud")]
+        if cmd == "SET_ID":
+            new_id = int(_to_float(par))
+            if 0 <= new_id < BROADCAST_ID:
+                c.rs485_id = new_id
+                return ok
+            return [(0.0, "ERR: Addr")]
+        if cmd == "SET_NAME":
+            c.sensor_name = par[:NAME_CHARS - 1]
+            return ok
+        if cmd == "GET_CONFIG":
+            lines = ["\n\nSENSOR CONFIGURATION PARAMETERS\n",
+                     f"1,RS-485 ID  ,{c.rs485_id}",
+                     f"2,S. name    ,{c.sensor_name}",
+                     f"3,Com Baud   ,{c.baud_com}",
+                     f"4,Tx delay   ,{c.transmit_delay}",
+                     "5,Hardware   ,ATmega328p",
+                     f"6,Firmware   ,{FIRMWARE_VERSION}",
+                     f"7,Instr.Prop ,{_fstr(c.cal_p, 4)}",
+                     f"8,Instr.Ofst ,{_fstr(c.cal_o, 4)}",
+                     f"9,Tare       ,{_fstr(c.tara)}",
+                     f"10,Sample AVG,{c.masa_smpl_avg}",
+                     "11,Cel. Prop ," + ",".join(_fstr(v, 9) for v in c.prop),
+                     "12,Cel. Ofset," + ",".join(_fstr(v, 9) for v in c.offset)]
+            return [(0.0, line) for line in lines]
+        if cmd == "AT":
+            return ok if not par else []
+        if cmd == "GET_W":
+            return [(measure_time(cmd, c.masa_smpl_avg), _fstr(self._weight()))]
+        if cmd == "GET_W4X":
+            self.read_balance(c.masa_smpl_avg)
+            cells = ",".join(_fstr(v) for v in self._cells())
+            return [(measure_time(cmd, c.masa_smpl_avg), f"{cells},{_fstr(self._weight())}")]
+        if cmd == "GET_T":
+            return [(DS18B20_CONVERSION, _fstr(self.read_temperature()))]
+        if cmd == "GET_RAW":
+            raw = self.read_balance(c.masa_smpl_avg)
+            return [(measure_time(cmd, c.masa_smpl_avg), ",".join(str(int(v)) for v in raw))]
+        if cmd == "TARE_ON":
+            mass = self._mass(c.masa_smpl_avg)
+            c.tara = float(-(mass * np.float32(c.cal_p) + np.float32(c.cal_o)))
+            return [(0.0, " Wait..."), (measure_time(cmd, c.masa_smpl_avg), "OK")]
+        if cmd == "TARE_OFF":
+            c.tara = 0.0
+            return ok
+        if cmd == "SET_SMPL_AVG":
+            c.masa_smpl_avg = int(_to_float(par))
+            return ok
+        if cmd == "GET_SENS":
+            return [(0.0, ",".join(str(s) for s in SENSOR_TYPES))]
+        if cmd == "SET_TXD":
+            c.transmit_delay = int(_to_float(par))
+            return ok
+        if cmd in setters:
+            target = setters[cmd]
+            if isinstance(target, tuple):
+                getattr(c, target[0])[target[1]] = _to_float(par)
+            else:
+                setattr(c, target, _to_float(par))
+            return ok
+        return []
+
+
+# --- Bus ----------------------------------------------------------------------
+
+@dataclass
+class BusCounters:
+    frames: int = 0
+    dropped: int = 0               # frames no scale could read (too long, baud mismatch)
+    replies: int = 0
+    collisions: int = 0
+
+
+class SimulatedBus:
+    """Scales sharing one pty; the host opens ``port`` like a serial device."""
+
+    def __init__(self, scales: Sequence[VirtualScale]):
+        self.scales = list(scales)
+        self.counters = BusCounters()
+        self.port: Optional[str] = None
+        self._master = self._slave = None
+        self._ids = np.array([s.config.rs485_id for s in self.scales])
+        self._ready = np.zeros(len(self.scales))     # loop time each scale reads the bus again
+        self._wire = bytearray()                     # bytes after the last '<'
+        self._wire_start = 0.0
+        self._in_frame = False
+        self._on_air: List[_Reply] = []              # replies being sent
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        import pty
+        import tty
+
+        self._loop = asyncio.get_running_loop()
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._loop.add_reader(self._master, self._on_readable)
+        return self
+
+    def close(self):
+        if self._master is not None:
+            self._loop.remove_reader(self._master)
+            os.close(self._master)
+            os.close(self._slave)
+            self._master = self._slave = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _host_baud(self):
+        import termios
+        speed = termios.tcgetattr(self._master)[5]
+        for baud in (1200, 2400, 4800, 9600, 19200):
+            if getattr(termios, f"B{baud}") == speed:
+                return baud
+        return None
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        now = self._loop.time()
+        for byte in data:
+            if not self._in_frame:
+                if byte == ord("<"):
+                    self._in_frame, self._wire, self._wire_start = True, bytearray(b"<"), now
+                continue
+            self._wire.append(byte)
+            if byte == ord(">"):
+                self._in_frame = False
+                self._frame(self._wire_start, bytes(self._wire))
+            elif len(self._wire) >= MAX_FRAME:
+                # The firmware stops reading without a '>' and drops the frame
+                self._in_frame = False
+                self.counters.dropped += 1
+
+    def _frame(self, t0, data):
+        """A complete frame whose first byte arrived at ``t0``."""
+        self.counters.frames += 1
+        baud = self._host_baud()
+        speed = np.array([s.baud for s in self.scales])
+        start = np.maximum(self._ready, t0)
+        # An idle scale reads what arrived in its 50 ms window; a busy one finds the whole frame buffered
+        heard = (speed == baud) & ((start > t0 + byte_time(len(data) - 1, baud or DEFAULT_BAUD))
+                                   | frame_fits(len(data), baud or DEFAULT_BAUD))
+        if not heard.any():
+            self.counters.dropped += 1
+            return
+        read_at = start + RX_SETTLE
+        self._ready = np.where(heard, read_at + COMMAND_GAP, self._ready)
+
+        text = "".join(chr(b) for b in data if 32 <= b <= 126)
+        target, cmd, par = parse_frame(text)
+        if target == BROADCAST_ID:
+            for i in np.flatnonzero(heard & (self._ids != BROADCAST_ID)):
+                delay = self.scales[i].rng.uniform(0, BROADCAST_JITTER)
+                self._send(i, read_at[i] + delay, [(0.0, str(self.scales[i].config.rs485_id))])
+            return
+        for i in np.flatnonzero(heard & (self._ids == target)):
+            self._send(i, read_at[i], self.scales[i].handle(cmd, par))
+            self._ids[i] = self.scales[i].config.rs485_id
+
+    def _send(self, i, t, lines):
+        """Schedule scale ``i``'s reply lines from loop time ``t`` and keep it busy until then."""
+        scale = self.scales[i]
+        for busy, line in lines:
+            t += busy + scale.config.transmit_delay / 1000 + TX_ENABLE
+            data = (line + "\n").encode("ascii")
+            reply = _Reply(t, t + byte_time(len(data), scale.baud), data)
+            self._on_air.append(reply)
+            self._loop.call_at(reply.end, self._transmit, reply)
+            t = reply.end
+        if lines:
+            self._ready[i] = t + COMMAND_GAP
+
+    def _transmit(self, reply):
+        self._on_air.remove(reply)
+        for other in self._on_air:
+            if other.start < reply.end and other.end > reply.start:
+                other.garbled = reply.garbled = True
+        data = reply.data
+        if reply.garbled:
+            self.counters.collisions += 1
+            data = b"?" * (len(data) - 1) + b"\n"
+        self.counters.replies += 1
+        if self._master is not None:
+            try:
+                os.write(self._master, data)
+            except OSError:
+                pass
+
+
+@dataclass
+class _Reply:
+    start: float
+    end: float
+    data: bytes
+    garbled: bool = False
+
+
+def make_scales(n, first_id=1, baud=DEFAULT_BAUD, seed=None, calibrated=True, **physics) -> List[VirtualScale]:
+    """``n`` scales with consecutive ids and random cell offsets and thermal drift."""
+    rng = np.random.default_rng(seed)
+    scales = []
+    for i in range(n):
+        child = np.random.default_rng(rng.integers(1 << 63))
+        scale = VirtualScale(FirmwareConfig(rs485_id=first_id + i, baud_com=baud),
+                             ScalePhysics.random(child, **physics), seed=child.integers(1 << 63))
+        scales.append(scale.calibrate() if calibrated else scale)
+    return scales
+
+
+async def start_buses(n_buses, scales_per_bus, baud=DEFAULT_BAUD, seed=None, **physics) -> List[SimulatedBus]:
+    """``n_buses`` started buses, each with ``scales_per_bus`` scales numbered from 1."""
+    rng = np.random.default_rng(seed)
+    return [await SimulatedBus(make_scales(scales_per_bus, baud=baud, seed=rng.integers(1 << 63),
+                                           **physics)).start()
+            for _ in range(n_buses)]
+
+
+async def _serve(args):
+    buses = await start_buses(args.buses, args.scales, args.baud, args.seed, load_kg=args.load)
+    for bus in buses:
+        print(f"{bus.port}={','.join(str(s.config.rs485_id) for s in bus.scales)}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for bus in buses:
+            bus.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve simulated Snow Scales on ptys until interrupted.")
+    parser.add_argument("--buses", type=int, default=1)
+    parser.add_argument("--scales", type=int, default=4, help="scales per bus")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--load", type=float, default=0.0, help="load on every scale, kg")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+"""Streaming reader for Snow Scale key/value telemetry (BR_IOT.csv).
+
+Each record is one line of alternating keys and values terminated by ``;``::
+
+    id,I9B8C,dt,2023-03-30T16:15:12Z,vin,13.68,at,24.50,sh,258,sw,0.20,swt,35.44,C,46539;
+
+The file is read ``chunk_bytes`` at a time (extended to the next line end).
+Field counts are checked for every line of a chunk at once with NumPy, and
+the well-formed lines go through a single ``pd.read_csv`` call that parses
+them straight into typed columns (``id`` as category, ``time`` as
+datetime64, the checksum ``C`` as integer and every other key as float).
+Anything else is recorded in a ``ParseReport`` and skipped, so memory stays
+bounded by the chunk size.
+
+``iot_index`` records the time range of every block of a file, so
+``read_iot(start=..., end=...)`` parses only the blocks that can hold the
+requested records.
+"""
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+IOT_KEYS = ("id", "dt", "vin", "at", "sh", "sw", "swt", "C")
+IOT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"   # after stripping the UTC "Z"
+TIME_DTYPE = "datetime64[us]"           # of every frame read, parsed or empty
+CHUNK_BYTES = 16 << 20
+INDEX_BYTES = 1 << 20
+INDEX_COLUMNS = ("offset", "length", "first_line", "start", "end")
+
+
+@dataclass
+class ParseReport:
+    lines: int = 0
+    records: int = 0
+    malformed: List[Tuple[int, str, str]] = field(default_factory=list)  # (line number, reason, line)
+
+    def add(self, line_number, reason, line):
+        self.malformed.append((int(line_number), reason, line[:120]))
+
+
+def _value_dtype(key):
+    return {"id": "category", "dt": str, "C": "Int64"}.get(key, "float64")
+
+
+def _parse_block(data, keys):
+    """Typed DataFrame and per-row validity for lines that all have ``len(keys)`` pairs."""
+    names = [f"k{i}" if j == 0 else key for i, key in enumerate(keys) for j in (0, 1)]
+    dtypes = {f"k{i}": "category" for i in range(len(keys))}
+    dtypes.update({key: _value_dtype(key) for key in ("id", "dt") if key in keys})
+    # Numeric columns are left to the C parser's inference: clean columns come back
+    # as numbers directly and only a column with a corrupt value needs coercing.
+    # comment=";" drops the record terminator.
+    df = pd.read_csv(io.BytesIO(data), header=None, names=names, dtype=dtypes, comment=";",
+                     skip_blank_lines=False, engine="c", low_memory=False)
+    for key in keys:
+        if key not in ("id", "dt") and df[key].dtype != _value_dtype(key):
+            df[key] = pd.to_numeric(df[key], errors="coerce").astype(_value_dtype(key))
+
+    ok = np.ones(len(df), dtype=bool)
+    for i, key in enumerate(keys):
+        ok &= (df[f"k{i}"] == key).to_numpy()
+
+    out = {}
+    for key in keys:
+        if key == "dt":
+            # A literal "Z" in the format drops pandas onto its slow strptime path
+            time = pd.to_datetime(df[key].str.rstrip("Z"), format=IOT_TIME_FORMAT, errors="coerce")
+            ok &= time.notna().to_numpy()
+            out["time"] = time.astype(TIME_DTYPE)
+        else:
+            out[key] = df[key]
+    return pd.DataFrame(out), ok
+
+
+def _empty_frame(keys):
+    """The frame of a read that found no records, with the dtypes of one that did."""
+    dtypes = {"dt": TIME_DTYPE, "id": pd.CategoricalDtype(pd.Index([], dtype=str))}
+    return pd.DataFrame({("time" if key == "dt" else key): pd.Series([], dtype=dtypes.get(key, _value_dtype(key)))
+                         for key in keys})
+
+
+def _lines(data):
+    """Start and end (exclusive, before the newline) offsets of every line in ``data``."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord("\n"))
+    if len(buf) and buf[-1] != ord("\n"):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    return buf, starts, ends
+
+
+def _parse_chunk(data, keys, report, first_line):
+    """Typed records of the whole lines in ``data``; ``first_line`` numbers them in the report."""
+    n_commas = 2 * len(keys) - 1
+    buf, starts, ends = _lines(data)
+    commas = np.flatnonzero(buf == ord(","))
+    per_line = np.searchsorted(commas, ends) - np.searchsorted(commas, starts)
+    blank = (per_line == 0) & (ends - starts <= 2)
+    good = per_line == n_commas
+    for i in np.flatnonzero(~good & ~blank):
+        report.add(first_line + i, f"expected {len(keys)} key/value pairs",
+                   data[starts[i]:ends[i]].decode("utf-8", errors="replace").strip())
+    report.lines += len(starts)
+    good_lines = np.flatnonzero(good)
+    if not len(good_lines):
+        return None, len(starts)
+
+    block = data
+    if len(good_lines) < len(starts):
+        # Keep the contiguous runs of good lines
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], good, [False]]).astype(np.int8)))
+        block = b"".join(data[starts[a]:ends[b - 1]] + b"\n" for a, b in zip(edges[::2], edges[1::2]))
+
+    df, ok = _parse_block(block, keys)
+    for i in good_lines[~ok]:
+        report.add(first_line + i, "unexpected keys or timestamp",
+                   data[starts[i]:ends[i]].decode("utf-8", errors="replace").strip())
+    df = df[ok].reset_index(drop=True)
+    report.records += len(df)
+    return df, len(starts)
+
+
+def iter_iot(path, chunk_bytes=CHUNK_BYTES, keys: Sequence[str] = IOT_KEYS,
+             report: Optional[ParseReport] = None) -> Iterator[pd.DataFrame]:
+    """Yield one typed DataFrame per ``chunk_bytes`` of a telemetry file."""
+    keys = tuple(keys)
+    report = ParseReport() if report is None else report
+    first_line = 1
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(chunk_bytes)
+            if not data:
+                break
+            if not data.endswith(b"\n"):
+                data += file.readline()
+            df, lines = _parse_chunk(data, keys, report, first_line)
+            first_line += lines
+            if df is not None:
+                yield df
+
+
+# --- Time index ---------------------------------------------------------------
+
+_DIGITS = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])    # of YYYY-MM-DDTHH:MM:SS
+_PLACES = 10 ** np.arange(13, -1, -1, dtype=np.int64)
+
+
+def _time_range(data):
+    """Earliest and latest ``dt`` value in ``data`` as YYYYMMDDhhmmss integers, or None."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) < 24:
+        return None
+    at = np.flatnonzero((buf[:-22] == ord("d")) & (buf[1:-21] == ord("t")) & (buf[2:-20] == ord(",")))
+    at = at[(at == 0) | (buf[np.maximum(at - 1, 0)] == ord(","))]
+    digits = buf[at[:, None] + 3 + _DIGITS].astype(np.int64) - ord("0")
+    stamps = (digits * _PLACES).sum(axis=1)[((digits >= 0) & (digits <= 9)).all(axis=1)]
+    return (stamps.min(), stamps.max()) if len(stamps) else None
+
+
+def iot_index(path, block_bytes=INDEX_BYTES, index: Optional[pd.DataFrame] = None):
+    """Byte range, first line and earliest/latest time of every block of a telemetry file.
+
+    The timestamps of a block are compared as the integers YYYYMMDDhhmmss,
+    without parsing dates. Given the ``index`` of an earlier, shorter version of an
+    append-only file, only its last block and the new bytes are read.
+    """
+    entries = []
+    offset, line = 0, 1
+    if index is not None and len(index):
+        offset, line = int(index["offset"].iloc[-1]), int(index["first_line"].iloc[-1])
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            data = file.read(block_bytes)
+            if not data:
+                break
+            if not data.endswith(b"\n"):
+                data += file.readline()
+            span = _time_range(data)
+            entries.append((offset, len(data), line, *(span if span is not None else (None, None))))
+            offset += len(data)
+            line += data.count(b"\n")
+    out = pd.DataFrame(entries, columns=list(INDEX_COLUMNS))
+    for column in ("start", "end"):
+        out[column] = pd.to_datetime(out[column].astype("Int64").astype(str), format="%Y%m%d%H%M%S",
+                                     errors="coerce")
+    if index is not None and len(index):
+        out = pd.concat([index.iloc[:-1][list(INDEX_COLUMNS)], out], ignore_index=True)
+    return out
+
+
+def _iter_range(path, keys, report, index, start, end):
+    blocks = index
+    if start is not None:
+        blocks = blocks[blocks["end"] >= pd.Timestamp(start)]
+    if end is not None:
+        blocks = blocks[blocks["start"] <= pd.Timestamp(end)]
+    # Neighbouring blocks are read together, up to CHUNK_BYTES at a time
+    runs = []
+    for offset, length, first_line in blocks[["offset", "length", "first_line"]].itertuples(index=False):
+        if runs and runs[-1][0] + runs[-1][1] == offset and runs[-1][1] + length <= CHUNK_BYTES:
+            runs[-1][1] += length
+        else:
+            runs.append([offset, length, first_line])
+    with open(path, "rb") as file:
+        for offset, length, first_line in runs:
+            file.seek(offset)
+            df, _ = _parse_chunk(file.read(length), keys, report, first_line)
+            if df is None:
+                continue
+            keep = np.ones(len(df), dtype=bool)
+            if start is not None:
+                keep &= (df["time"] >= pd.Timestamp(start)).to_numpy()
+            if end is not None:
+                keep &= (df["time"] <= pd.Timestamp(end)).to_numpy()
+            yield df[keep]
+
+
+def read_iot(path, chunk_bytes=CHUNK_BYTES, keys: Sequence[str] = IOT_KEYS,
+             report: Optional[ParseReport] = None, start=None, end=None,
+             index: Optional[pd.DataFrame] = None):
+    """Read a whole telemetry file, or the records with ``start <= time <= end``; see ``iter_iot``.
+
+    A time range only parses the blocks of ``index`` (built with ``iot_index``
+    when not given) that can hold matching records.
+    """
+    if start is None and end is None:
+        chunks = list(iter_iot(path, chunk_bytes, keys, report))
+    else:
+        index = iot_index(path) if index is None else index
+        report = ParseReport() if report is None else report
+        chunks = list(_iter_range(path, tuple(keys), report, index, start, end))
+    if not chunks:
+        return _empty_frame(keys)
+    df = pd.concat(chunks, ignore_index=True)
+    if "id" in df.columns:
+        df["id"] = df["id"].astype("category")
+    return df
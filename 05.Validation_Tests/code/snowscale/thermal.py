@@ -0,0 +1,167 @@
+"""Multi-term thermal models fitted over many load cells and stations at once.
+
+``fit_thermal`` regresses one weight on one lagged sensor temperature. A
+``ThermalModel`` (see ``snowscale.config``) regresses every load cell of a
+station on several terms instead: the cell's own sensor temperature, the
+air temperature, lagged copies of either, and first differences, which
+follow the hysteresis of a cell that is warming or cooling. Tascadero's two
+cells, for instance::
+
+    model = ThermalModel(
+        terms=(ThermalTerm(), ThermalTerm("air_temp"), ThermalTerm(diff=True)),
+        channels={"weight": "sensor_temp", "weight_2": "sensor_temp_2"},
+    )
+    fits = fit_thermal_model(df, model, config.dry)
+    corrected = apply_thermal_model(df, fits, model)
+
+Every (station, channel) pair is fitted on its own dry rows, but all of
+them in one pass: the rows of all channels are stacked into one design
+matrix, the centred normal equations of every pair are accumulated with
+``np.bincount`` and the whole stack is solved in one batched call.
+"""
+from __future__ import annotations
+
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .baseline import _column, _intervals, _prepare
+from .config import SENSOR, DryDetection, DryPeriod, ThermalModel
+from .lag import shift
+
+
+def _term(df, term, sensor, order, codes):
+    x = _column(df, sensor if term.column == SENSOR else term.column, order)
+    if term.diff:
+        x = x - shift(x, 1, codes)
+    return shift(x, term.lag, codes) if term.lag else x
+
+
+def _design(df, model: ThermalModel, order, codes):
+    """Regressors (channels, rows, terms) and weights (channels, rows), rows sorted by group and time."""
+    columns = {*model.channels, *model.channels.values(), *(t.column for t in model.terms if t.column != SENSOR)}
+    missing = sorted(columns - set(df.columns))
+    if missing:
+        raise ValueError(f"Frame has no columns {missing} for the thermal model")
+    x = np.stack([np.column_stack([_term(df, t, sensor, order, codes) for t in model.terms])
+                  for sensor in model.channels.values()])
+    y = np.stack([_column(df, weight, order) for weight in model.channels])
+    return x, y
+
+
+def _group_rank(valid, codes):
+    """1-based rank of each valid row among the valid rows of its group (rows sorted by group)."""
+    counts = np.cumsum(valid, axis=-1)
+    starts = np.append(0, np.flatnonzero(codes[1:] != codes[:-1]) + 1)
+    before = (counts - valid)[..., starts]
+    return counts - np.repeat(before, np.diff(np.append(starts, len(codes))), axis=-1)
+
+
+def _dry_rows(df, rule, order, codes, times, valid):
+    """Rows (channels, rows) each channel is fitted on: dry under ``rule`` and valid."""
+    if rule is None or not len(codes):
+        return valid
+    if isinstance(rule, DryDetection):
+        return valid & _intervals(df, rule, order, codes, times)[2]
+    mask = np.ones(len(codes), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if rule.max_height is not None:
+            mask &= _column(df, "snow_height", order) <= rule.max_height
+    if rule.start is not None:
+        mask &= times >= pd.Timestamp(rule.start).value
+    if rule.end is not None:
+        mask &= times <= pd.Timestamp(rule.end).value
+    if rule.first_days is not None:
+        first = np.minimum.reduceat(times, np.append(0, np.flatnonzero(codes[1:] != codes[:-1]) + 1))
+        mask &= times < first[codes] + pd.Timedelta(days=rule.first_days).value
+    use = valid & mask
+    if rule.first_samples is not None:
+        # The first samples usable by each channel, as ``dry_period`` takes them
+        use &= _group_rank(use, codes) <= rule.first_samples
+    return use
+
+
+def fit_thermal_model(df, model: ThermalModel = ThermalModel(),
+                      dry: Optional[Union[DryPeriod, DryDetection]] = DryPeriod(),
+                      group_column: Optional[str] = None):
+    """Coefficients of ``model`` for every channel (and station, with ``group_column``).
+
+    Each channel is fitted on the rows selected by ``dry`` (all rows when
+    None) where its weight and every term are valid. A ``DryPeriod`` takes
+    its first samples and days per station; a ``DryDetection`` pools the
+    rows of all detected intervals. Returns one row per fit: the group,
+    ``channel``, ``n_fit``, ``intercept``, one column per term (named by
+    ``ThermalTerm.name``) and the ``rmse`` of the fit. Fits with fewer rows
+    than coefficients are dropped.
+    """
+    order, codes, labels, times = _prepare(df, group_column)
+    x, y = _design(df, model, order, codes)
+    n_channels, _, p = x.shape
+    k = 0 if not len(codes) else int(codes.max()) + 1
+    valid = ~np.isnan(y) & ~np.isnan(x).any(axis=2)
+    use = _dry_rows(df, dry, order, codes, times, valid)
+
+    # One fit per (channel, group): id = channel * k + group
+    ids = (np.arange(n_channels)[:, None] * k + codes)[use]
+    xs, ys = x[use], y[use]
+    size = n_channels * k
+    n = np.bincount(ids, minlength=size).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if model.intercept:
+            mx = np.column_stack([np.bincount(ids, xs[:, j], minlength=size) for j in range(p)]) / n[:, None]
+            my = np.bincount(ids, ys, minlength=size) / n
+        else:
+            mx, my = np.zeros((size, p)), np.zeros(size)
+    dx, dy = xs - mx[ids], ys - my[ids]
+    xtx = np.empty((size, p, p))
+    for i in range(p):
+        for j in range(i, p):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(ids, dx[:, i] * dx[:, j], minlength=size)
+    xty = np.column_stack([np.bincount(ids, dx[:, j] * dy, minlength=size) for j in range(p)])
+    # The whole stack in one call; pinv gives the minimum-norm fit where a term is constant
+    coef = (np.linalg.pinv(xtx) @ xty[:, :, None])[:, :, 0]
+    residual = dy - np.einsum("ij,ij->i", dx, coef[ids])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.sqrt(np.bincount(ids, residual * residual, minlength=size) / n)
+
+    table = pd.DataFrame({
+        "channel": np.repeat(list(model.channels), k),
+        "n_fit": n.astype(np.int64),
+        "intercept": my - (coef * mx).sum(axis=1),
+        **{t.name: coef[:, j] for j, t in enumerate(model.terms)},
+        "rmse": rmse,
+    })
+    if group_column is not None:
+        table.insert(0, group_column, np.tile(np.asarray(labels), n_channels))
+    return table[n >= p + model.intercept].reset_index(drop=True)
+
+
+def apply_thermal_model(df, fits, model: ThermalModel = ThermalModel(), group_column: Optional[str] = None):
+    """Every channel of ``df`` with its fitted thermal response removed.
+
+    Returns a frame on ``df``'s index with one column per channel; rows of
+    a station or channel without a fit are NaN.
+    """
+    order, codes, labels, times = _prepare(df, group_column)
+    x, y = _design(df, model, order, codes)
+    names = [t.name for t in model.terms]
+    out = {}
+    for c, channel in enumerate(model.channels):
+        rows = fits[fits["channel"] == channel]
+        if group_column is None:
+            pos = np.zeros(len(codes), dtype=np.int64) if len(rows) else np.full(len(codes), -1)
+        else:
+            found = pd.Index(rows[group_column]).get_indexer(pd.Index(labels))
+            pos = found[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+        coef = np.vstack([rows[names].to_numpy(dtype=np.float64), np.full((1, len(names)), np.nan)])
+        intercept = np.append(rows["intercept"].to_numpy(dtype=np.float64), np.nan)
+        # Missing fits point at the trailing NaN row
+        pos = np.where(pos < 0, len(rows), pos)
+        corrected = y[c] - (np.einsum("ij,ij->i", x[c], coef[pos]) + intercept[pos])
+        if order is not None:
+            unsorted = np.empty_like(corrected)
+            unsorted[order] = corrected
+            corrected = unsorted
+        out[channel] = corrected
+    return pd.DataFrame(out, index=df.index)
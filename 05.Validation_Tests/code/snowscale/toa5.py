@@ -0,0 +1,142 @@
+"""Reader for Campbell Scientific TOA5 logger files (e.g. BR_CRD.dat).
+
+A TOA5 file has four header rows followed by comma separated records::
+
+    "TOA5","CR300SeriesBR","CR300",...        environment
+    "TIMESTAMP","RECORD","Ground_Det",...     field names
+    "TS","RN","Counts",...                    units
+    "","","Smp",...                           processing
+
+Names come from the second row and dtypes from the units row (``TS`` ->
+datetime64, ``RN`` -> int64, anything else -> float64, with Campbell's
+``NAN`` as missing). Records are written in time order, so a ``start``/``end``
+range is located with a binary search over byte offsets and only that slice
+of the file is read.
+"""
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+NA_VALUES = ["NAN", "\"NAN\""]
+
+
+@dataclass(frozen=True)
+class TOA5Header:
+    environment: List[str]
+    names: List[str]
+    units: List[str]
+    processing: List[str]
+    data_offset: int   # byte offset of the first record
+
+
+def _split(line):
+    return [field.strip().strip('"') for field in line.decode("utf-8", errors="replace").strip().split(",")]
+
+
+def read_toa5_header(path):
+    with open(path, "rb") as file:
+        rows = [_split(file.readline()) for _ in range(4)]
+        offset = file.tell()
+    if not rows[0] or rows[0][0] != "TOA5":
+        raise ValueError(f"{path} is not a TOA5 file")
+    return TOA5Header(*rows, data_offset=offset)
+
+
+def _line_at(file, pos, data_offset):
+    """Offset of the first record starting at or after byte ``pos``."""
+    if pos <= data_offset:
+        return data_offset
+    file.seek(pos - 1)
+    file.readline()
+    return file.tell()
+
+
+def _first_at_or_after(file, key, data_offset, size, strict=False):
+    """Offset of the first record whose timestamp is ``>= key`` (``> key`` if ``strict``)."""
+    def passes(pos):
+        file.seek(pos)
+        line = file.readline()
+        if not line.strip():
+            return True
+        stamp = line[:line.index(b",")].strip(b'"') if b"," in line else line
+        return stamp > key if strict else stamp >= key
+
+    lo, hi = data_offset, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if passes(_line_at(file, mid, data_offset)):
+            hi = mid
+        else:
+            lo = mid + 1
+    return _line_at(file, lo, data_offset)
+
+
+def _parse_records(data, names, usecols, dtypes):
+    if not data.strip():
+        return pd.DataFrame({n: pd.Series([], dtype=dtypes.get(n, object)) for n in usecols})
+    source = io.BytesIO(data)
+    try:
+        return pd.read_csv(source, header=None, names=names, usecols=usecols, dtype=dtypes,
+                           na_values=NA_VALUES)
+    except ValueError:
+        # A stray non-numeric field: fall back to coercing column by column
+        source.seek(0)
+        df = pd.read_csv(source, header=None, names=names, usecols=usecols, dtype=str)
+        for name, dtype in dtypes.items():
+            df[name] = pd.to_numeric(df[name], errors="coerce")
+            if dtype == "int64" and df[name].notna().all():
+                df[name] = df[name].astype("int64")
+        return df
+
+
+def read_toa5(path, columns: Optional[Sequence[str]] = None, start=None, end=None):
+    """Read a TOA5 file into typed columns, optionally a subset of columns and a time range.
+
+    The timestamp column is returned as ``time``; units and processing from
+    the header are kept in ``df.attrs``.
+    """
+    header = read_toa5_header(path)
+    names, units = header.names, dict(zip(header.names, header.units))
+    time_name = next((n for n in names if units.get(n) == "TS"), names[0])
+    if columns is None:
+        usecols = names
+    else:
+        missing = [c for c in columns if c not in names]
+        if missing:
+            raise KeyError(f"Columns not in {path}: {missing}")
+        usecols = [time_name] + [c for c in columns if c != time_name]
+
+    with open(path, "rb") as file:
+        file.seek(0, io.SEEK_END)
+        size = file.tell()
+        lo, hi = header.data_offset, size
+        if start is not None:
+            key = pd.Timestamp(start).strftime(TIME_FORMAT).encode()
+            lo = _first_at_or_after(file, key, header.data_offset, size)
+        if end is not None:
+            key = pd.Timestamp(end).strftime(TIME_FORMAT).encode()
+            hi = _first_at_or_after(file, key, header.data_offset, size, strict=True)
+        file.seek(lo)
+        data = file.read(max(hi - lo, 0))
+
+    dtypes = {n: ("int64" if units.get(n) == "RN" else "float64") for n in usecols if n != time_name}
+    df = _parse_records(data, names, usecols, dtypes)
+    df = df[usecols]
+    df[time_name] = pd.to_datetime(df[time_name], format="ISO8601")
+
+    df = df.rename(columns={time_name: "time"})
+    if start is not None:
+        df = df[df["time"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["time"] <= pd.Timestamp(end)]
+    df = df.reset_index(drop=True)
+    df.attrs["units"] = {("time" if n == time_name else n): units.get(n, "") for n in usecols}
+    df.attrs["processing"] = dict(zip(header.names, header.processing))
+    df.attrs["environment"] = header.environment
+    return df
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.align import Source, align_sources
+
+
+def _frame(rng, n, column):
+    # Whole minutes over a few hours, so ties and duplicate times are common
+    minutes = np.sort(rng.integers(0, 600, n))
+    return pd.DataFrame({"time": pd.Timestamp("2024-01-01") + pd.to_timedelta(minutes, unit="min"),
+                         column: rng.normal(size=n)})
+
+
+@pytest.mark.parametrize("direction", ["backward", "forward", "nearest"])
+@pytest.mark.parametrize("tolerance", [None, "5min"])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_merge_asof(direction, tolerance, seed):
+    rng = np.random.default_rng(seed)
+    base = _frame(rng, int(rng.integers(1, 300)), "weight")
+    other = _frame(rng, int(rng.integers(1, 300)), "swe")
+    source = Source("pillow", ("swe",), tolerance=tolerance, lag="3min", direction=direction)
+
+    got, _ = align_sources(base, {"pillow": other}, [source])
+    shifted = other.assign(time=other["time"] + pd.Timedelta("3min"))
+    expected = pd.merge_asof(base, shifted, on="time", direction=direction,
+                             tolerance=None if tolerance is None else pd.Timedelta(tolerance))
+    np.testing.assert_array_equal(got["swe"].to_numpy(), expected["swe"].to_numpy())
+
+
+def test_plan_reuse_on_appended_data():
+    rng = np.random.default_rng(7)
+    base = _frame(rng, 400, "weight")
+    other = _frame(rng, 300, "swe")
+    source = Source("crd", ("swe",), tolerance="10min")
+    _, plan = align_sources(base.iloc[:250], {"crd": other.iloc[:200]}, [source])
+    updated, _ = align_sources(base, {"crd": other}, [source], plan=plan)
+    fresh, _ = align_sources(base, {"crd": other}, [source])
+    pd.testing.assert_frame_equal(updated, fresh)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.bootstrap import OUTSIDE_METRICS, SUM_METRICS, _draw, bootstrap_metrics
+from snowscale.metrics import compute_metrics
+
+
+def _series(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    reference = np.cumsum(rng.normal(size=n)) + 50
+    tested = reference + rng.normal(1, 2, n)
+    tested[rng.choice(n, 20, replace=False)] = np.nan
+    return tested, reference
+
+
+def test_replicates_equal_metrics_of_the_resampled_series():
+    tested, reference = _series()
+    n, block, n_boot = len(tested), 12, 40
+    metrics = (*SUM_METRICS, *OUTSIDE_METRICS)
+    result = bootstrap_metrics(tested, reference, block=block, n_boot=n_boot, seed=5, metrics=metrics)
+
+    # The same blocks, drawn again from the first job's seed, and every resample evaluated directly
+    rng = np.random.default_rng(np.random.SeedSequence(5).spawn(1)[0])
+    starts, _ = _draw(rng, n, block, n_boot)
+    positions = ((starts[:, :, None] + np.arange(block)) % n).reshape(n_boot, -1)[:, :n]
+    for k, rows in enumerate(positions):
+        direct = compute_metrics(tested[rows], reference[rows])
+        for name in metrics:
+            np.testing.assert_allclose(result.replicates[name].iloc[k], getattr(direct, name),
+                                       rtol=1e-9, atol=1e-9, err_msg=f"{name} of resample {k}")
+
+
+def test_result_depends_on_the_seed_alone():
+    tested, reference = _series(n=300)
+    serial = bootstrap_metrics(tested, reference, n_boot=600, seed=1, batch=64)
+    pooled = bootstrap_metrics(tested, reference, n_boot=600, seed=1, batch=64, workers=2)
+    np.testing.assert_array_equal(serial.replicates.to_numpy(), pooled.replicates.to_numpy())
+
+
+def test_interval_brackets_the_estimate():
+    tested, reference = _series(n=2000)
+    intervals = bootstrap_metrics(tested, reference, n_boot=500, seed=2).intervals
+    assert (intervals["lower"] <= intervals["estimate"]).all()
+    assert (intervals["estimate"] <= intervals["upper"]).all()
+
+
+def test_rejects_unknown_metrics():
+    with pytest.raises(ValueError, match="Unknown metrics"):
+        bootstrap_metrics(*_series(n=50), metrics=("rmse", "kge"))
+
+
+def test_blocks_follow_the_time_grid():
+    tested, reference = _series(n=200)
+    times = pd.date_range("2024-01-01", periods=200, freq="1h")
+    keep = np.ones(200, dtype=bool)
+    keep[50:80] = False                                  # a day and more of records dropped
+    jitter = pd.to_timedelta(np.random.default_rng(6).integers(-5, 6, 200), unit="s")
+    gappy = bootstrap_metrics(tested[keep], reference[keep], block=10, n_boot=50, seed=3,
+                              times=(times + jitter)[keep])
+    # The dropped rows come back as missing pairs, so the resamples are those of the full grid
+    masked = tested.copy()
+    masked[~keep] = np.nan
+    full = bootstrap_metrics(masked, reference, block=10, n_boot=50, seed=3)
+    np.testing.assert_array_equal(gappy.replicates.to_numpy(), full.replicates.to_numpy())
+    with pytest.raises(ValueError, match="strictly increasing"):
+        bootstrap_metrics(tested, reference, times=times[::-1])
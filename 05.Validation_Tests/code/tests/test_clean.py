@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.clean import CleaningReport, clean, clean_blocks
+from snowscale.config import ChannelCleaning
+
+RULES = {
+    "weight": ChannelCleaning(valid_range=(-50, 500), spike_window="2h", spike_threshold=4.0, savgol_window=7),
+    "snow_height": ChannelCleaning(savgol_window=5, savgol_order=2, max_gap="1h"),
+}
+
+
+def _stations(seed=0, n=600):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for station in ("a", "b", "c"):
+        times = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.cumsum(rng.integers(5, 20, n)), unit="min")
+        weight = np.cumsum(rng.normal(size=n)) + rng.normal(size=n)
+        weight[rng.choice(n, 10, replace=False)] += 80             # spikes
+        weight[rng.choice(n, 5, replace=False)] = 900              # out of range
+        height = 100 + np.cumsum(rng.normal(size=n))
+        height[rng.choice(n, 10, replace=False)] = np.nan
+        frames.append(pd.DataFrame({"station": station, "time": times, "weight": weight, "snow_height": height}))
+    return pd.concat(frames).sort_values("time", kind="stable", ignore_index=True)
+
+
+@pytest.mark.parametrize("block", [50, 333, 5000])
+def test_blocks_match_whole_frame(block):
+    df = _stations()
+    whole_report, block_report = CleaningReport(), CleaningReport()
+    expected = clean(df, RULES, group_column="station", report=whole_report)
+    parts = [df.iloc[i:i + block] for i in range(0, len(df), block)]
+    got = pd.concat(list(clean_blocks(parts, RULES, group_column="station", report=block_report)))
+
+    key = ["station", "time"]
+    got = got.sort_values(key, ignore_index=True)
+    expected = expected.sort_values(key, ignore_index=True)
+    pd.testing.assert_frame_equal(got, expected)
+    assert block_report.removed == whole_report.removed
+    assert whole_report.removed["weight"]["range"] == 15
+
+
+def test_savgol_matches_scipy_on_a_continuous_stretch():
+    signal = pytest.importorskip("scipy.signal")
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({"time": pd.date_range("2024-01-01", periods=200, freq="10min"),
+                       "snow_height": np.cumsum(rng.normal(size=200))})
+    got = clean(df, {"snow_height": ChannelCleaning(savgol_window=9, savgol_order=3)})
+    expected = signal.savgol_filter(df["snow_height"].to_numpy(), 9, 3, mode="interp")
+    np.testing.assert_allclose(got["snow_height"].to_numpy(), expected, atol=1e-10)
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import json
+import math
+
+import pandas as pd
+
+import snowscale.cli
+from snowscale.config import SITES
+from snowscale.correction import ThermalFit
+from snowscale.metrics import Metrics
+from snowscale.pipeline import SiteResult
+
+
+def _strict(text):
+    def refuse(constant):
+        raise ValueError(f"{constant} is not JSON")
+    return json.loads(text, parse_constant=refuse)
+
+
+def test_json_output_has_no_bare_nan(monkeypatch, capsys):
+    # No non-zero reference leaves MAPE undefined, and a flat record leaves R² undefined
+    metrics = Metrics(n=3, r2=math.nan, pearson_r=math.nan, rmse=0.0, mae=0.0, mape=math.nan, bias=0.0,
+                      std_diff=0.0, loa_lower=0.0, loa_upper=0.0, n_outside_loa=0, pct_outside_loa=0.0)
+    result = SiteResult(SITES["tapado"], pd.DataFrame(), pd.DataFrame(), ThermalFit(math.inf, 1.0, -1, 5), 0, metrics)
+    monkeypatch.setattr(snowscale.cli, "run_site", lambda *args: result)
+    assert snowscale.cli.main(["tapado", "--json"]) == 0
+    report = _strict(capsys.readouterr().out)
+    assert report["r2"] is None and report["mape"] is None and report["thermal_slope"] is None
+    assert report["rmse"] == 0.0 and report["n"] == 3 and report["thermal_lag"] == -1
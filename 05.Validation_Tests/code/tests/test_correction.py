@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.config import DryPeriod
+from snowscale.correction import fit_thermal
+
+
+def _frame(weight, temp, height):
+    return pd.DataFrame({"time": pd.date_range("2024-01-01", periods=len(weight), freq="1h"),
+                         "weight": weight, "sensor_temp": temp, "snow_height": height})
+
+
+def test_lag_pairs_stay_within_consecutive_dry_rows():
+    rng = np.random.default_rng(0)
+    temp = rng.normal(0, 5, 60)
+    weight = 0.5 * np.roll(temp, 2) + 1.0          # weight follows temperature two rows later
+    height = np.zeros(60)
+    height[[10, 30]] = 50                          # two wet rows split the dry record
+    fit = fit_thermal(_frame(weight, temp, height), DryPeriod(first_samples=None))
+    assert fit.lag == 2
+    # Each of the three stretches loses its first two rows to the lag
+    assert fit.n == 58 - 3 * 2
+    assert fit.slope == pytest.approx(0.5) and fit.intercept == pytest.approx(1.0)
+
+
+def test_lag_needs_min_pairs():
+    rng = np.random.default_rng(1)
+    temp = rng.normal(0, 5, 20)
+    weight = 0.3 * np.roll(temp, 3) + rng.normal(0, 0.1, 20)
+    df = _frame(weight, temp, np.zeros(20))
+    rule = DryPeriod(first_samples=7)
+    # Seven dry rows leave four pairs at lag 3: too few for the default, enough for a lower bar
+    assert fit_thermal(df, rule, min_pairs=4).lag == 3
+    fit = fit_thermal(df, rule)
+    assert abs(fit.lag) <= 2 and fit.n >= 5
+    with pytest.raises(ValueError, match="No lag"):
+        fit_thermal(df, rule, lags=[3], min_pairs=5)
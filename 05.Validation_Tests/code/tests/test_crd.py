@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.config import SITES
+from snowscale.crd import (COUNT_COLUMNS, convert_crd, crd_calibrations, crd_swe, load_crd, reprocess_crd,
+                           source_calibration)
+from snowscale.io import DATA_DIR
+from snowscale.toa5 import read_toa5
+
+SOURCE = SITES["broken_river"].reference
+CRD_PATH = DATA_DIR / SOURCE.path
+PATHS = {"br": CRD_PATH, "x": CRD_PATH}
+
+
+@pytest.fixture(scope="module")
+def counts():
+    one = read_toa5(CRD_PATH, columns=list(COUNT_COLUMNS))
+    return pd.concat([one.assign(site="br"), one.assign(site="x")], ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def table():
+    return crd_calibrations(pd.DataFrame({
+        "site": ["br", "x", "x", "x"],
+        "valid_from": ["1900-01-01", "1900-01-01", "2024-01-15", "2024-02-10"],
+        "dry_start": ["2023-12-01", "2023-12-01", "2023-12-01", "2024-01-01"],
+        "dry_end": ["2023-12-31", "2023-12-31", "2023-12-31", "2024-01-10"],
+    }), SOURCE)
+
+
+def test_one_period_matches_crd_swe(counts):
+    one = counts[counts["site"] == "br"]
+    expected = crd_swe(one, SOURCE)
+    got = convert_crd(one, source_calibration(SOURCE, "br"), SOURCE.smooth_window)
+    np.testing.assert_array_equal(got["time"].to_numpy(), expected["time"].to_numpy())
+    np.testing.assert_array_equal(got["reference"].to_numpy(), expected["reference"].to_numpy())
+
+
+@pytest.mark.parametrize("column, row, value", [
+    ("af", 2, 1750.0),                                  # a changed parameter
+    ("ground_max", 1, 39000.0),                         # a changed count range
+    ("valid_from", 3, pd.Timestamp("2024-02-20")),      # a moved period boundary
+    (None, 3, None),                                    # a removed period
+])
+def test_reprocess_matches_full_conversion(counts, table, column, row, value):
+    new = table.drop(columns="valid_to")
+    if column is None:
+        new = new.drop(index=row)
+    else:
+        new.loc[row, column] = value
+    previous = convert_crd(counts, table)
+    updated = reprocess_crd(previous, table, new, PATHS)
+    full = convert_crd(counts, new)
+    assert updated[["site", "time"]].equals(full[["site", "time"]])
+    np.testing.assert_allclose(updated["reference"], full["reference"], rtol=0, atol=1e-9)
+    # The untouched site is kept as it was
+    br = previous["site"] == "br"
+    assert updated.loc[updated["site"] == "br", "reference"].tolist() == previous.loc[br, "reference"].tolist()
+
+
+def test_unknown_site_raises(counts, table):
+    with pytest.raises(ValueError, match="No calibration for site"):
+        convert_crd(counts.assign(site="nowhere"), table)
+
+
+def test_load_crd_picks_its_site_of_a_shared_table(tmp_path, table):
+    shared = table.drop(columns="valid_to").assign(af=[SOURCE.af, 1.0, 1.0, 1.0])
+    shared.to_csv(tmp_path / "crd_calibrations.csv", index=False)
+    (tmp_path / SOURCE.path).symlink_to(CRD_PATH)
+    source = dataclasses.replace(SOURCE, calibrations="crd_calibrations.csv")
+
+    with pytest.raises(ValueError, match="set CRDSource.site"):
+        load_crd(source, tmp_path, cache_dir=None)
+    with pytest.raises(ValueError, match="no calibration for site"):
+        load_crd(dataclasses.replace(source, site="elsewhere"), tmp_path, cache_dir=None)
+    got = load_crd(dataclasses.replace(source, site="br"), tmp_path, cache_dir=None)
+    expected = load_crd(SOURCE, DATA_DIR, cache_dir=None)
+    np.testing.assert_array_equal(got["reference"].to_numpy(), expected["reference"].to_numpy())
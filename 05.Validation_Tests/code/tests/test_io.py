@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import dataclasses
+
+import pandas as pd
+
+import snowscale.catalog
+from snowscale.config import SITES
+from snowscale.io import load_site
+from snowscale.telemetry import iot_index
+
+
+def test_telemetry_index_is_cached(tmp_path, monkeypatch):
+    config = SITES["broken_river"]
+    assert config.reader == "iot" and config.period is not None
+    calls = []
+
+    def counting_index(*args, **kwargs):
+        calls.append(args)
+        return iot_index(*args, **kwargs)
+
+    monkeypatch.setattr(snowscale.catalog, "iot_index", counting_index)
+    first = load_site(config, cache_dir=tmp_path)
+    assert len(calls) == 1
+    # Another period of the same file misses the frame cache but reuses the block index
+    other = dataclasses.replace(config, period=("2023-08-01", "2023-09-30"))
+    second = load_site(other, cache_dir=tmp_path)
+    assert len(calls) == 1
+    assert second["time"].between(*map(pd.Timestamp, other.period)).all()
+    assert len(second) < len(first)
+
+
+def test_period_read_matches_full_read(tmp_path):
+    config = SITES["broken_river"]
+    whole = load_site(dataclasses.replace(config, period=None), cache_dir=None)
+    start, end = map(pd.Timestamp, config.period)
+    expected = whole[(whole["time"] >= start) & (whole["time"] <= end)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(load_site(config, cache_dir=tmp_path), expected)
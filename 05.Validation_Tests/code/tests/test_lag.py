@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import numpy as np
+
+from snowscale.lag import best_lag, lag_correlation
+
+
+def _loop_correlation(x, y, lags, min_overlap=2):
+    """The per-lag loop that ``lag_correlation`` replaced."""
+    n, out = len(x), []
+    for lag in lags:
+        a, b = (x[:n - lag], y[lag:]) if lag >= 0 else (x[-lag:], y[:n + lag])
+        ok = np.isfinite(a) & np.isfinite(b)
+        if ok.sum() < min_overlap or np.std(a[ok]) == 0 or np.std(b[ok]) == 0:
+            out.append(np.nan)
+        else:
+            out.append(np.corrcoef(a[ok], b[ok])[0, 1])
+    return np.array(out)
+
+
+def test_matches_loop():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=2000) * 100
+    y = np.roll(x, 7) + rng.normal(size=2000) * 10
+    x[100:140] = np.nan
+    lags = np.arange(-60, 60)
+    np.testing.assert_allclose(lag_correlation(x, y, lags), _loop_correlation(x, y, lags), atol=1e-12)
+    assert best_lag(x, y, lags) == 7
+
+
+def test_no_lag_fits_the_series():
+    assert np.isnan(lag_correlation([1.0, 2, 3], [1.0, 3, 2], [5])).all()
+    assert best_lag([1.0, 2, 3], [1.0, 3, 2], [5, -4]) == 0
+
+
+def test_degenerate_lag_does_not_depend_on_other_lags():
+    rng = np.random.default_rng(1)
+    x = np.r_[np.full(20, 5.0), rng.normal(size=1000) * 1e4]   # constant where lag 1000 overlaps y
+    y = rng.normal(size=1020)
+    alone = lag_correlation(x, y, [1000])
+    with_others = lag_correlation(x, y, [1000, 0, -3])
+    assert np.isnan(alone[0]) and np.isnan(with_others[0])
+    np.testing.assert_allclose(with_others[1:], _loop_correlation(x, y, [0, -3]), atol=1e-12)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from snowscale.config import DriftAlert
+from snowscale.metrics import compute_metrics
+from snowscale.monitor import AgreementMonitor
+
+
+def _stream(pairs, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2024-01-01", periods=n, freq="1h")
+    frames = [pd.DataFrame({"pair": [pair] * n, "time": times,
+                            "reference": rng.uniform(0, 100, n)}) for pair in pairs]
+    df = pd.concat(frames, ignore_index=True).sort_values("time", kind="stable", ignore_index=True)
+    df["tested"] = df["reference"] + rng.normal(2, 3, len(df))
+    return df
+
+
+def test_window_metrics_match_compute_metrics():
+    df = _stream(["a"], n=400)
+    monitor = AgreementMonitor(windows=("7D",))
+    monitor.update_frame(df)
+    recent = df[df["time"] > df["time"].iloc[-1] - pd.Timedelta("7D")]
+    expected = compute_metrics(recent["tested"], recent["reference"])
+    got = monitor.metrics().loc[("a", "7D")]
+    assert got["n"] == expected.n
+    np.testing.assert_allclose([got["rmse"], got["bias"]], [expected.rmse, expected.bias])
+
+
+def test_tuple_pairs(tmp_path):
+    pairs = [("scale_141", "pillow"), ("scale_142", "pillow")]
+    monitor = AgreementMonitor(alerts=[DriftAlert("abs_bias", 1.0)])
+    monitor.update_frame(_stream(pairs))
+    table = monitor.metrics()
+    assert table.index.get_level_values("pair").unique().tolist() == pairs
+    assert len(table) == 2 * len(monitor.windows)
+
+    path = tmp_path / "monitor.json"
+    monitor.save(path)
+    restored = AgreementMonitor.load(path)
+    assert restored.pairs == pairs
+    assert restored.active_alerts() == monitor.active_alerts()
+    pd.testing.assert_frame_equal(restored.metrics(), table)
+    restored.update(pairs[0], "2024-02-01", 10.0, 9.0)
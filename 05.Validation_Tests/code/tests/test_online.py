@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.config import SITES, DryDetection, DryPeriod
+from snowscale.correction import apply_thermal, fit_thermal
+from snowscale.io import load_site
+from snowscale.online import OnlineThermalCorrector
+
+
+def _frame(weight, temp, height):
+    return pd.DataFrame({"time": pd.date_range("2024-01-01", periods=len(weight), freq="1h"),
+                         "weight": weight, "sensor_temp": temp, "snow_height": height})
+
+
+def _stream(corrector, df):
+    """Corrected weights on ``df``'s rows, and the row after which the fit was frozen."""
+    out, frozen = [], None
+    for i, row in enumerate(df[["weight", "sensor_temp", "snow_height", "time"]].itertuples(index=False)):
+        out.append(corrector.update(*row))
+        if frozen is None and corrector.frozen:
+            frozen = i
+    # A negative lag returns each weight delay updates late
+    out = np.array(out[corrector.delay:] + [np.nan] * corrector.delay)
+    return out, frozen
+
+
+def _assert_same_fit(online, batch):
+    assert online.lag == batch.lag and online.n == batch.n
+    assert online.slope == pytest.approx(batch.slope) and online.intercept == pytest.approx(batch.intercept)
+
+
+def test_negative_lag_matches_batch_fit():
+    rng = np.random.default_rng(2)
+    temp = rng.normal(0, 5, 80)
+    weight = 0.5 * np.roll(temp, -2) + 1.0 + rng.normal(0, 0.05, 80)   # weight leads temperature by two rows
+    height = np.zeros(80)
+    height[[20, 45]] = 50
+    df = _frame(weight, temp, height)
+    batch = fit_thermal(df, DryPeriod(first_samples=None), lags=[-2])
+    corrector = OnlineThermalCorrector(lag=-2, max_samples=None)
+    out, _ = _stream(corrector, df)
+    assert corrector.delay == 2
+    _assert_same_fit(corrector.fit, batch)
+    # The last sample was corrected with the final fit, as the batch corrects every row
+    assert out[-3] == pytest.approx(apply_thermal(df, batch)[-3])
+
+
+def test_negative_lag_site_matches_batch():
+    config = SITES["tapado"]
+    df = load_site(config, cache_dir=None)
+    batch = fit_thermal(df, config.dry, config.thermal_lags, config.thermal_min_pairs)
+    assert batch.lag < 0
+    corrector = OnlineThermalCorrector.from_config(config, lag=batch.lag)
+    out, frozen = _stream(corrector, df)
+    _assert_same_fit(corrector.fit, batch)
+    # Once the fit is frozen every returned weight is the batch correction of its sample
+    done = frozen + 1 - corrector.delay
+    np.testing.assert_allclose(out[done:], apply_thermal(df, corrector.fit)[done:], equal_nan=True)
+
+
+def test_time_window_site_matches_batch():
+    # Guandacol fits on its first seven days rather than its first samples
+    config = SITES["guandacol"]
+    assert config.dry.first_days is not None and config.dry.first_samples is None
+    df = load_site(config, cache_dir=None)
+    batch = fit_thermal(df, config.dry, config.thermal_lags, config.thermal_min_pairs)
+    corrector = OnlineThermalCorrector.from_config(config, lag=batch.lag)
+    out, _ = _stream(corrector, df)
+    _assert_same_fit(corrector.fit, batch)
+    done = int(np.argmax(df["time"] >= df["time"].min() + pd.Timedelta(days=config.dry.first_days)))
+    np.testing.assert_allclose(out[done:], apply_thermal(df, corrector.fit)[done:], equal_nan=True)
+
+
+def test_start_and_end_bound_the_fit():
+    rng = np.random.default_rng(4)
+    temp = rng.normal(0, 5, 48)
+    weight = 0.5 * temp + 1.0
+    weight[:10] += 100                                 # outside the window the model does not hold
+    weight[30:] -= 100
+    df = _frame(weight, temp, np.zeros(48))
+    rule = DryPeriod(first_samples=None, start=str(df["time"][10]), end=str(df["time"][29]))
+    corrector = OnlineThermalCorrector.from_config(dataclasses.replace(SITES["tapado"], dry=rule))
+    _stream(corrector, df)
+    _assert_same_fit(corrector.fit, fit_thermal(df, rule, lags=[0]))
+    assert corrector.fit.n == 20
+    with pytest.raises(ValueError, match="sample times"):
+        corrector.update(1.0, 2.0)
+
+
+@pytest.mark.parametrize("dry", [None, DryDetection()])
+def test_from_config_needs_a_dry_period(dry):
+    config = dataclasses.replace(SITES["tapado"], dry=dry)
+    with pytest.raises(ValueError, match="online correction needs a DryPeriod"):
+        OnlineThermalCorrector.from_config(config)
+
+
+def test_checkpoint_keeps_the_delay_window(tmp_path):
+    rng = np.random.default_rng(3)
+    temp = rng.normal(0, 5, 40)
+    rows = list(zip(0.4 * np.roll(temp, -1) + 2.0, temp))
+    corrector = OnlineThermalCorrector(lag=-1, max_samples=None)
+    whole = [corrector.update(*row) for row in rows]
+
+    first = OnlineThermalCorrector(lag=-1, max_samples=None)
+    head = [first.update(*row) for row in rows[:25]]
+    first.save(tmp_path / "state.json")
+    restored = OnlineThermalCorrector.load(tmp_path / "state.json")
+    # The held-back sample survives the restart and comes out with the next update
+    np.testing.assert_array_equal(head + [restored.update(*row) for row in rows[25:]], whole)
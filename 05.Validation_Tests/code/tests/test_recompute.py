@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from snowscale.poller import iot_keys, iot_line
+from snowscale.recompute import calibration_table, recompute
+from snowscale.telemetry import read_iot
+
+
+def _table(scale_id):
+    return pd.DataFrame({"id": [scale_id], "valid_from": ["2024-01-01"],
+                         **{f"prop_{i}": [0.001 * i] for i in range(1, 5)},
+                         **{f"offset_{i}": [float(i)] for i in range(1, 5)}})
+
+
+def _raw_records(scale_id=141, n=6):
+    times = pd.date_range("2024-01-02", periods=n, freq="10min")
+    return [{"id": scale_id, "time": t, **{f"raw_{i}": 1000.0 * i + k for i in range(1, 5)}}
+            for k, t in enumerate(times)]
+
+
+def test_integer_table_ids_match_telemetry_ids(tmp_path):
+    # The GET_RAW path end to end: poller line -> read_iot (string ids) -> recompute (integer ids)
+    keys = iot_keys(["GET_RAW"])
+    path = tmp_path / "scales.csv"
+    rows = _raw_records()
+    path.write_text("".join(iot_line(row, keys[2:]) for row in rows))
+    frame = read_iot(path, keys=keys)
+    assert frame["id"].cat.categories.tolist() == ["141"]
+
+    out = recompute(frame, calibration_table(_table(141)))
+    expected = [sum(0.001 * i * row[f"raw_{i}"] + i for i in range(1, 5)) for row in rows]
+    np.testing.assert_allclose(out["weight"].to_numpy(), expected)
+
+
+def test_string_and_integer_ids_are_the_same_scale():
+    frame = pd.DataFrame(_raw_records())
+    by_int = recompute(frame, _table(141))["weight"]
+    by_str = recompute(frame.assign(id=frame["id"].astype(str)), _table(141))["weight"]
+    assert by_int.notna().all()
+    pd.testing.assert_series_equal(by_int, by_str)
+
+
+def test_scale_without_calibration_raises():
+    frame = pd.DataFrame(_raw_records(scale_id=142))
+    with pytest.raises(ValueError, match="No calibration for id 142"):
+        recompute(frame, _table(141))
+
+
+def test_time_outside_every_period_is_nan():
+    frame = pd.DataFrame(_raw_records())
+    frame.loc[0, "time"] = pd.Timestamp("2023-12-31")
+    weight = recompute(frame, _table(141))["weight"]
+    assert np.isnan(weight.iloc[0]) and weight.iloc[1:].notna().all()
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import snowscale.runner
+from snowscale.config import SITES
+from snowscale.runner import Job, run_batch
+
+
+def test_bootstrap_failure_is_recorded_in_the_row(monkeypatch):
+    def failing(*args, **kwargs):
+        raise ValueError("block must be between 1 and 3, got 10")
+
+    monkeypatch.setattr(snowscale.runner, "bootstrap_metrics", failing)
+    table = run_batch([Job("tapado", SITES["tapado"], bootstrap=100, block=10)], workers=1)
+    assert table.loc[0, "error"] == "ValueError: block must be between 1 and 3, got 10"
+
+
+def test_profile_write_failure_is_recorded_in_the_row(tmp_path, monkeypatch):
+    def failing(self, directory, prefix=""):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(snowscale.runner.Profiler, "write_profiles", failing)
+    table = run_batch([Job("tapado", SITES["tapado"])], workers=1, profile_dir=tmp_path, cprofile=("fit",))
+    assert table.loc[0, "error"] == "profile: OSError: [Errno 28] No space left on device"
+    assert table.loc[0, "rmse"] > 0                   # the run itself succeeded
+    assert (tmp_path / "stages.json").exists()
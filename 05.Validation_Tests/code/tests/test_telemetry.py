@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from snowscale.io import DATA_DIR
+from snowscale.telemetry import ParseReport, read_iot
+
+IOT_PATH = DATA_DIR / "BR_IOT.csv"
+
+
+def test_empty_read_has_the_dtypes_of_a_parsed_read():
+    parsed = read_iot(IOT_PATH, start="2023-07-01", end="2023-07-02")
+    empty = read_iot(IOT_PATH, start="2030-01-01")
+    assert len(parsed) and not len(empty)
+    assert empty.drop(columns="id").dtypes.to_dict() == parsed.drop(columns="id").dtypes.to_dict()
+    assert empty["id"].cat.categories.dtype == parsed["id"].cat.categories.dtype
+    both = pd.concat([empty, parsed], ignore_index=True)
+    assert both["time"].dtype == parsed["time"].dtype
+
+
+def test_malformed_lines_are_reported(tmp_path):
+    path = tmp_path / "iot.csv"
+    path.write_text("id,A1,dt,2024-01-01T00:00:00Z,vin,13.1,at,1.0,sh,200,sw,0.5,swt,2.0,C,1;\n"
+                    "id,A1,dt,2024-01-01T00:10:00Z,vin,13.1;\n"
+                    "id,A1,dt,not-a-time,vin,13.1,at,1.0,sh,200,sw,0.5,swt,2.0,C,1;\n")
+    report = ParseReport()
+    df = read_iot(path, report=report)
+    assert len(df) == 1 and df["time"].iloc[0] == pd.Timestamp("2024-01-01")
+    assert [line for line, _, _ in report.malformed] == [2, 3]